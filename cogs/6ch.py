@@ -8,6 +8,8 @@ import reprypt
 
 from discord.ext import commands
 
+from util import message_stage
+
 
 def rname() -> str:
     chars = ""
@@ -126,9 +128,9 @@ class SixChannel(commands.Cog):
         await self.save(self.path, self.data, 4)
         await ctx.reply("設定しました。")
 
-    @commands.Cog.listener()
+    @message_stage(guild_only=False)
     async def on_message(self, message):
-        if message.author.bot or message.content.startswith("rf!"):
+        if message.content.startswith("rf!"):
             return
 
         for name in self.data["thread"]:
@@ -5,7 +5,8 @@ from typing import TYPE_CHECKING, TypedDict, Optional, Dict
 from discord.ext import commands, tasks
 import discord
 
-from util import RT
+from util import RT, message_stage
+from util.keywords import KeywordIndex
 
 from datetime import datetime, timedelta
 from collections import defaultdict
@@ -49,6 +50,8 @@ class DataManager:
                 for row in await cursor.fetchall():
                     if row:
                         self.cog.plus_cache[row[0]][row[1]] = loads(row[2])
+        for user_id in self.cog.plus_cache:
+            self.cog.update_plus_words(user_id)
         self.cog.ready.set()
 
     async def get(self, user: discord.User) -> "UserData":
@@ -143,6 +146,7 @@ class UserData:
                     )
                 self.pluses[reason] = data
                 self.cog.plus_cache[self.user.id][reason] = data
+                self.cog.update_plus_words(self.user.id)
 
     async def delete_plus(self, data: PlusData) -> None:
         "AFKプラスを削除します。"
@@ -150,6 +154,7 @@ class UserData:
             if d == data:
                 del self.pluses[reason]
                 del self.cog.plus_cache[self.user.id][reason]
+                self.cog.update_plus_words(self.user.id)
                 async with self.pool.acquire() as conn:
                     async with conn.cursor() as cursor:
                         await cursor.execute(
@@ -170,10 +175,21 @@ class AFK(commands.Cog, DataManager):
         self.bot, self.before = bot, ""
         self.cache: Dict[int, str] = {}
         self.plus_cache: Dict[int, Dict[str, PlusData]] = defaultdict(dict)
+        self.plus_words = KeywordIndex()
         super(commands.Cog, self).__init__(self)
         self.ready = Event()
         self.process_afk_plus.start()
 
+    def update_plus_words(self, user_id: int) -> None:
+        "AFKプラスのワードフックのオートマトンを更新します。"
+        if (words := [
+            data["word"] for data in self.plus_cache.get(user_id, {}).values()
+            if "word" in data
+        ]):
+            self.plus_words.set(user_id, words)
+        else:
+            self.plus_words.discard(user_id)
+
     @commands.group(
         aliases=["留守"], extras={
             "headding": {
@@ -428,12 +444,8 @@ class AFK(commands.Cog, DataManager):
             )
         await ctx.reply(embed=embed)
 
-    @commands.Cog.listener()
+    @message_stage(prefix=False)
     async def on_message(self, message: discord.Message):
-        if (message.content.startswith(tuple(self.bot.command_prefix))
-                or not message.guild or message.author.bot):
-            return
-
         if message.author.id in self.cache:
             # もしAFKを設定していた人ならAFKを解除しておく。
             await (await self.get(message.author)).delete_afk()
@@ -451,9 +463,9 @@ class AFK(commands.Cog, DataManager):
                 )
 
         # AFKプラスのワードフックがメッセージにあるならAFKを設定する。
-        if message.author.id in self.plus_cache:
+        if (word := self.plus_words.search(message.author.id, message.content)) is not None:
             for reason, data in self.plus_cache[message.author.id].items():
-                if data.get("word", "fdjasklfdsaj;fla") in message.content:
+                if data.get("word") == word:
                     await (await self.get(message.author)).set_afk(reason)
                     await message.add_reaction(self.CHECK_EMOJI)
                     break
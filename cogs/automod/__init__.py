@@ -5,7 +5,7 @@ from typing import Callable, Coroutine, Literal, Union, Any, Dict, Tuple, List
 from discord.ext import commands
 import discord
 
-from util import RT
+from util import RT, message_stage
 
 from .modutils import process_check_message, trial_new_member, trial_invite
 from .data_manager import GuildData, DataManager
@@ -611,15 +611,13 @@ class AutoMod(commands.Cog, DataManager):
         await self.prepare_cache_guild(guild)
         await self.prepare_cache_member(member)
 
-    @commands.Cog.listener()
+    @message_stage(enabled=lambda self, message: message.guild.id in self.enabled)
     async def on_message(self, message: discord.Message):
-        if (message.guild and not message.author.bot
-                and message.guild.id in self.enabled):
-            await self.prepare_cache(message.guild, message.author)
-            process_check_message(
-                self.caches[message.guild.id][1][message.author.id],
-                self.caches[message.guild.id][0], message
-            )
+        await self.prepare_cache(message.guild, message.author)
+        process_check_message(
+            self.caches[message.guild.id][1][message.author.id],
+            self.caches[message.guild.id][0], message
+        )
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
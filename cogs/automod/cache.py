@@ -7,40 +7,62 @@ import discord
 from time import time
 
 from .modutils import join
+from . import similarity
 
 if TYPE_CHECKING:
     from .__init__ import AutoMod
 
 
 class Cache:
-    "スパム検知度等のキャッシュ兼ユーザーデータクラスです。"
+    """スパム検知度等のキャッシュ兼ユーザーデータクラスです。  
+    メンバーの数だけ作られるので`__slots__`を使い、メッセージそのものではなくフィンガープリントと時刻だけを持ちます。  
+    UserDataである`warn`が変更されると`AutoMod.dirty`に入り、次のセーブの時にそれだけがセーブされます。"""
 
-    # アノテーションをクラスにつけているものはUserDataです。
-    warn: float = 0.0
-    last_update: float
+    __slots__ = (
+        "cog", "member", "_warn", "last_update", "checked",
+        "before_fingerprints", "before_join", "suspicious"
+    )
 
     # キャッシュのタイムアウト
     TIMEOUT = 180
     # あやしいレベルのマックスで`suspicious`がこれになると1警告数が上がる。
     MAX_SUSPICIOUS = 150
 
-    def __init__(
-        self, cog: "AutoMod", member: discord.Member,
-        guild: discord.Guild, data: dict
-    ):
-        self.guild, self.member, self.cog = guild, member, cog
-        self.require_save = False
+    def __init__(self, cog: "AutoMod", member: discord.Member, data: dict):
+        self.cog, self.member = cog, member
+        # 初期状態のUserDataを書き込む。読み込んだだけのデータはセーブする必要がない。
+        self._warn: float = data.get("warn", 0.0)
+        self.last_update: float = data.get("last_update") or time()
         self.update_timeout()
-        # 初期状態のデータを書き込む。アノテーションがついている変数に書き込まれるべきです。
-        for key in data:
-            setattr(self, key, data[key])
-        self.last_update = time()
         # 以下以降スパムチェックに使うキャッシュの部分です。
-        self.before: Optional[discord.Message] = None
-        self.before_content: Optional[discord.Message] = None
+        # 前のメッセージの文字列のフィンガープリントです。似ている度の計算に使います。
+        self.before_fingerprints: Optional[List[Any]] = None
         self.before_join: Optional[float] = None
         self.suspicious = 0
 
+    @property
+    def guild(self) -> discord.Guild:
+        return self.member.guild
+
+    @property
+    def warn(self) -> float:
+        return self._warn
+
+    @warn.setter
+    def warn(self, warn: float):
+        # 警告数が書き換えられたのならセーブが必要とする。最終更新日も更新をする。
+        self._warn = warn
+        self.last_update = time()
+        self.cog.dirty.add(self)
+
+    @property
+    def require_save(self) -> bool:
+        return self in self.cog.dirty
+
+    @property
+    def timeout(self) -> float:
+        return self.checked + self.TIMEOUT
+
     def process_suspicious(self) -> bool:
         "怪しさがMAXかどうかをチェックします。もしMAXならリセットします。"
         if self.suspicious >= self.MAX_SUSPICIOUS:
@@ -50,43 +72,23 @@ class Cache:
             return True
         return False
 
-    def update_cache(self, message: discord.Message):
-        "キャッシュをアップデートします。"
+    def update_cache(self, message: discord.Message) -> Optional[List[Any]]:
+        "キャッシュをアップデートします。前のメッセージのフィンガープリントを返します。"
         self.update_timeout()
-        before = self.before
-        self.before_content = join(self.before or message)
-        self.before = message
+        before = self.before_fingerprints
+        self.before_fingerprints = similarity.fingerprints(join(message))
         return before
 
     def update_timeout(self):
         "タイムアウトを更新します。"
         self.checked = time()
-        self.timeout = self.checked + self.TIMEOUT
-
-    def keys(self) -> List[str]:
-        "このデータクラスにあるキーのリストを返します。"
-        return list(self.__annotations__.keys())
-
-    def values(self) -> List[Any]:
-        "このデータクラスにある値のリストを返します。"
-        return [getattr(self, name) for name in self.keys()]
+        # `AutoMod.active`は最後に使われた時刻の順に並んでいて、古いキャッシュの削除に使われます。
+        self.cog.active[self] = None
+        self.cog.active.move_to_end(self)
 
     def items(self) -> Dict[str, Any]:
         "このデータクラスにあるデータを辞書で返します。"
-        return {key: value for key, value in zip(self.keys(), self.values())}
-
-    def update(self, data: "Cache"):
-        "このデータクラスにあるデータを更新します。"
-        for key, value in data.items():
-            setattr(self, key, value)
-
-    def __setattr__(self, key, value):
-        if key in self.__annotations__:
-            # もしセーブデータが書き換えられたのなら更新が必要とする。最終更新日も更新をする。
-            if key != "last_update":
-                self.require_save = True
-                self.last_update = time()
-        return super().__setattr__(key, value)
+        return {"warn": self.warn, "last_update": self.last_update}
 
     def __str__(self):
         return f"<AutoModCache member={self.member} UserData={self.items()} " \
@@ -1,6 +1,8 @@
 # Free RT AutoMod - Data Manager
 
-from typing import TYPE_CHECKING, NewType, TypedDict, Literal, Union, Optional, Dict, Tuple, List
+from typing import TYPE_CHECKING, NewType, TypedDict, Union, Optional, Dict, Tuple, List, Set
+
+from collections import OrderedDict
 
 from discord.ext import tasks
 import discord
@@ -62,7 +64,7 @@ Guild = Union[int, discord.Guild]
 class DataManager(DatabaseManager):
     "セーブデータ管理用クラス"
 
-    TABLES = ("AutoModData",)
+    TABLES = ("AutoModData", "AutoModUserData")
     DEFAULTS = {
         "ban": 5, "mute": 3, "bolt": 60, "emoji": 15
     }
@@ -70,6 +72,9 @@ class DataManager(DatabaseManager):
 
     def __init__(self, cog: "AutoMod"):
         self.cog, self.pool = cog, cog.bot.mysql.pool
+        # セーブが必要なUserDataと、最後に使われた時刻の順に並んだUserDataです。
+        self.dirty: Set[Cache] = set()
+        self.active: OrderedDict[Cache, None] = OrderedDict()
         self._update_database.start()
         self.cog.bot.loop.create_task(self._prepare_table())
 
@@ -79,10 +84,48 @@ class DataManager(DatabaseManager):
                 GuildID BIGINT PRIMARY KEY NOT NULL, GuildData JSON, UserData JSON
             );"""
         )
+        # UserDataはサーバー毎のJSONではなくメンバー毎の行で保存する。
+        # 警告数のリセットで最終更新日の範囲で検索できるように、LastUpdateにインデックスを付けておく。
+        await cursor.execute(
+            f"""CREATE TABLE IF NOT EXISTS {self.TABLES[1]} (
+                GuildID BIGINT NOT NULL, UserID BIGINT NOT NULL,
+                Warn DOUBLE NOT NULL DEFAULT 0, LastUpdate DOUBLE NOT NULL,
+                PRIMARY KEY (GuildID, UserID), INDEX (LastUpdate)
+            );"""
+        )
+        # 移行に失敗してもAutoModが使えるように、有効なサーバーを先に読み込む。
         await cursor.execute(f"SELECT GuildID FROM {self.TABLES[0]};")
         for row in await cursor.fetchall():
             if row:
                 self.cog.enabled.append(row[0])
+        await self._migrate_user_data(cursor)
+
+    async def _migrate_user_data(self, cursor: Cursor) -> None:
+        # 古い形式のサーバー毎のUserDataのJSONをメンバー毎の行に移す。
+        await cursor.execute(
+            f"SELECT GuildID, UserData FROM {self.TABLES[0]} WHERE JSON_LENGTH(UserData) > 0;"
+        )
+        now = time()
+        for guild_id, user_data in await cursor.fetchall():
+            # 行を全て書き込めた時だけJSONを空にするので、失敗したサーバーは次の起動時にやり直す。
+            await cursor.connection.begin()
+            try:
+                rows = [
+                    (guild_id, int(user_id), data.get("warn", 0.0), data.get("last_update", now))
+                    for user_id, data in self.if_str_loads(user_data).items()
+                ]
+                if rows:
+                    await cursor.executemany(
+                        f"INSERT IGNORE INTO {self.TABLES[1]} VALUES (%s, %s, %s, %s);", rows
+                    )
+                await cursor.execute(
+                    f"UPDATE {self.TABLES[0]} SET UserData = %s WHERE GuildID = %s;",
+                    (r"{}", guild_id)
+                )
+                await cursor.connection.commit()
+            except Exception as e:
+                await cursor.connection.rollback()
+                self.cog.print("[migrate.failed]", f"{guild_id}: {e!r}")
 
     @tasks.loop(seconds=10)
     # @tasks.loop(seconds=30)
@@ -95,48 +138,59 @@ class DataManager(DatabaseManager):
                 self.cog.print("[save.GuildData]", guild_id)
                 await self.save_guild_data(guild_id, self.cog.caches[guild_id][0])
                 self.cog.caches[guild_id][0].require_save = False
-            for member_id in list(self.cog.caches[guild_id][1].keys()):
-                if self.cog.caches[guild_id][1][member_id].require_save:
-                    # UserDataがセーブを必要としているならセーブをする。
-                    self.cog.print("[save.UserData]", member_id)
-                    await self.save_user_data(self.cog.caches[guild_id][1][member_id])
-                    self.cog.caches[guild_id][1][member_id].require_save = False
-                if self.cog.caches[guild_id][1][member_id].timeout <= now:
-                    # もしタイムアウト(放置されている)キャッシュがあるなら消す。
-                    del self.cog.caches[guild_id][1][member_id]
-                if not self.cog.caches[guild_id][1]:
-                    # もしサーバーのキャッシュが空になったらそれもいらないので消す。
-                    del self.cog.caches[guild_id]
+        for data in list(self.dirty):
+            # UserDataは変更されたものだけをセーブする。
+            # セーブ中の変更が消えないように、セーブの前に外して失敗したら戻す。
+            self.cog.print("[save.UserData]", data.member.id)
+            self.dirty.discard(data)
+            try:
+                await self.save_user_data(data)
+            except Exception as e:
+                self.dirty.add(data)
+                self.cog.print("[save.UserData.failed]", f"{data.member.id}: {e!r}")
+        while self.active and (data := next(iter(self.active))).timeout <= now:
+            # タイムアウト(放置されている)キャッシュを古い順に消す。
+            self._remove_cache(data)
+        for guild_id in [
+            guild_id for guild_id, caches in self.cog.caches.items() if not caches[1]
+        ]:
+            # もしサーバーのキャッシュが空になったらそれもいらないので消す。
+            del self.cog.caches[guild_id]
 
         self.cog.bot.loop.create_task(self._reset_warn(now))
 
+    def _remove_cache(self, data: Cache) -> None:
+        # UserDataのキャッシュを削除する。
+        self.active.pop(data, None)
+        if (caches := self.cog.caches.get(data.guild.id)) is not None \
+                and caches[1].get(data.member.id) is data:
+            del caches[1][data.member.id]
+
     def close(self):
         "コグアンロード時に呼び出されるべき関数です。"
         self._update_database.cancel()
 
     async def _reset_warn(self, now: float, cursor: Cursor = None) -> None:
         "一日以上アップデートされていない警告数をリセットする。"
-        await cursor.execute(f"SELECT * FROM {self.TABLES[0]};")
-        for row in await cursor.fetchall():
-            if not row:
-                continue
-            data = self.get_classed(
-                row[0], *map(loads, row[1:])
-            )
-            if data is None:
-                continue
-            for data in data[1].values():
-                if not hasattr(data, "last_update"):
-                    continue
-                if (now - data.last_update >= self.WARN_RESET_TIMEOUT
-                        and data.warn > 0):
-                    self.cog.print("[warn.reset]", data.member.id)
-                    data.warn = 0
-                    await self._save_user_data(cursor, data)
-                    # もしキャッシュされているUserDataがあればそれを削除する。
-                    if (row[0] in self.cog.caches
-                            and data.member.id in self.cog.caches[row[0]][1]):
-                        del self.cog.caches[row[0]][1][data.member.id]
+        # UserDataは警告数と最終更新日だけなので、リセットは行の削除と同じです。
+        # LastUpdateのインデックスを使うので、リセットする行の数しか見ません。
+        deadline = now - self.WARN_RESET_TIMEOUT
+        await cursor.execute(
+            f"SELECT GuildID, UserID FROM {self.TABLES[1]} WHERE LastUpdate <= %s;",
+            (deadline,)
+        )
+        if not (rows := await cursor.fetchall()):
+            return
+        await cursor.execute(
+            f"DELETE FROM {self.TABLES[1]} WHERE LastUpdate <= %s;", (deadline,)
+        )
+        for guild_id, member_id in rows:
+            self.cog.print("[warn.reset]", member_id)
+            # もしキャッシュされているUserDataがあればそれを削除する。
+            if (guild_id in self.cog.caches
+                    and (data := self.cog.caches[guild_id][1].get(member_id)) is not None
+                    and data not in self.dirty):
+                self._remove_cache(data)
 
     async def toggle_automod(self, guild_id: int, cursor: Cursor = None) -> bool:
         "AutoModのOnOffを切り替えます。"
@@ -144,6 +198,9 @@ class DataManager(DatabaseManager):
             await cursor.execute(
                 f"DELETE FROM {self.TABLES[0]} WHERE GuildID = %s;", (guild_id,)
             )
+            await cursor.execute(
+                f"DELETE FROM {self.TABLES[1]} WHERE GuildID = %s;", (guild_id,)
+            )
             self.cog.enabled.remove(guild_id)
             return False
         else:
@@ -160,60 +217,38 @@ class DataManager(DatabaseManager):
             data = loads(data)
         return data
 
-    def get_classed(
-        self, guild: Guild, guild_data: Union[str, dict], user_data: Union[str, dict]
-    ) -> Optional[Tuple[GuildData, Dict[int, Cache]]]:
-        "渡されたGuildDataとUserDataの辞書をAutoModのプログラムで使える状態にします。"
-        guild_data, user_data = self.if_str_loads(guild_data), \
-            self.if_str_loads(user_data)
-        if isinstance(guild, int):
-            guild = self.cog.bot.get_guild(guild)
-        if guild is not None:
-            return HashableGuild(guild.id, guild_data), {
-                key: Cache(self.cog, guild.get_member(int(key)), guild, user_data[key])
-                for key in user_data
-            }
-
     async def _read(self, cursor, guild) -> Optional[SaveData]:
-        # セーブデータを読み込む関数です。
+        # GuildDataを読み込む関数です。UserDataはメンバー毎に`read_user`で読み込みます。
         await cursor.execute(
-            f"SELECT GuildData, UserData FROM {self.TABLES[0]} WHERE GuildID = %s;",
+            f"SELECT GuildData FROM {self.TABLES[0]} WHERE GuildID = %s;",
             getattr(guild, "id", guild)
         )
         if (row := await cursor.fetchone()):
-            return self.get_classed(guild, *map(loads, row))
+            return HashableGuild(getattr(guild, "id", guild), self.if_str_loads(row[0])), {}
         else:
-            return HashableGuild(guild.id, {}), {}
+            return HashableGuild(getattr(guild, "id", guild), {}), {}
 
     async def read(self, guild: Guild, cursor: Cursor = None) -> Optional[SaveData]:
         "セーブデータを読み込みます。"
         return await self._read(cursor, guild)
 
-    def dump_user_datas(self, datas: Dict[int, Cache]) -> str:
-        "複数のUserDataをdumpします。"
-        return dumps({
-            key: value.items() for key, value in datas.items()
-        })
-
-    def _get_save_data_query(self, mode: Literal["GuildData", "UserData"]) -> str:
-        return f"""INSERT INTO {self.TABLES[0]} VALUES (%s, %s, %s)
-        ON DUPLICATE KEY UPDATE {mode} = %s;"""
+    async def read_user(self, member: discord.Member, cursor: Cursor = None) -> Cache:
+        "メンバーのUserDataを読み込みます。"
+        await cursor.execute(
+            f"SELECT Warn, LastUpdate FROM {self.TABLES[1]} WHERE GuildID = %s AND UserID = %s;",
+            (member.guild.id, member.id)
+        )
+        return Cache(self.cog, member, {
+            "warn": row[0], "last_update": row[1]
+        } if (row := await cursor.fetchone()) else {})
 
     async def _save_user_data(self, cursor, data):
         # UserDataをセーブします。
         if data.member is not None:
-            guild_data, currents = await self._read(cursor, data.guild)
-            if data.member.id in currents:
-                currents[data.member.id].update(data)
-            else:
-                currents[data.member.id] = data
             await cursor.execute(
-                self._get_save_data_query("UserData"),
-                (
-                    data.guild.id, dumps(guild_data), (
-                        currents := self.dump_user_datas(currents)
-                    ), currents
-                )
+                f"""INSERT INTO {self.TABLES[1]} VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE Warn = VALUES(Warn), LastUpdate = VALUES(LastUpdate);""",
+                (data.guild.id, data.member.id, data.warn, data.last_update)
             )
 
     async def save_user_data(self, data: Cache, cursor: Cursor = None) -> None:
@@ -224,14 +259,10 @@ class DataManager(DatabaseManager):
         self, guild: Guild, data: GuildData, cursor: Cursor = None
     ) -> None:
         "GuildDataをセーブします。"
-        current, currents = await self._read(cursor, guild)
-        current.update(data)
         await cursor.execute(
-            self._get_save_data_query("GuildData"),
-            (
-                getattr(guild, "id", guild), (current := dumps(current)),
-                self.dump_user_datas(currents), current
-            )
+            f"""INSERT INTO {self.TABLES[0]} VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE GuildData = VALUES(GuildData);""",
+            (getattr(guild, "id", guild), dumps(data), r"{}")
         )
 
     async def prepare_cache_guild(self, guild: discord.Guild) -> None:
@@ -242,7 +273,4 @@ class DataManager(DatabaseManager):
     async def prepare_cache_member(self, member: discord.Member) -> None:
         "メンバーのキャッシュを用意します。"
         if member.id not in self.cog.caches[member.guild.id][1]:
-            _, currents = await self.read(member.guild)
-            self.cog.caches[member.guild.id][1][member.id] = currents.get(
-                member.id, Cache(self, member, member.guild, {})
-            )
+            self.cog.caches[member.guild.id][1][member.id] = await self.read_user(member)
@@ -0,0 +1,151 @@
+# Free RT AutoMod - Emojis
+
+"""絵文字を数えるための、インポート時に一度だけ作られる絵文字のトライ木です。  
+`emoji`ライブラリの絵文字の表から文字のトライ木を作り、絵文字の一文字目になる文字だけを正規表現で探して、そこからトライ木をたどります。  
+これで肌の色やZWJでつながった絵文字も一つの絵文字として、`<a:name:id>`のようなカスタム絵文字と一緒に一回の走査で数えることができます。"""
+
+from __future__ import annotations
+
+from typing import Iterator, Optional
+
+from re import compile as re_compile, escape
+
+import emoji
+
+
+CUSTOM_EMOJI = re_compile(r"<a?:\w+:\d+>")
+"カスタム絵文字の正規表現です。"
+
+
+def _load_emojis() -> list[str]:
+    # `emoji`のバージョンによって絵文字の表の名前が違う。
+    if (data := getattr(emoji, "EMOJI_DATA", None)) is None:
+        data = emoji.UNICODE_EMOJI_ENGLISH
+    return list(data)
+
+
+def _char_ranges(chars) -> str:
+    # 文字の集合を`a-z`のような範囲の正規表現にする。
+    # 範囲にしないとBMPの外にある文字が一つずつ比較されて遅くなる。
+    ranges: list[list[int]] = []
+    for code in sorted(map(ord, chars)):
+        if ranges and ranges[-1][1] + 1 == code:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return "".join(
+        escape(chr(start)) if start == end else f"{escape(chr(start))}-{escape(chr(end))}"
+        for start, end in ranges
+    )
+
+
+class EmojiMatcher:
+    "絵文字のトライ木です。一番長く一致する絵文字を探します。"
+
+    END = ""
+
+    def __init__(self, emojis: list[str]):
+        self.trie: dict = {}
+        for text in emojis:
+            node = self.trie
+            for char in text:
+                node = node.setdefault(char, {})
+            node[self.END] = True
+        self.first = re_compile(f"[{_char_ranges(self.trie)}<]")
+
+    def match(self, text: str, start: int) -> int:
+        "`start`から始まる絵文字の終わりの位置を返します。絵文字がない場合は`-1`を返します。"
+        if text[start] == "<":
+            return match.end() if (match := CUSTOM_EMOJI.match(text, start)) else -1
+        node, end = self.trie, -1
+        for index in range(start, len(text)):
+            if (node := node.get(text[index])) is None:
+                break
+            if self.END in node:
+                end = index + 1
+        return end
+
+    def finditer(self, text: str) -> Iterator[tuple[int, int]]:
+        "文字列にある絵文字の位置を順に返します。"
+        # ASCIIだけで`<`もない文字列には絵文字がない。
+        if text.isascii() and "<" not in text:
+            return
+        position = 0
+        while (candidate := self.first.search(text, position)) is not None:
+            start = candidate.start()
+            if (end := self.match(text, start)) == -1:
+                position = start + 1
+            else:
+                yield start, end
+                position = end
+
+
+matcher = EmojiMatcher(_load_emojis())
+"絵文字のトライ木です。"
+
+
+class EmojiCount:
+    "文字列にある絵文字を数えた結果です。"
+
+    __slots__ = ("unicode", "custom", "spans")
+
+    def __init__(self):
+        self.unicode = self.custom = 0
+        self.spans: list[tuple[int, int]] = []
+
+    @property
+    def total(self) -> int:
+        return self.unicode + self.custom
+
+    def __repr__(self) -> str:
+        return f"<EmojiCount unicode={self.unicode} custom={self.custom}>"
+
+
+def count_emojis(text: str) -> EmojiCount:
+    "文字列にある絵文字を数えます。`spans`には絵文字の位置が入ります。"
+    result = EmojiCount()
+    for start, end in matcher.finditer(text):
+        if text[start] == "<":
+            result.custom += 1
+        else:
+            result.unicode += 1
+        result.spans.append((start, end))
+    return result
+
+
+def find_emoji(text: str) -> Optional[str]:
+    "文字列にある最初の絵文字を返します。絵文字がない場合は`None`を返します。"
+    for start, end in matcher.finditer(text):
+        return text[start:end]
+
+
+if __name__ == "__main__":
+    # 以前の一文字ずつ`emoji.emoji_lis`を呼ぶ数え方と速度を比べます。
+    # 使い方: python cogs/automod/emojis.py
+    from time import perf_counter
+    from re import findall
+
+    def old_count(text: str) -> int:
+        return len(findall("<a?:.+:\\d+>", text)) \
+            + len([char for char in text if emoji.emoji_lis(char)])
+
+    INPUTS = {
+        "chatter": "今日の夜みんなでゲームしよう！21時からでどう？",
+        "emoji x50": "🤣" * 50,
+        "zwj x200": "👨‍👩‍👧‍👦🏳️‍🌈👍🏽" * 200,
+        "custom x100": "<:rt:123456789012345678> " * 100,
+        "mixed 2000": ("w🤣<a:party:1234> " * 200)[:2000],
+    }
+    for name, text in INPUTS.items():
+        n, start = 100, perf_counter()
+        for _ in range(n):
+            count = count_emojis(text)
+        new = (perf_counter() - start) / n
+        line = f"{name:<12} {count} new={new * 1000000:9.1f}us"
+        if hasattr(emoji, "emoji_lis"):
+            n, start = 3, perf_counter()
+            for _ in range(n):
+                old = old_count(text)
+            old_time = (perf_counter() - start) / n
+            line += f" old={old_time * 1000000:11.1f}us ({old}) x{old_time / new:.0f}"
+        print(line)
@@ -10,19 +10,16 @@ from time import time
 
 import discord
 
-from difflib import SequenceMatcher
-from emoji import emoji_lis
+from util.topic_index import topics
+
+from . import similarity
+from .emojis import count_emojis
 
 if TYPE_CHECKING:
     from .data_manager import GuildData
     from .cache import Cache
 
 
-def similar(before: str, after: str) -> float:
-    "文章が似ているかチェックします。"
-    return SequenceMatcher(None, before, after).ratio() * 100
-
-
 def join(message: discord.Message) -> list[str]:
     "渡されたメッセージにある文字列を全て合体させます。"
     contents = [message.content or ""]
@@ -38,8 +35,7 @@ def join(message: discord.Message) -> list[str]:
 
 def emoji_count(text: str) -> int:
     "渡された文字列にある絵文字の数を数えます。"
-    return len(findall("<a?:.+:\\d+>", text)) \
-        + len([char for char in text if emoji_lis(char)])
+    return count_emojis(text).total
 
 
 async def log(
@@ -47,16 +43,15 @@ async def log(
     reason: str, subject: str, error: bool = False
 ) -> discord.Message:
     "ログを流します。"
-    for channel in cache.guild.text_channels:
-        if channel.topic and "rt>automod" in channel.topic:
-            return await channel.send(
-                f"<t:{int(time())}>", embed=discord.Embed(
-                    title="AutoMod",
-                    description=f"{cache.member.mention}を{reason}のため{subject}しました。"
-                                (f"\nですが権限がないので{subject}することができませんでした。" if error else ""),
-                    color=cache.cog.COLORS["error" if error else "warn"]
-                )
+    if (channel := topics.find(cache.guild, "rt>automod")) is not None:
+        return await channel.send(
+            f"<t:{int(time())}>", embed=discord.Embed(
+                title="AutoMod",
+                description=f"{cache.member.mention}を{reason}のため{subject}しました。"
+                            + (f"\nですが権限がないので{subject}することができませんでした。" if error else ""),
+                color=cache.cog.COLORS["error" if error else "warn"]
             )
+        )
 
 
 def get(cache: "Cache", data: "GuildData", key: str) -> Any:
@@ -102,16 +97,12 @@ def process_check_message(
         return
 
     # もし0.3秒以内に投稿されたメッセージなら問答無用でスパム認定とする。
-    if self.before is not None and time() - self.checked <= 0.3:
+    if self.before_fingerprints is not None and time() - self.checked <= 0.3:
         self.suspicious += 50
-    elif self.update_cache(message) is not None:
+    elif (before := self.update_cache(message)) is not None:
         # スパム判定をする。
         # 以前送られたメッセージと似ているかをチェックし似ている度を怪しさにカウントします。
-        self.suspicious += sum(
-            similar(*contents) for contents in zip(
-                self.before_content, join(message)
-            )
-        )
+        self.suspicious += similarity.similar(before, self.before_fingerprints)
     if self.process_suspicious():
         self.cog.bot.loop.create_task(trial_message(self, data, message))
     # 絵文字カウントをチェックします。
@@ -0,0 +1,188 @@
+# Free RT AutoMod - Similarity
+
+"""スパム検知で使う文章の似ている度の計算です。  
+`difflib.SequenceMatcher`は文章の長さの二乗の時間がかかるので、メッセージ毎に呼ぶには重すぎます。  
+ここでは文章を一度だけ文字のn-gramの集まり(フィンガープリント)にして`Cache`に保存し、  
+次のメッセージのフィンガープリントとのDice係数を似ている度とします。これは文章の長さに比例した時間で終わります。  
+計算方法は`SCORERS`にあるものから`set_scorer`で切り替えることができます。"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from abc import ABC, abstractmethod
+from collections import Counter
+from array import array
+from difflib import SequenceMatcher
+
+
+class Scorer(ABC):
+    "似ている度を計算するクラスの基底クラスです。"
+
+    name = ""
+
+    @abstractmethod
+    def fingerprint(self, text: str) -> Any:
+        "文章を`score`に渡すフィンガープリントにします。"
+
+    @abstractmethod
+    def score(self, before: Any, after: Any) -> float:
+        "二つのフィンガープリントの似ている度を0から100で返します。"
+
+
+class DifflibScorer(Scorer):
+    "以前から使われていた`difflib.SequenceMatcher`を使う計算方法です。比較用に残しています。"
+
+    name = "difflib"
+
+    def fingerprint(self, text: str) -> str:
+        return text
+
+    def score(self, before: str, after: str) -> float:
+        return SequenceMatcher(None, before, after).ratio() * 100
+
+
+class Shingles:
+    """文章の文字のn-gramの数え上げです。  
+    メンバー毎に`Cache`に保存されるので、辞書ではなくn-gramのハッシュと数の配列で持ちます。"""
+
+    __slots__ = ("hashes", "counts", "total")
+
+    def __init__(self, grams: Counter, total: int):
+        self.hashes = array("q", map(hash, grams))
+        self.counts = array("H", grams.values())
+        self.total = total
+
+
+class ShingleScorer(Scorer):
+    """文字のn-gram(shingle)のDice係数を使う計算方法です。
+    `SequenceMatcher.ratio`と同じく、一致した量の二倍を両方の量の和で割ったものです。  
+    長すぎる文章は`max_length`文字までを使います。"""
+
+    name = "shingle"
+
+    def __init__(self, size: int = 2, max_length: int = 2000):
+        self.size, self.max_length = size, max_length
+
+    def fingerprint(self, text: str) -> Shingles:
+        text = text[:self.max_length]
+        if len(text) < self.size:
+            # 短すぎる文章は文章そのものを一つのn-gramとする。
+            return Shingles(Counter((text,)), 1)
+        grams = Counter(
+            text[i:i + self.size] for i in range(len(text) - self.size + 1)
+        )
+        return Shingles(grams, len(text) - self.size + 1)
+
+    def score(self, before: Shingles, after: Shingles) -> float:
+        if len(before.hashes) > len(after.hashes):
+            before, after = after, before
+        grams = dict(zip(after.hashes, after.counts))
+        matched = sum(
+            min(count, grams[gram]) for gram, count in zip(before.hashes, before.counts)
+            if gram in grams
+        )
+        return matched * 200 / (before.total + after.total)
+
+
+SCORERS = {scorer.name: scorer for scorer in (ShingleScorer, DifflibScorer)}
+"使うことのできる計算方法です。"
+scorer: Scorer = ShingleScorer()
+"現在使われている計算方法です。"
+
+
+def set_scorer(name: str, **kwargs) -> Scorer:
+    """使う計算方法を切り替えます。  
+    既に`Cache`に保存されているフィンガープリントは使えなくなるので、キャッシュを消してから切り替えてください。"""
+    global scorer
+    scorer = SCORERS[name](**kwargs)
+    return scorer
+
+
+def fingerprints(contents: list[str]) -> list[Any]:
+    "`modutils.join`で取り出した文字列を全てフィンガープリントにします。"
+    return [scorer.fingerprint(content) for content in contents]
+
+
+def similar(before: list[Any], after: list[Any]) -> float:
+    "フィンガープリントのリストを比べて似ている度の合計を返します。"
+    return sum(scorer.score(*pair) for pair in zip(before, after))
+
+
+if __name__ == "__main__":
+    # 以前の`difflib`の計算方法とスパム検知の結果が同じになるかと、速度を比べます。
+    # `Cache`と同じように似ている度を怪しさに足していき、150を超えた回数を警告数として数えます。
+    # 使い方: python cogs/automod/similarity.py
+    from time import perf_counter
+
+    MAX_SUSPICIOUS = 150
+    SPAM = {
+        "copy": ["@everyone 無料でNitroがもらえます！ https://dlscord-gift.example/nitro"] * 12,
+        "counter": [f"荒らし共栄圏参上 {i}回目 荒らし共栄圏参上" for i in range(12)],
+        "raid": [
+            "このサーバーは乗っ取られました " * 8 + str(i) for i in range(12)
+        ],
+        "emoji": ["🤣🤣🤣🤣🤣🤣🤣🤣🤣🤣🤣🤣 www"] * 6 + ["🤣🤣🤣🤣🤣🤣🤣🤣🤣🤣🤣 www"] * 6,
+        "en": [
+            "FREE NITRO!!! claim now at https://steamcommunity.example/gift?id="
+            + str(i) for i in range(12)
+        ],
+        "long": ["あ" * 1500 + "い" * i for i in range(8)],
+        "attachment": [""] * 10
+    }
+    CHATTER = {
+        "ja": [
+            "おはようございます", "今日は雨ですね", "傘忘れた...",
+            "コンビニで買えばいいじゃん", "それな", "昨日のアプデ見た？",
+            "見た見た、新しいマップいいよね", "夜みんなでやろう", "何時から？",
+            "21時くらいでどう", "了解", "じゃあまたあとで"
+        ],
+        "en": [
+            "hey everyone", "anyone up for a game tonight?", "sure, what time",
+            "around 9pm EST", "works for me", "can someone help me with the bot setup",
+            "which command are you using", "rf!help automod", "thanks that worked",
+            "np", "lol", "gg"
+        ],
+        "dev": [
+            "this PR breaks the build on windows", "which test fails?",
+            "test_cacher, something about the event loop", "try running it with -p no:asyncio",
+            "same error", "can you paste the traceback", "ok one sec",
+            "nvm it was my venv", "nice", "merging then"
+        ]
+    }
+
+    def simulate(engine: Scorer, messages: list[str]) -> tuple[int, list[float]]:
+        warn, suspicious, before, scores = 0, 0.0, None, []
+        for message in messages:
+            after = [engine.fingerprint(message)]
+            if before is not None:
+                scores.append(score := sum(map(engine.score, before, after)))
+                suspicious += score
+                if suspicious >= MAX_SUSPICIOUS:
+                    suspicious, warn = 0, warn + 1
+            before = after
+        return warn, scores
+
+    old, new = DifflibScorer(), ShingleScorer()
+    differences = []
+    print(f"{'corpus':<20}{'difflib':>8}{'shingle':>8}")
+    for kind, corpus in (("spam", SPAM), ("chatter", CHATTER)):
+        for name, messages in corpus.items():
+            (old_warn, old_scores), (new_warn, new_scores) = \
+                simulate(old, messages), simulate(new, messages)
+            differences.extend(abs(a - b) for a, b in zip(old_scores, new_scores))
+            print(f"{kind + '.' + name:<20}{old_warn:>8}{new_warn:>8}")
+    print(f"mean |difflib - shingle| per message: {sum(differences) / len(differences):.1f}")
+
+    for length in (50, 500, 2000):
+        before, after = "あいうえお" * (length // 5), "あいうえお" * (length // 5 - 1) + "かきくけこ"
+        for engine in (old, new):
+            # 前のメッセージのフィンガープリントは`Cache`にあるので、計算するのは新しいメッセージの分だけです。
+            n, cached = 200, engine.fingerprint(before)
+            start = perf_counter()
+            for _ in range(n):
+                engine.score(cached, engine.fingerprint(after))
+            print(
+                f"{engine.name:<8}len={length:<5}"
+                f"{(perf_counter() - start) / n * 1000000:10.1f}us/message"
+            )
@@ -13,10 +13,10 @@ import discord
 from aiomysql import Pool, Cursor
 from ujson import loads, dumps
 
-from util import DatabaseManager
+from util import DatabaseManager, message_stage
 from util import RT
 
-from .automod.modutils import emoji_count
+from .automod.emojis import find_emoji
 
 
 class DataManager(DatabaseManager):
@@ -291,27 +291,28 @@ class Blocker(commands.Cog, DataManager):
             ):
                 yield mode
 
-    @commands.Cog.listener()
+    @message_stage(
+        bots=True, self_messages=True, members_only=True,
+        enabled=lambda self, message: message.guild.id in self.cache
+    )
     async def on_message(self, message: discord.Message):
-        if (message.guild and isinstance(message.author, discord.Member)
-                and message.guild.id in self.cache):
-            # ブロックをするかをチェックする。
-            for mode in self.is_should_check(message.author):
-                content = ""
-                if mode == "emoji" and emoji_count(message.content):
-                    # 絵文字のブロックをする。
-                    content = "絵文字送信ブロック対象のため"
-                elif mode == "stamp" and message.stickers:
-                    # スタンプのブロックをする。。
-                    content = "スタンプ送信ブロック対象のため"
-                if content:
-                    # メッセージを削除する。
-                    await message.delete()
-                    await message.author.send(
-                        f"あなたの{message.guild.name}で送った{'以下の' if message.content else ''}メッセージはあなたが{content}削除されました。"
-                        + (f"\n>>> {message.content}" if message.content else '')
-                    )
-                    break
+        # ブロックをするかをチェックする。
+        for mode in self.is_should_check(message.author):
+            content = ""
+            if mode == "emoji" and find_emoji(message.content) is not None:
+                # 絵文字のブロックをする。
+                content = "絵文字送信ブロック対象のため"
+            elif mode == "stamp" and message.stickers:
+                # スタンプのブロックをする。。
+                content = "スタンプ送信ブロック対象のため"
+            if content:
+                # メッセージを削除する。
+                await message.delete()
+                await message.author.send(
+                    f"あなたの{message.guild.name}で送った{'以下の' if message.content else ''}メッセージはあなたが{content}削除されました。"
+                    + (f"\n>>> {message.content}" if message.content else '')
+                )
+                break
 
     @commands.Cog.listener()
     async def on_full_reaction_add(self, payload: discord.RawReactionActionEvent):
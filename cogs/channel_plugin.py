@@ -3,7 +3,8 @@
 from discord.ext import commands
 import discord
 
-from util import RT
+from util import RT, message_stage
+from util.topic_index import topics
 
 from inspect import cleandoc
 from asyncio import sleep
@@ -94,16 +95,14 @@ class ChannelPluginGeneral(commands.Cog):
                     HELPS[command_name][lang][1]
                 )
 
-    @commands.Cog.listener()
+    @message_stage(
+        bots=True, self_messages=True, webhooks=False, threads=False,
+        topic=("rf>asp", "rf>ce", "rf>embed", "rf>kick")
+    )
     async def on_message(self, message: discord.Message):
-        if isinstance(message.channel, discord.Thread):
-            return
-        if not message.guild or message.author.discriminator == "0000":
-            return
-
         if message.channel.topic:
-            for cmd in message.channel.topic.splitlines():
-                if cmd.startswith("rf>asp"):
+            for cmd, argument in topics.directives(message.channel).items():
+                if cmd == "rf>asp":
                     # Auto Spoiler
                     content = message.clean_content
 
@@ -116,7 +115,7 @@ class ChannelPluginGeneral(commands.Cog):
                     for url in findall(self.URL_PATTERN, content):
                         content = content.replace(url, f"||{url}||", 1)
                     # もしスポイラーワードが設定されているならそれもスポイラーにする。
-                    for word in cmd.split()[1:]:
+                    for word in argument.split():
                         content = content.replace(word, f"||{word}||")
                     # Embedに画像が設定されているなら外してスポイラーを付けた画像URLをフィールドに入れて追加する。
                     e = False
@@ -145,7 +144,7 @@ class ChannelPluginGeneral(commands.Cog):
                             await message.delete()
                         except (discord.NotFound, discord.Forbidden):
                             pass
-                elif cmd.startswith("rf>ce"):
+                elif cmd == "rf>ce":
                     # Can't Edit
                     await message.channel.webhook_send(
                         message.clean_content, files=[
@@ -155,16 +154,16 @@ class ChannelPluginGeneral(commands.Cog):
                         avatar_url=message.author.avatar.url
                     )
                     await message.delete()
-                elif cmd.startswith("rf>embed"):
+                elif cmd == "rf>embed":
                     # Auto Embed
                     await self.bot.cogs["ServerTool"].embed(
                         await self.bot.get_context(message), "null",
                         content=message.content
                     )
                     await message.delete()
-                elif cmd.startswith("rf>kick "):
+                elif cmd == "rf>kick":
                     # Kick
-                    for word in cmd.split()[1:]:
+                    for word in argument.split():
                         if word not in message.content:
                             try:
                                 await message.author.kick(
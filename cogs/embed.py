@@ -8,7 +8,7 @@ from discord.ext import commands
 import discord
 
 from util.markdowns import create_embed
-from util import RT
+from util import RT, get_webhook
 
 
 class Embed(commands.Cog):
@@ -94,9 +94,8 @@ class Embed(commands.Cog):
                 if message.author.id == self.bot.user.id:
                     send = message.edit
                 else:
-                    wb = discord.utils.get(
-                        await message.channel.webhooks(),
-                        name="R2-Tool" if self.bot.test else "RT-Tool"
+                    wb = await get_webhook(
+                        message.channel, "R2-Tool" if self.bot.test else "RT-Tool"
                     )
                     return await wb.edit_message(
                         message.id, **kwargs
@@ -1,21 +1,26 @@
 # Free RT - Message Link Expander
 
-from typing import Literal
+from typing import Literal, Optional
 
 from discord.ext import commands
 import discord
 
-from util import RT
+from util import RT, message_stage, memoize
 from util.mysql_manager import DatabaseManager
 
+from asyncio import gather
 from re import findall
 
 
 class DataManager(DatabaseManager):
+    # 設定は起動時に全て読み込み、メッセージが来た時は`enabled`でメモリにあるものだけを見ます。
 
     DB = "ExpandMessage"
     IGNORE_DB = "ExpandIgnore"
 
+    guild_settings: dict[int, bool]
+    channel_settings: dict[int, bool]
+
     def __init__(self, db):
         self.db = db
 
@@ -28,39 +33,25 @@ class DataManager(DatabaseManager):
         await cursor.create_table(
             self.IGNORE_DB, {"ChannelID": "BIGINT", "OnOff": "TINYINT"}
         )
-
-    async def read(self, cursor, guild_id: int, channel_id: int) -> tuple:
-        target = {"GuildID": guild_id}
-        ignore_target = {"ChannelID": channel_id}
-        if await cursor.exists(self.DB, target):
-            if (guild := await cursor.get_data(self.DB, target))[1]:
-                if await cursor.exists(self.IGNORE_DB, ignore_target):
-                    if (row := await cursor.get_data(self.IGNORE_DB, ignore_target)):
-                        return bool(row[1])
-                    return False
-                else:
-                    return guild[1]
-            return False
-        else:
-            return True
+        self.guild_settings.update({
+            row[0]: bool(row[1]) async for row in cursor.get_datas(self.DB, {}) if row
+        })
+        self.channel_settings.update({
+            row[0]: bool(row[1]) async for row in cursor.get_datas(self.IGNORE_DB, {}) if row
+        })
+
+    def enabled(self, guild_id: int, channel_id: int) -> bool:
+        "メッセージリンクを展開するかどうかを返します。設定がない場合は展開します。"
+        return self.guild_settings.get(guild_id, True) \
+            and self.channel_settings.get(channel_id, True)
 
     async def write(self, cursor, guild_id: int, onoff: bool) -> None:
-        target = {"GuildID": guild_id}
-        change = {"OnOff": int(onoff)}
-        if await cursor.exists(self.DB, target):
-            await cursor.update_data(self.DB, change, target)
-        else:
-            target.update(change)
-            await cursor.insert_data(self.DB, target)
+        await cursor.upsert(self.DB, {"OnOff": int(onoff)}, {"GuildID": guild_id})
+        self.guild_settings[guild_id] = onoff
 
     async def set_ignore(self, cursor, channel_id: int, onoff: bool) -> None:
-        target = {"ChannelID": channel_id}
-        change = {"OnOff": int(onoff)}
-        if await cursor.exists(self.IGNORE_DB, target):
-            await cursor.update_data(self.IGNORE_DB, change, target)
-        else:
-            target.update(change)
-            await cursor.insert_data(self.IGNORE_DB, target)
+        await cursor.upsert(self.IGNORE_DB, {"OnOff": int(onoff)}, {"ChannelID": channel_id})
+        self.channel_settings[channel_id] = onoff
 
 
 class Expander(commands.Cog, DataManager):
@@ -72,6 +63,8 @@ class Expander(commands.Cog, DataManager):
 
     def __init__(self, bot: RT):
         self.bot = bot
+        self.guild_settings, self.channel_settings = {}, {}
+        self.loaded = False
         self.bot.loop.create_task(self.on_ready())
 
     async def on_ready(self):
@@ -80,6 +73,7 @@ class Expander(commands.Cog, DataManager):
             self.bot.mysql
         )
         await self.init_table()
+        self.loaded = True
 
     @commands.command(
         extras={
@@ -133,54 +127,86 @@ class Expander(commands.Cog, DataManager):
             await self.set_ignore(ctx.channel.id, onoff)
         await ctx.reply("Ok")
 
+    @memoize(120, max_size=1000, key=lambda self, channel, message_id: message_id)
+    async def fetch_message(
+        self, channel: discord.abc.Messageable, message_id: int
+    ) -> discord.Message:
+        "メッセージを取得します。取得したメッセージは編集か削除されるまでの二分間キャッシュされます。"
+        return await channel.fetch_message(message_id)
+
+    def get_message_channel(
+        self, message: discord.Message, guild_id: str, channel_id: str
+    ) -> Optional[discord.abc.Messageable]:
+        "メッセージリンクのチャンネルを取得します。"
+        if channel_id == str(message.channel.id):
+            return message.channel
+        if guild_id == str(message.guild.id):
+            return message.guild.get_channel(int(channel_id))
+        return self.bot.get_channel(int(channel_id))
+
+    async def resolve(
+        self, channel: discord.abc.Messageable, message_id: int
+    ) -> discord.Message:
+        "メッセージを取得します。ゲートウェイのメッセージのキャッシュにあるものはそれを使います。"
+        # ゲートウェイのキャッシュにあるメッセージは編集も反映されているのでそのまま使える。
+        if (message := self.bot._connection._get_message(message_id)) is not None:
+            return message
+        return await self.fetch_message(channel, message_id)
+
     @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if not message.guild or message.author.bot:
-            return
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        self.fetch_message.invalidate(payload.message_id)
 
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.fetch_message.invalidate(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        for message_id in payload.message_ids:
+            self.fetch_message.invalidate(message_id)
+
+    @message_stage(
+        urls=True, enabled=lambda self, message: self.loaded
+        and self.enabled(message.guild.id, message.channel.id)
+    )
+    async def on_message(self, message: discord.Message):
         datas = findall(self.PATTERN, message.content)
         if datas:
-            if await self.read(message.guild.id, message.channel.id):
-                embeds = []
-                for data in datas:
-                    data, channel = data[2:], None
-
-                    if data[0] == str(message.guild.id):
-                        get_channel = message.guild.get_channel
-                    elif data[1] == str(message.channel.id):
-                        channel = message.channel
-                    else:
-                        get_channel = self.bot.get_channel
-                    if channel is None:
-                        channel = get_channel(int(data[1]))
-
-                    if channel:
-                        try:
-                            fetched_message = await channel.fetch_message(int(data[2]))
-                        except discord.Forbidden:
-                            await message.add_reaction(
-                                self.bot.cogs["TTS"].EMOJIS["error"]
-                            )
-                        else:
-                            embed = discord.Embed(
-                                description=fetched_message.content,
-                                color=fetched_message.author.color
-                            ).set_author(
-                                name=fetched_message.author.display_name,
-                                icon_url=getattr(fetched_message.author.avatar, "url", "")
-                            ).set_footer(
-                                text=fetched_message.guild.name,
-                                icon_url=getattr(fetched_message.guild.icon, "url", "")
-                            )
-                            if fetched_message.attachments:
-                                embed.set_image(url=fetched_message.attachments[0].url)
-                            embeds.append(embed)
-
-                if embeds:
-                    if fetched_message.content:
-                        await self.send(message, embeds)
-                    if fetched_message.embeds:
-                        await self.send(message, fetched_message.embeds)
+            # リンクのメッセージは全て同時に取得する。
+            links = [
+                (channel, int(data[4])) for data in datas
+                if (channel := self.get_message_channel(message, data[2], data[3]))
+            ]
+            embeds = []
+            for result in await gather(*(
+                self.resolve(channel, message_id) for channel, message_id in links
+            ), return_exceptions=True):
+                if isinstance(result, discord.Forbidden):
+                    await message.add_reaction(
+                        self.bot.cogs["TTS"].EMOJIS["error"]
+                    )
+                elif isinstance(result, discord.Message):
+                    fetched_message = result
+                    embed = discord.Embed(
+                        description=fetched_message.content,
+                        color=fetched_message.author.color
+                    ).set_author(
+                        name=fetched_message.author.display_name,
+                        icon_url=getattr(fetched_message.author.avatar, "url", "")
+                    ).set_footer(
+                        text=fetched_message.guild.name,
+                        icon_url=getattr(fetched_message.guild.icon, "url", "")
+                    )
+                    if fetched_message.attachments:
+                        embed.set_image(url=fetched_message.attachments[0].url)
+                    embeds.append(embed)
+
+            if embeds:
+                if fetched_message.content:
+                    await self.send(message, embeds)
+                if fetched_message.embeds:
+                    await self.send(message, fetched_message.embeds)
 
     async def send(self, message: discord.Message, embeds: list[discord.Embed]):
         try:
@@ -10,7 +10,7 @@ import discord
 
 from util import RT
 from util.mysql_manager import DatabaseManager as OldDatabaseManager
-from util import DatabaseManager, markdowns
+from util import DatabaseManager, markdowns, message_stage
 
 from aiomysql import Pool, Cursor
 from ujson import loads, dumps
@@ -267,15 +267,14 @@ class ForcePinnedMessage(commands.Cog, DataManager):
         else:
             await ctx.reply("インターバルは五秒から三時間までしか設定できません。")
 
-    @commands.Cog.listener()
+    @message_stage(
+        bots=True, self_messages=True,
+        enabled=lambda self, message: message.channel.id in self.cache.get(message.guild.id, ())
+    )
     async def on_message(self, message: discord.Message):
-        if not message.guild or "- RT" in message.author.name or not self.bot.is_ready():
-            return
-
-        if message.channel.id not in self.remove_queue:
-            if (message.guild.id in self.cache
-                    and message.channel.id in self.cache[message.guild.id]):
-                self.queue[message.channel.id] = (message, time())
+        if ("- RT" not in message.author.name and self.bot.is_ready()
+                and message.channel.id not in self.remove_queue):
+            self.queue[message.channel.id] = (message, time())
 
     def cog_unload(self):
         self.worker.cancel()
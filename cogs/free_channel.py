@@ -5,7 +5,7 @@ from typing import Literal
 from discord.ext import commands
 import discord
 
-from util import RT
+from util import RT, message_stage
 
 from asyncio import sleep
 
@@ -237,13 +237,11 @@ The name of the created voice channel will include the ID of the person who crea
              "en": "..."}
         )
 
-    @commands.Cog.listener()
+    @message_stage(
+        bots=True, self_messages=True, content=True, topic=("RTフリーチャンネル",)
+    )
     async def on_message(self, message):
-        if (not message.guild or not hasattr(message.channel, "topic")
-                or not message.content or not message.channel.topic):
-            return
-
-        topic = message.channel.topic if message.channel.topic else ""
+        topic = message.channel.topic
         if ("RTフリーチャンネル" in topic and "作成者" not in topic
                 and message.channel.category):
             # フリーチャンネルでのユーザーへの返信の場合は
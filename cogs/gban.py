@@ -9,6 +9,7 @@ import discord
 
 from util import RT, mysql
 from util.mysql_manager import DatabaseManager
+from util.bans import bans
 from util.page import EmbedPage
 from util.ext import componesy
 
@@ -26,6 +27,10 @@ class DataManager(DatabaseManager):
         await cursor.create_table(
             "gbanOff", {"GuildID": "BIGINT"}
         )
+        # GBANでBANしたサーバーです。GBANの解除の時はここにあるサーバーだけでBANを解除する。
+        await cursor.create_table(
+            "gbanGuilds", {"UserID": "BIGINT", "GuildID": "BIGINT"}
+        )
 
     async def add_user(self, cursor, user_id: int, reason: str) -> None:
         await cursor.insert_data(
@@ -49,6 +54,23 @@ class DataManager(DatabaseManager):
         else:
             return ()
 
+    async def add_banned_guild(self, cursor, user_id: int, guild_id: int) -> None:
+        await cursor.insert_data(
+            "gbanGuilds", {"UserID": user_id, "GuildID": guild_id}
+        )
+
+    async def remove_banned_guild(self, cursor, user_id: int, guild_id: int) -> None:
+        target = {"UserID": user_id, "GuildID": guild_id}
+        if await cursor.exists("gbanGuilds", target):
+            await cursor.delete("gbanGuilds", target)
+
+    async def pop_banned_guilds(self, cursor, user_id: int) -> list:
+        target = {"UserID": user_id}
+        guild_ids = [row[1] async for row in cursor.get_datas("gbanGuilds", target) if row]
+        if guild_ids:
+            await cursor.delete("gbanGuilds", target)
+        return guild_ids
+
     async def onoff_guild(self, cursor, guild_id: int, onoff: bool) -> None:
         target = {"GuildID": guild_id}
         if (exists := await cursor.exists("gbanOff", target)) and onoff:
@@ -83,12 +105,19 @@ class GlobalBan(commands.Cog, DataManager):
             return
         if (row := await self.get(member.id)):
             await member.ban(reason=row[1])
+            await self.add_banned_guild(member.id, member.guild.id)
 
             if (channel := self.get_channel(member.guild)):
                 await channel.send(
                     f"{member.name}をBANしました。\n理由：\n{row[1]}"
                 )
 
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild: discord.Guild, user: discord.User):
+        # サーバーがGBANのBANを解除した後のBANはそのサーバーのものなので、記録を消す。
+        if self.bot.is_ready():
+            await self.remove_banned_guild(user.id, guild.id)
+
     @commands.group(extras={
         "headding": {
             "ja": "グローバルBAN機能",
@@ -222,19 +251,20 @@ class GlobalBan(commands.Cog, DataManager):
         await self.add_user(user_id, reason)
 
         for guild in self.bot.guilds:
-            if not self.get_onoff(guild.id):
-                # オフに設定してるサーバーは無視する。
+            # オフに設定してるサーバーと既にBANされているサーバーは無視する。
+            if (bans.is_banned(guild.id, user_id)
+                    or (member := guild.get_member(user_id)) is None
+                    or not await self.get_onoff(guild.id)):
                 continue
-            for member in guild.members:
-                if member.id == user_id:
-                    try:
-                        await member.ban(reason=reason)
-                        if (channel := self.get_channel(guild)):
-                            await channel.send(
-                                f"{member.name}をBANしました。\n理由：\n{reason}"
-                            )
-                    except Exception as e:
-                        print("Error on gban :", e)
+            try:
+                await member.ban(reason=reason)
+                await self.add_banned_guild(user_id, guild.id)
+                if (channel := self.get_channel(guild)):
+                    await channel.send(
+                        f"{member.name}をBANしました。\n理由：\n{reason}"
+                    )
+            except Exception as e:
+                print("Error on gban :", e)
 
         await ctx.reply("追加しました。")
 
@@ -244,17 +274,19 @@ class GlobalBan(commands.Cog, DataManager):
         await ctx.trigger_typing()
         await self.remove_user(user_id)
 
-        for guild in self.bot.guilds:
-            for member in guild.members:
-                if member.id == user_id:
-                    try:
-                        await member.unban()
-                        if (channel := self.get_channel(guild)):
-                            await channel.send(
-                                f"{member.name}のBANを解除しました。"
-                            )
-                    except Exception as e:
-                        print("Error on ungban :", e)
+        # サーバーが独自にしたBANは解除しないように、GBANでBANしたサーバーだけでBANを解除する。
+        for guild_id in await self.pop_banned_guilds(user_id):
+            if ((guild := self.bot.get_guild(guild_id)) is None
+                    or bans.is_banned(guild_id, user_id) is False):
+                continue
+            try:
+                await guild.unban(discord.Object(user_id))
+                if (channel := self.get_channel(guild)):
+                    await channel.send(
+                        f"{getattr(self.bot.get_user(user_id), 'name', user_id)}のBANを解除しました。"
+                    )
+            except Exception as e:
+                print("Error on ungban :", e)
 
         await ctx.reply("削除しました。")
 
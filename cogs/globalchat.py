@@ -5,8 +5,11 @@ from typing import TYPE_CHECKING
 from discord.ext import commands
 import discord
 
-from collections import defaultdict
 from util.mysql_manager import DatabaseManager
+from util import message_stage
+from util.topic_index import topics
+from util.bans import bans
+from util.fanout import SharedFile, fanout
 from functools import wraps
 from time import time
 
@@ -14,7 +17,69 @@ if TYPE_CHECKING:
     from util import Backend
 
 
+class GlobalChatRegistry:
+    """グローバルチャットと接続しているチャンネルの対応です。  
+    起動時にデータベースから全て読み込まれ、メッセージが来た時はこれだけを見ます。  
+    変更はデータベースに書き込んだ後にこれにも反映されます。"""
+
+    def __init__(self):
+        self.channels: dict[int, str] = {}
+        self.rooms: dict[str, dict[int, None]] = {}
+        self.extras: dict[str, dict] = {}
+
+    def load(self, rows: list) -> None:
+        "データベースの行を全て読み込みます。"
+        self.channels.clear()
+        self.rooms.clear()
+        self.extras.clear()
+        for name, channel_id, extras in rows:
+            self.add(name, channel_id, extras)
+
+    def add(self, name: str, channel_id: int, extras: dict) -> None:
+        "チャンネルをグローバルチャットに追加します。"
+        self.channels[channel_id] = name
+        self.rooms.setdefault(name, {})[channel_id] = None
+        self.extras.setdefault(name, extras)
+
+    def remove(self, name: str, channel_id: int) -> None:
+        "チャンネルをグローバルチャットから削除します。最後のチャンネルだった場合はグローバルチャットも削除します。"
+        if self.channels.get(channel_id) == name:
+            del self.channels[channel_id]
+        if name in self.rooms:
+            self.rooms[name].pop(channel_id, None)
+            if not self.rooms[name]:
+                # データベースにも行が残っていないので、同じ名前で作り直せるようにする。
+                del self.rooms[name]
+                self.extras.pop(name, None)
+
+    def delete(self, name: str) -> None:
+        "グローバルチャットを削除します。"
+        for channel_id in self.rooms.pop(name, {}):
+            if self.channels.get(channel_id) == name:
+                del self.channels[channel_id]
+        self.extras.pop(name, None)
+
+    def row(self, channel_id: int) -> tuple:
+        "チャンネルの`(名前, チャンネルID, Extras)`を取得します。グローバルチャットではない場合は`()`です。"
+        if (name := self.channels.get(channel_id)) is None:
+            return ()
+        return (name, channel_id, self.extras[name])
+
+    def rows(self, name: str) -> list[tuple]:
+        "グローバルチャットの全てのチャンネルの`(名前, チャンネルID, Extras)`を取得します。"
+        return [
+            (name, channel_id, self.extras[name])
+            for channel_id in self.rooms.get(name, ())
+        ]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.rooms
+
+
 class DataManager(DatabaseManager):
+    # 読み込みは`GlobalChatRegistry`で行い、データベースには変更を書き込むだけです。
+    registry: GlobalChatRegistry
+
     def __init__(self, db):
         self.db = db
 
@@ -25,63 +90,43 @@ class DataManager(DatabaseManager):
                 "Extras": "JSON"
             }
         )
-
-    async def load_globalchat_name(self, cursor, channel_id: int) -> list:
-        target = {"ChannelID": channel_id}
-        if await cursor.exists("globalChat", target):
-            return await cursor.get_data("globalChat", target)
-        else:
-            return ()
-
-    async def load_globalchat_channels(self, cursor, name: str) -> list:
-        target = {"Name": name}
-        if await cursor.exists("globalChat", target):
-            return [
-                data
-                async for data in cursor.get_datas(
-                    "globalChat", target
-                )
-            ]
-        else:
-            return []
+        self.registry.load([
+            data async for data in cursor.get_datas("globalChat", {}) if data
+        ])
 
     async def make_globalchat(self, cursor, name: str, channel_id: int, extras: dict) -> None:
-        target = {"Name": name, "ChannelID": channel_id, "Extras": extras}
-        if await cursor.exists("globalChat", {"Name": name}):
+        if name in self.registry:
             raise ValueError("既に追加されています。")
-        else:
-            await cursor.insert_data("globalChat", target)
+        await cursor.insert_data(
+            "globalChat", {"Name": name, "ChannelID": channel_id, "Extras": extras}
+        )
+        self.registry.add(name, channel_id, extras)
 
     async def connect_globalchat(self, cursor, name: str, channel_id: int, extras: dict) -> None:
-        target = {"Name": name, "ChannelID": channel_id}
-        if await cursor.exists("globalChat", target):
+        if self.registry.channels.get(channel_id) == name:
             raise ValueError("既に接続しています。")
-        else:
-            target["Extras"] = extras
-            await cursor.insert_data("globalChat", target)
+        await cursor.insert_data(
+            "globalChat", {"Name": name, "ChannelID": channel_id, "Extras": extras}
+        )
+        self.registry.add(name, channel_id, extras)
 
     async def disconnect_globalchat(self, cursor, name: str, channel_id: int) -> None:
-        target = {"Name": name, "ChannelID": channel_id}
-        if await cursor.exists("globalChat", target):
-            await cursor.delete("globalChat", target)
-        else:
+        if self.registry.channels.get(channel_id) != name:
             raise ValueError(
                 "そのグローバルチャットは存在していないまたはチャンネルは接続していません。"
             )
-
-    async def exists_globalchat(self, cursor, name: str) -> bool:
-        return await cursor.exists("globalChat", {"Name": name})
+        await cursor.delete("globalChat", {"Name": name, "ChannelID": channel_id})
+        self.registry.remove(name, channel_id)
 
     async def update_extras(self, cursor, name: str, extras: dict) -> None:
-        target = {"Name": name}
-        change = {"Extras": extras}
-        if await cursor.exists("globalChat", target):
-            await cursor.update("globalChat", change, target)
-        else:
+        if name not in self.registry:
             raise ValueError("グローバルチャットが存在しません。")
+        await cursor.update_data("globalChat", {"Extras": extras}, {"Name": name})
+        self.registry.extras[name] = extras
 
     async def delete_globalchat(self, cursor, name: str) -> None:
         await cursor.delete("globalChat", {"Name": name})
+        self.registry.delete(name)
 
 
 def require_guild(coro):
@@ -100,7 +145,7 @@ def require_guild(coro):
 def require_globalchat(coro):
     @wraps(coro)
     async def new_coro(self, ctx, *args, **kwargs):
-        if (row := await self.load_globalchat_name(ctx.channel.id)):
+        if (row := self.registry.row(ctx.channel.id)):
             ctx.row = row
             return await coro(self, ctx, *args, **kwargs)
         else:
@@ -115,7 +160,7 @@ class GlobalChat(commands.Cog, DataManager):
     def __init__(self, bot: "Backend"):
         self.bot = bot
         self.blocking = {}
-        self.ban_cache = defaultdict(list)
+        self.registry = GlobalChatRegistry()
         self.bot.loop.create_task(self.on_ready())
 
     async def on_ready(self):
@@ -232,12 +277,11 @@ class GlobalChat(commands.Cog, DataManager):
         Aliases
         -------
         cong"""
-        if await self.exists_globalchat(name):
-            if ctx.channel.topic and "RT-GlobalChat" in ctx.channel.topic:
+        if name in self.registry:
+            if "RT-GlobalChat" in topics.directives(ctx.channel):
                 await ctx.reply("既に接続しています。")
             else:
-                rows = await self.load_globalchat_channels(name)
-                extras = rows[0][-1]
+                extras = self.registry.extras[name]
                 try:
                     await ctx.channel.edit(topic="RT-GlobalChat")
                 except discord.Forbidden:
@@ -248,7 +292,7 @@ class GlobalChat(commands.Cog, DataManager):
                     # 入室メッセージを送信する。
                     message = ctx.message
                     message.content = f"{ctx.guild.name}がグローバルチャットに参加しました。"
-                    await self.send(message, rows[0])
+                    await self.send(message, self.registry.row(ctx.channel.id))
         else:
             await ctx.reply(
                 {"ja": "そのグローバルチャットはありません。",
@@ -273,7 +317,7 @@ class GlobalChat(commands.Cog, DataManager):
         Aliases
         -------
         dis, leave, bye"""
-        if (row := await self.load_globalchat_name(ctx.channel.id)):
+        if (row := self.registry.row(ctx.channel.id)):
             await self.disconnect_globalchat(row[0], ctx.channel.id)
             await ctx.channel.edit(topic=None)
             await ctx.reply(
@@ -295,7 +339,7 @@ class GlobalChat(commands.Cog, DataManager):
 
     async def send(self, message: discord.Message, row: list) -> None:
         # グローバルチャットにメッセージを送る。
-        rows = await self.load_globalchat_channels(row[0])
+        rows = self.registry.rows(row[0])
 
         # もし返信先があるメッセージなら返信先のEmbedを作っておく。
         if message.author.id in (888057396310716496,):
@@ -329,43 +373,31 @@ class GlobalChat(commands.Cog, DataManager):
                     .set_footer(text="添付されたスタンプ")
                 )
 
-        # 送る。
-        for _, channel_id, _ in rows:
-            if message.channel.id == channel_id:
-                continue
-            else:
-                channel = self.bot.get_channel(channel_id)
-                if channel:
-                    if channel.guild.id not in self.ban_cache:
-                        for entry in await channel.guild.bans():
-                            self.ban_cache[channel.guild.id].append(
-                                entry.user.id
-                            )
-                    if all(
-                        user_id != message.author.id
-                        for user_id in self.ban_cache[channel.guild.id]
-                    ):
-                        try:
-                            await channel.webhook_send(
-                                username=f"{message.author.name} {message.author.id}",
-                                avatar_url=getattr(message.author.avatar, "url", ""),
-                                content=message.clean_content, embeds=embeds, files=[
-                                    await attachment.to_file()
-                                    for attachment in message.attachments
-                                ]
-                            )
-                        except Exception as e:
-                            print("Error on global chat :", e)
+        # 添付ファイルは一度だけダウンロードして全ての送信先で使い回す。
+        files = await SharedFile.from_attachments(message.attachments)
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if (not message.guild or isinstance(message.channel, discord.Thread)
-                or not message.channel.topic or message.author.bot
-                or "RT-GlobalChat" not in message.channel.topic):
-            return
+        async def send(channel: discord.TextChannel) -> None:
+            if not await bans.check(channel.guild, message.author.id):
+                await channel.webhook_send(
+                    username=f"{message.author.name} {message.author.id}",
+                    avatar_url=getattr(message.author.avatar, "url", ""),
+                    content=message.clean_content, embeds=embeds,
+                    files=[file.to_file() for file in files]
+                )
 
-        row = await self.load_globalchat_name(message.channel.id)
-        if row:
+        # 送る。送信先ごとに同時に送られるので、遅いサーバーがあっても他のサーバーは待たされない。
+        channels = [
+            channel for _, channel_id, _ in rows
+            if message.channel.id != channel_id
+            and (channel := self.bot.get_channel(channel_id)) is not None
+        ]
+        for channel, result in zip(channels, await fanout.deliver(channels, send)):
+            if isinstance(result, Exception):
+                print("Error on global chat :", channel.id, repr(result))
+
+    @message_stage(threads=False, topic=("RT-GlobalChat",))
+    async def on_message(self, message: discord.Message):
+        if (row := self.registry.row(message.channel.id)):
             # スパムの場合は一分停止させる。
             if (before := self.blocking.get(message.author.id)):
                 if before.get("time", (now := time()) - 1) < now:
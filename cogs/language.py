@@ -1,6 +1,6 @@
 # Free RT - Language
 
-from typing import Literal, Union, List, Tuple
+from typing import Literal, Union, Optional, List, Tuple
 
 from discord.ext import commands
 import discord
@@ -8,9 +8,45 @@ import discord
 from util import RT
 
 from aiofiles import open as async_open
+from functools import lru_cache
+from ast import literal_eval
+from sys import intern
 from json import loads
 
 
+LANGUAGES = ("ja", "en")
+
+
+class ReplyTable:
+    "`data/replies.json`を読み込み時に言語ごとの辞書にまとめたものです。"
+
+    def __init__(self, replies: dict[str, dict[str, str]]):
+        self.tables: dict[str, dict[str, str]] = {lang: {} for lang in LANGUAGES}
+        for text, translated in replies.items():
+            text = intern(text)
+            for lang, value in translated.items():
+                self.tables.setdefault(lang, {})[text] = intern(value)
+
+    def get(self, text: str, lang: str) -> str:
+        "渡された文字列を指定された言語のものにします。ない場合はそのまま返します。"
+        if (table := self.tables.get(lang)) is None:
+            return text
+        return table.get(text, text)
+
+
+@lru_cache(maxsize=4096)
+def _resolve_dict_literal(text: str, lang: str) -> Optional[str]:
+    # `{"ja": "...", "en": "..."}`のような文字列から指定された言語のものを取り出す。
+    # 埋め込みのフィールドなどは辞書が文字列にされて渡されるので、何度も来るものは覚えておく。
+    try:
+        data = literal_eval(text)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    return data.get(lang, data.get("ja", text))
+
+
 class Language(commands.Cog):
     """# Language
     ## このコグの内容
@@ -28,7 +64,7 @@ class Language(commands.Cog):
     もし一部環境などによっては変化する文字列がある場合は`data/replis.json`の方では`$$`にして、コードは`"$ここに変化する文字列$"`のようにすれば良いです。  
     もし翻訳済みに交換してほしくないテキストの場合は引数で`replace_language=False`とやればよいです。"""
 
-    LANGUAGES = ("ja", "en")
+    LANGUAGES = LANGUAGES
 
     def __init__(self, bot: RT):
         self.bot = bot
@@ -44,7 +80,7 @@ class Language(commands.Cog):
         self.bot.loop.create_task(self.on_ready())
 
         with open("data/replies.json", encoding="utf-8") as f:
-            self.replies = loads(f.read())
+            self.replies = ReplyTable(loads(f.read()))
 
     def cog_unload(self):
         for key in list(self.bot.cogs["OnSend"].events.keys()):
@@ -125,15 +161,11 @@ class Language(commands.Cog):
             if isinstance(text, str) and text[0] != "{":
                 # 指定された文字を指定された言語で交換します。
                 # 言語データから文字列を取得する。
-                result = self.replies.get(text, {}).get(lang, text)
+                result = self.replies.get(text, lang)
             else:
                 if isinstance(text, str) and text[0] == "{" and text[-1] == "}":
-                    try:
-                        result = eval(text)
-                    except ValueError:
-                        result = str(text)
-                    else:
-                        result = result.get(lang, result.get("ja", text))
+                    if (result := _resolve_dict_literal(text, lang)) is None:
+                        result = text
                 elif isinstance(text, dict):
                     result = text.get(lang, text["ja"])
                 else:
@@ -185,7 +217,7 @@ class Language(commands.Cog):
     async def update_language(self) -> None:
         # 言語データを更新します。
         async with async_open("data/replies.json") as f:
-            self.replies = loads(await f.read())
+            self.replies = ReplyTable(loads(await f.read()))
 
     async def update_cache(self, cursor):
         # キャッシュを更新します。
@@ -309,3 +341,31 @@ class Language(commands.Cog):
 
 async def setup(bot):
     await bot.add_cog(Language(bot))
+
+
+if __name__ == "__main__":
+    # 言語の置き換えにかかる時間を計測する。`python -m cogs.language`で実行できます。
+    from timeit import timeit
+
+    cog = Language.__new__(Language)
+    with open("data/replies.json", encoding="utf-8") as f:
+        cog.replies = ReplyTable(loads(f.read()))
+    cog.cache = {}
+
+    def make_embed() -> discord.Embed:
+        embed = discord.Embed(
+            title={"ja": "レベル報酬", "en": "Level reward"},
+            description="Helpが必要ですか？"
+        )
+        for index in range(5):
+            embed.add_field(
+                name={"ja": f"フィールド{index}", "en": f"Field {index}"},
+                value="検索結果"
+            )
+        return embed.set_footer(text={"ja": "フッター", "en": "Footer"})
+
+    embeds = [make_embed() for _ in range(10000)]
+    elapsed = timeit(lambda: cog.get_text(embeds.pop(), "en"), number=10000)
+    print(f"embed: {elapsed / 10000 * 1000000:.2f}us/send")
+    elapsed = timeit(lambda: cog.get_text("Helpが必要ですか？", "en"), number=100000)
+    print(f"content: {elapsed / 100000 * 1000000:.2f}us/send")
@@ -4,13 +4,18 @@ from __future__ import annotations
 
 from typing import NewType, TypedDict, Literal, Union, Optional
 
+from collections.abc import Iterator, Iterable
 from dataclasses import dataclass
+from asyncio import Event, Future, Task
+from bisect import bisect_left, insort
+from array import array
+from time import time
 
-from discord.ext import commands
+from discord.ext import commands, tasks
 import discord
 
-from util.page import EmbedPage
-from util import RT, Table
+from util.page import BasePage
+from util import RT, Table, message_stage
 
 
 Exp, Level = NewType("Exp", int), NewType("Level", int)
@@ -32,6 +37,8 @@ class Reward(TypedDict):
 
 class LocalLevel(Table):
     __allocation__ = "GuildID"
+    __lazy__ = True
+    __cache_size__ = 5000
     onoff: bool
     nof: bool
     data: dict[int, LevelData]
@@ -40,6 +47,8 @@ class LocalLevel(Table):
 
 class GlobalLevel(Table):
     __allocation__ = "UserID"
+    __lazy__ = True
+    __cache_size__ = 100000
     level: LevelData
     nof: bool
 
@@ -50,6 +59,361 @@ class Data:
     g: GlobalLevel
 
 
+def calc(exp: int, level: int) -> bool:
+    "レベルが上がるかどうかの計算を行います。"
+    return exp >= round((4 * (level ** 3)) / 5)
+
+
+MAX_LEVEL = 2000
+THRESHOLDS = array("Q", (round((4 * (level ** 3)) / 5) for level in range(MAX_LEVEL)))
+"レベル毎の次のレベルに上がるのに必要な経験値の表です。`calc`を毎回しないようにするためのものです。"
+GLOBAL = 0
+"`LevelData`のテーブルでグローバルレベルを表すサーバーIDです。"
+
+
+class Leaderboard:
+    """レベルのランキングの索引です。  
+    `(-レベル, ユーザーID)`を並べたリストをレベルアップの時に二分探索で更新するので、  
+    ページの取得はページの大きさ、順位の取得は人数の対数に比例した時間で終わります。"""
+
+    __slots__ = ("keys", "levels")
+
+    def __init__(self, items: Iterable[tuple[int, int]]):
+        self.levels: dict[int, int] = {user_id: level for user_id, level in items if level}
+        self.keys = sorted((-level, user_id) for user_id, level in self.levels.items())
+
+    def update(self, user_id: int, level: int) -> None:
+        "ユーザーのレベルを更新します。"
+        if (before := self.levels.get(user_id)) is not None:
+            del self.keys[bisect_left(self.keys, (-before, user_id))]
+        self.levels[user_id] = level
+        insort(self.keys, (-level, user_id))
+
+    def rank(self, user_id: int) -> Optional[int]:
+        "ユーザーの順位を取得します。同じレベルの人は同じ順位です。"
+        if (level := self.levels.get(user_id)) is not None:
+            return bisect_left(self.keys, (-level,)) + 1
+
+    def page(self, start: int, count: int) -> list[tuple[int, int]]:
+        "`start`番目から`count`人の`(ユーザーID, レベル)`を取得します。"
+        return [(user_id, -level) for level, user_id in self.keys[start:start + count]]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class LevelBucket:
+    """サーバー毎の経験値とレベルを配列で持つものです。グローバルレベルはサーバーIDが`GLOBAL`のものです。  
+    変更されたユーザーの位置は`dirty`に記録されます。"""
+
+    __slots__ = ("guild_id", "positions", "users", "exps", "levels", "dirty", "used", "board")
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.positions: dict[int, int] = {}
+        self.users, self.exps, self.levels = array("Q"), array("Q"), array("L")
+        self.dirty: set[int] = set()
+        self.used = time()
+        self.board: Optional[Leaderboard] = None
+
+    def put(self, user_id: int, exp: int, level: int) -> int:
+        "ユーザーの経験値とレベルを入れます。"
+        if (position := self.positions.get(user_id)) is None:
+            self.positions[user_id] = position = len(self.users)
+            self.users.append(user_id)
+            self.exps.append(exp)
+            self.levels.append(level)
+        else:
+            self.exps[position], self.levels[position] = exp, level
+        return position
+
+    def get(self, user_id: int) -> Optional[LevelData]:
+        "ユーザーの経験値とレベルを取得します。"
+        if (position := self.positions.get(user_id)) is not None:
+            return LevelData(exp=self.exps[position], level=self.levels[position])
+
+    def add(self, user_id: int) -> Optional[int]:
+        "ユーザーの経験値を一つ増やします。レベルが上がった場合は新しいレベルを返します。"
+        if (position := self.positions.get(user_id)) is None:
+            position = self.put(user_id, 0, 0)
+        self.dirty.add(position)
+        self.used = time()
+        self.exps[position] += 1
+        level = self.levels[position]
+        if (self.exps[position] >= THRESHOLDS[level] if level < MAX_LEVEL
+                else calc(self.exps[position], level)):
+            self.levels[position] = level = level + 1
+            if self.board is not None:
+                self.board.update(user_id, level)
+            return level
+
+    def items(self) -> Iterator[tuple[int, LevelData]]:
+        "全てのユーザーの経験値とレベルを返します。"
+        for position, user_id in enumerate(self.users):
+            yield user_id, LevelData(exp=self.exps[position], level=self.levels[position])
+
+    def pop_dirty(self) -> list[tuple[int, int, int, int]]:
+        "変更されたユーザーを`(サーバーID, ユーザーID, 経験値, レベル)`で取り出します。"
+        dirty, self.dirty = self.dirty, set()
+        return [
+            (self.guild_id, self.users[position], self.exps[position], self.levels[position])
+            for position in dirty
+        ]
+
+    def restore_dirty(self, rows: list[tuple[int, int, int, int]]) -> None:
+        "`pop_dirty`で取り出したものを戻します。書き込みに失敗した際に使います。"
+        self.dirty.update(self.positions[row[1]] for row in rows)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+
+class LevelAccumulator:
+    """経験値の増加をメモリの`LevelBucket`に貯めて、変更されたユーザーだけを定期的にまとめて書き込むものです。  
+    データは`(GuildID, UserID, Exp, Level)`の`LevelData`のテーブルに保存されます。  
+    サーバーのレベルはそのサーバーの全員分を一度に、グローバルレベルはユーザー毎に読み込みます。"""
+
+    TABLE = "LevelData"
+    MIGRATION_TABLE = "LevelDataMigration"
+    "`LocalLevel`と`GlobalLevel`からの移行が終わったかを記録するテーブルです。"
+    CHUNK_SIZE = 500
+    "一度のクエリで書き込む行数の上限です。"
+    IDLE_TIMEOUT = 3600
+    "この秒数使われていないサーバーの`LevelBucket`はメモリから消されます。"
+    GLOBAL_CACHE_SIZE = 100000
+    "グローバルレベルの`LevelBucket`がこの人数を超えたら作り直されます。"
+
+    def __init__(self, cog: Level):
+        self.cog, self.bot = cog, cog.bot
+        self.buckets: dict[int, LevelBucket] = {}
+        self.global_board: Optional[Leaderboard] = None
+        self._building: Optional[Task] = None
+        self.ready = Event()
+        self._loading: dict[tuple[int, int], Future] = {}
+        self.bot.loop.create_task(self._prepare_table())
+        self._flush_loop.start()
+
+    async def _prepare_table(self) -> None:
+        try:
+            async with self.bot.mysql.pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        f"""CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                            GuildID BIGINT NOT NULL, UserID BIGINT NOT NULL,
+                            Exp BIGINT NOT NULL DEFAULT 0, Level INT NOT NULL DEFAULT 0,
+                            PRIMARY KEY (GuildID, UserID), INDEX (GuildID, Level, Exp)
+                        );"""
+                    )
+                    await cursor.execute(
+                        f"""CREATE TABLE IF NOT EXISTS {self.MIGRATION_TABLE} (
+                            Name VARCHAR(32) NOT NULL PRIMARY KEY
+                        );"""
+                    )
+                    await cursor.execute(
+                        f"SELECT 1 FROM {self.MIGRATION_TABLE} WHERE Name = %s;", ("json",)
+                    )
+                    if not await cursor.fetchone():
+                        # 移行は全て書き込めた時だけ終わったことにする。
+                        await conn.begin()
+                        try:
+                            await self._migrate(cursor)
+                            await cursor.execute(
+                                f"INSERT INTO {self.MIGRATION_TABLE} VALUES (%s);", ("json",)
+                            )
+                            await conn.commit()
+                        except Exception:
+                            await conn.rollback()
+                            raise
+        except Exception as e:
+            # 移行に失敗しても次の起動時にやり直すので、レベルは使えるようにしておく。
+            self.cog.print("[prepare_table.failed]", repr(e))
+        finally:
+            self.ready.set()
+
+    async def _migrate(self, cursor) -> None:
+        # `LocalLevel`と`GlobalLevel`のJSONにあるレベルを`LevelData`に移す。
+        # 前回の移行が失敗した後に書き込まれた行があるかもしれないので、大きい方を残す。
+        rows = []
+        async for guild_id, data in self.cog.data.l.stream():
+            for user_id, level in data.get("data", {}).items():
+                rows.append((guild_id, int(user_id), level.get("exp", 0), level.get("level", 0)))
+        async for user_id, data in self.cog.data.g.stream():
+            if (level := data.get("level")) is not None:
+                rows.append((GLOBAL, user_id, level.get("exp", 0), level.get("level", 0)))
+        self.cog.print("[migrate]", f"{len(rows)} rows")
+        for index in range(0, len(rows), self.CHUNK_SIZE):
+            await cursor.executemany(
+                f"""INSERT INTO {self.TABLE} VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE Exp = GREATEST(Exp, VALUES(Exp)),
+                    Level = GREATEST(Level, VALUES(Level));""",
+                rows[index:index + self.CHUNK_SIZE]
+            )
+
+    async def _load(self, guild_id: int, user_id: int = GLOBAL) -> None:
+        # サーバーの全員、またはグローバルレベルのユーザーを読み込む。同じものの読み込みは一つにまとめる。
+        key = (guild_id, user_id)
+        if key in self._loading:
+            return await self._loading[key]
+        self._loading[key] = future = self.bot.loop.create_future()
+        try:
+            async with self.bot.mysql.pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    if guild_id == GLOBAL:
+                        await cursor.execute(
+                            f"SELECT UserID, Exp, Level FROM {self.TABLE} WHERE GuildID = %s AND UserID = %s;",
+                            (GLOBAL, user_id)
+                        )
+                    else:
+                        await cursor.execute(
+                            f"SELECT UserID, Exp, Level FROM {self.TABLE} WHERE GuildID = %s;",
+                            (guild_id,)
+                        )
+                    rows = await cursor.fetchall()
+            if (bucket := self.buckets.get(guild_id)) is None:
+                self.buckets[guild_id] = bucket = LevelBucket(guild_id)
+                if guild_id == GLOBAL:
+                    bucket.board = self.global_board
+            for row in rows:
+                if row[0] not in bucket.positions:
+                    bucket.put(*row)
+            if guild_id == GLOBAL and user_id not in bucket.positions:
+                bucket.put(user_id, 0, 0)
+        finally:
+            del self._loading[key]
+            future.set_result(None)
+
+    async def get_bucket(self, guild_id: int, user_id: int = GLOBAL) -> LevelBucket:
+        "`LevelBucket`を必要なら読み込んで取得します。グローバルの場合は`user_id`のユーザーが読み込まれます。"
+        await self.ready.wait()
+        while ((bucket := self.buckets.get(guild_id)) is None
+                or (guild_id == GLOBAL and user_id not in bucket.positions)):
+            await self._load(guild_id, user_id)
+        # 取得してから使うまでの間に`compact`で消されないようにする。
+        bucket.used = time()
+        return bucket
+
+    async def get(self, guild_id: int, user_id: int) -> LevelData:
+        "ユーザーの経験値とレベルを取得します。`guild_id`を`GLOBAL`にするとグローバルレベルを取得します。"
+        return (await self.get_bucket(guild_id, user_id)).get(user_id) or FIRST_LEVEL
+
+    async def add(self, guild_id: int, user_id: int) -> tuple[Optional[int], Optional[int]]:
+        "サーバーとグローバルの経験値を一つ増やします。レベルが上がったものは新しいレベルが返されます。"
+        local = await self.get_bucket(guild_id)
+        global_ = await self.get_bucket(GLOBAL, user_id)
+        return local.add(user_id), global_.add(user_id)
+
+    async def _build_global_board(self) -> Leaderboard:
+        # グローバルレベルのランキングの索引を、データベースから少しずつ読み込んで作る。
+        levels, last = {}, -1
+        async with self.bot.mysql.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                while True:
+                    await cursor.execute(
+                        f"""SELECT UserID, Level FROM {self.TABLE}
+                        WHERE GuildID = %s AND UserID > %s AND Level > 0
+                        ORDER BY UserID LIMIT 10000;""", (GLOBAL, last)
+                    )
+                    if not (rows := await cursor.fetchall()):
+                        break
+                    levels.update(rows)
+                    last = rows[-1][0]
+        # まだ書き込まれていないレベルはメモリにあるものを使う。
+        if (bucket := self.buckets.get(GLOBAL)) is not None:
+            levels.update(zip(bucket.users, bucket.levels))
+            bucket.board = self.global_board = Leaderboard(levels.items())
+        else:
+            self.global_board = Leaderboard(levels.items())
+        return self.global_board
+
+    async def get_board(self, guild_id: int) -> Leaderboard:
+        "ランキングの索引を取得します。`guild_id`を`GLOBAL`にするとグローバルレベルのものを取得します。"
+        if guild_id == GLOBAL:
+            await self.ready.wait()
+            if self.global_board is None:
+                if self._building is None:
+                    self._building = self.bot.loop.create_task(self._build_global_board())
+                try:
+                    return await self._building
+                finally:
+                    self._building = None
+            return self.global_board
+        bucket = await self.get_bucket(guild_id)
+        if bucket.board is None:
+            bucket.board = Leaderboard(zip(bucket.users, bucket.levels))
+        return bucket.board
+
+    async def flush(self) -> None:
+        """変更されたユーザーの経験値とレベルをまとめて書き込みます。  
+        書き込みに失敗したサーバーは次の書き込みに持ち越され、他のサーバーの書き込みは続けられます。"""
+        for bucket in list(self.buckets.values()):
+            if not bucket.dirty:
+                continue
+            rows = bucket.pop_dirty()
+            try:
+                async with self.bot.mysql.pool.acquire() as conn:
+                    async with conn.cursor() as cursor:
+                        for index in range(0, len(rows), self.CHUNK_SIZE):
+                            await cursor.executemany(
+                                f"""INSERT INTO {self.TABLE} VALUES (%s, %s, %s, %s)
+                                ON DUPLICATE KEY UPDATE Exp = VALUES(Exp), Level = VALUES(Level);""",
+                                rows[index:index + self.CHUNK_SIZE]
+                            )
+            except Exception as e:
+                # 失敗した場合は次の書き込みに持ち越す。
+                bucket.restore_dirty(rows)
+                self.cog.print("[flush.failed]", f"{bucket.guild_id}: {e!r}")
+
+    def compact(self) -> None:
+        "使われていないサーバーと大きくなりすぎたグローバルの`LevelBucket`を消します。"
+        now = time()
+        for guild_id, bucket in list(self.buckets.items()):
+            if bucket.dirty or (guild_id, GLOBAL) in self._loading:
+                continue
+            if (guild_id == GLOBAL and len(bucket) > self.GLOBAL_CACHE_SIZE) \
+                    or (guild_id != GLOBAL and now - bucket.used > self.IDLE_TIMEOUT):
+                del self.buckets[guild_id]
+
+    @tasks.loop(seconds=30)
+    async def _flush_loop(self):
+        # 例外でループが止まるとそれ以降の経験値が書き込まれなくなるので、ここで止める。
+        try:
+            await self.flush()
+            self.compact()
+        except Exception as e:
+            self.cog.print("[flush_loop.failed]", repr(e))
+
+    def close(self) -> None:
+        "コグのアンロード時に呼ばれるべき関数です。"
+        self._flush_loop.cancel()
+        self.bot.loop.create_task(self.flush())
+
+
+class RankingPage(BasePage):
+    "ランキングのページです。ページを捲った時にそのページの埋め込みだけを作ります。"
+
+    def __init__(self, cog: Level, user_id: int, *args, **kwargs):
+        self.cog, self.user_id = cog, user_id
+        super().__init__(*args, **kwargs)
+
+    async def on_turn(self, mode: str, interaction: discord.Interaction):
+        before = self.page
+        await super().on_turn(mode, interaction)
+        last = (len(self.data) - 1) // self.cog.PAGE_SIZE
+        if not 0 <= self.page <= last:
+            if mode == "dl":
+                self.page = 0
+            elif mode == "dr":
+                self.page = last
+            else:
+                self.page = before
+                return await interaction.response.send_message(
+                    "これ以上ページを捲ることができません。", ephemeral=True
+                )
+        await interaction.response.edit_message(
+            embed=self.cog.make_ranking_embed(self.data, self.page, self.user_id)
+        )
+
+
 cooldown = commands.cooldown(1, 5, commands.BucketType.guild)
 
 
@@ -57,8 +421,19 @@ class Level(commands.Cog):
     def __init__(self, bot: RT):
         self.bot = bot
         self.data = Data(LocalLevel(bot), GlobalLevel(bot))
+        self.levels = LevelAccumulator(self)
         self.bot.prefixes = tuple(self.bot.command_prefix)
 
+    def cog_unload(self):
+        self.levels.close()
+
+    @commands.Cog.listener()
+    async def on_close(self, _):
+        await self.levels.flush()
+
+    def print(self, *args, **kwargs):
+        return self.bot.print(f"[{self.__cog_name__}]", *args, **kwargs)
+
     def get_now(self, data: LevelData) -> str:
         return f"Level:`{data['level']}`, Exp:`{data['exp']}`"
 
@@ -101,15 +476,10 @@ class Level(commands.Cog):
                 ).add_field(
                     name={"ja": f"{ctx.guild.name}でのレベル",
                           "en": f"{ctx.guild.name} Level"},
-                    value=self.get_now(
-                        self.data.l[ctx.guild.id].get('data', {})
-                        .get(str(ctx.author.id), FIRST_LEVEL)
-                    )
+                    value=self.get_now(await self.levels.get(ctx.guild.id, ctx.author.id))
                 ).add_field(
                     name={"ja": "グローバルでのレベル", "en": "Global Level"},
-                    value=self.get_now(
-                        self.data.g[ctx.author.id].get("level", FIRST_LEVEL)
-                    )
+                    value=self.get_now(await self.levels.get(GLOBAL, ctx.author.id))
                 )
             )
 
@@ -121,17 +491,28 @@ class Level(commands.Cog):
         3: "<:No3:795849531840397323>"
     }
 
+    PAGE_SIZE = 10
+
     def make_ranking_embed(
-        self, rank: int, fields: list[tuple[str, str]]
+        self, board: Leaderboard, page: int, user_id: int
     ) -> discord.Embed:
-        "ランキング用の埋め込みを作ります。"
+        "ランキング用の埋め込みを作ります。索引からはそのページの分だけを取り出します。"
         embed = discord.Embed(
             title="ランキング ",
-            description=f"{rank/10}ページ目",
+            description=f"{page + 1}ページ目",
             color=self.bot.Colors.normal
         )
-        for name, value in fields:
-            embed.add_field(name=name, value=value)
+        for rank, (member_id, level) in enumerate(
+            board.page(page * self.PAGE_SIZE, self.PAGE_SIZE), page * self.PAGE_SIZE + 1
+        ):
+            embed.add_field(
+                name=f"{self.EMOJIS.get(rank, f'{rank}位')}",
+                value="{}：`{}`".format(
+                    getattr(self.bot.get_user(member_id), 'name', '？？？'), level
+                )
+            )
+        if (rank := board.rank(user_id)) is not None:
+            embed.set_footer(text=f"あなたの順位：{rank}位")
         return embed
 
     @level.command(
@@ -166,37 +547,14 @@ class Level(commands.Cog):
         Aliases
         -------
         rank, r"""
-        if (mode == "server" and (
-            data := self.data.l[ctx.guild.id].get("data")
-        ) is not None) or (data := {
-            key: value.get("level", dict(level=0, exp=0))
-            for key, value in self.data.g.to_dict().items()
-        }):
-            fields, embeds = [], []
-            for rank, (user_id, data) in enumerate(
-                reversed(sorted(data.items(), key=lambda x: x[1]["level"])), 1
-            ):
-                fields.append(
-                    (
-                        f"{self.EMOJIS.get(rank, f'{rank}位')}",
-                        "{}：`{}`".format(
-                            getattr(self.bot.get_user(int(user_id)), 'name', '？？？'),
-                            data['level']
-                        )
-                    )
-                )
-                if rank % 10 == 0:
-                    embeds.append(self.make_ranking_embed(rank, fields))
-                    fields = []
-                    if mode == "global":
-                        # グローバルの場合はメモリが大きくなるので終了する。
-                        break
-            if fields:
-                embeds.append(self.make_ranking_embed(rank, fields))
-            if len(embeds) == 1:
-                await ctx.reply(embed=embeds[0])
+        board = await self.levels.get_board(ctx.guild.id if mode == "server" else GLOBAL)
+        if board:
+            embed = self.make_ranking_embed(board, 0, ctx.author.id)
+            if len(board) <= self.PAGE_SIZE:
+                await ctx.reply(embed=embed)
             else:
-                await ctx.reply(embed=embeds[0], view=EmbedPage(data=embeds))
+                view = RankingPage(self, ctx.author.id, data=board)
+                view.message = await ctx.reply(embed=embed, view=view)
         else:
             await ctx.reply("まだありません。")
 
@@ -225,7 +583,7 @@ class Level(commands.Cog):
         -------
         rw, rd"""
         if not ctx.invoked_subcommand:
-            data: dict[str, Reward] = self.data.l[ctx.guild.id].get("reward")
+            data: dict[str, Reward] = (await self.data.l.load(ctx.guild.id)).get("reward")
             if data is None:
                 await ctx.reply("まだ設定されていません。")
             else:
@@ -288,6 +646,7 @@ class Level(commands.Cog):
         Aliases
         -------
         s"""
+        await self.data.l.load(ctx.guild.id)
         if "reward" not in self.data.l[ctx.guild.id]:
             self.data.l[ctx.guild.id].reward = {}
         self.data.l[ctx.guild.id].reward[str(level)] = {
@@ -326,6 +685,7 @@ class Level(commands.Cog):
         Aliases
         -------
         d"""
+        await self.data.l.load(ctx.guild.id)
         if "reward" in self.data.l[ctx.guild.id]:
             try:
                 del self.data.l[ctx.guild.id].reward[str(level)]
@@ -379,26 +739,12 @@ class Level(commands.Cog):
 
     @notification.command("global", aliases=("g", "グローバル"))
     async def nof_global(self, ctx: commands.Context, onoff: bool):
-        self.data.g[ctx.guild.id].nof = onoff
+        (await self.data.g.load(ctx.author.id)).nof = onoff
 
     @notification.command("server", aliases=("l", "local", "サーバー"))
     @commands.has_guild_permissions(administrator=True)
     async def nof_local(self, ctx: commands.Context, onoff: bool):
-        self.data.l[ctx.guild.id].nof = onoff
-
-    def calc(self, exp: int, level: int) -> bool:
-        "レベルの計算を行います。"
-        return exp >= round((4 * (level ** 3)) / 5)
-
-    def process_level(self, now: LevelData) -> bool:
-        "レベルの処理を行う。"
-        if "exp" not in now:
-            now = FIRST_LEVEL.copy()
-        now["exp"] += 1
-        if self.calc(**now):
-            now["level"] += 1
-            return True
-        return False
+        (await self.data.l.load(ctx.guild.id)).nof = onoff
 
     async def manage_role(
         self, mode: Literal["add", "remove"], message: discord.Message, role_id: int
@@ -423,6 +769,8 @@ class Level(commands.Cog):
         self, message: discord.Message, level: Level, mode: Literal["g", "l"]
     ) -> None:
         "レベルアップ時の処理を行う。"
+        await self.data.l.load(message.guild.id)
+        await self.data.g.load(message.author.id)
         # 通知を行う。
         if (self.data.l[message.guild.id].get("nof", False)
                 or self.data.g[message.author.id].get("nof", False)):
@@ -438,28 +786,13 @@ class Level(commands.Cog):
                             "remove", message, data["replace_role_id"]
                         )
 
-    @commands.Cog.listener()
+    @message_stage(prefix=False, enabled=lambda self, _: self.levels.ready.is_set())
     async def on_message(self, message: discord.Message):
-        if (message.author.bot or not message.guild
-                or message.content.startswith(self.bot.prefixes)):
-            return
-
-        if self.data.l[message.guild.id].get("data", True):
-            if "data" not in self.data.l[message.guild.id]:
-                self.data.l[message.guild.id].data = {}
-            if self.process_level(
-                now := self.data.l[message.guild.id].data.get(
-                    str(message.author.id), FIRST_LEVEL
-                ).copy()
-            ):
-                await self.on_level(message, now["level"], "l")
-            self.data.l[message.guild.id].data[str(message.author.id)] = now
-
-        if self.process_level(
-            now := self.data.g[message.author.id].get("level", FIRST_LEVEL).copy()
-        ):
-            await self.on_level(message, now["level"], "g")
-        self.data.g[message.author.id].level = now
+        local, global_ = await self.levels.add(message.guild.id, message.author.id)
+        if local is not None:
+            await self.on_level(message, local, "l")
+        if global_ is not None:
+            await self.on_level(message, global_, "g")
 
 
 del cooldown
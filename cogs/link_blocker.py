@@ -5,7 +5,7 @@ from typing import TYPE_CHECKING, List
 from discord.ext import commands
 import discord
 
-from util import RT
+from util import RT, message_stage
 
 if TYPE_CHECKING:
     from aiomysql import Pool, Cursor
@@ -247,20 +247,21 @@ class LinkBlocker(commands.Cog, DataManager):
 
     SCHEMES = ("https://", "http://")
 
-    @commands.Cog.listener()
+    @message_stage(
+        bots=True, self_messages=True, urls=True,
+        enabled=lambda self, message: message.guild.id in self.guilds
+        and message.channel.id not in self.ignores
+    )
     async def on_message(self, message: discord.Message):
-        if (message.guild and message.guild.id in self.guilds
-                and any(scheme in message.content for scheme in self.SCHEMES)
-                and message.channel.id not in self.ignores):
-            await message.delete()
-            content = {
-                "ja": "このチャンネルではURLを送信することができません。",
-                "en": "You can't send the URL on the channel."
-            }
-            try:
-                await message.author.send(content, delete_after=3)
-            except Exception:
-                await message.channel.send(content, delete_after=3)
+        await message.delete()
+        content = {
+            "ja": "このチャンネルではURLを送信することができません。",
+            "en": "You can't send the URL on the channel."
+        }
+        try:
+            await message.author.send(content, delete_after=3)
+        except Exception:
+            await message.channel.send(content, delete_after=3)
 
 
 async def setup(bot):
@@ -7,6 +7,8 @@ from asyncio import sleep
 from datetime import datetime, timedelta
 from functools import wraps
 
+from util.topic_index import topics
+
 
 CHP_HELP = {
     "ja": (
@@ -34,12 +36,7 @@ def log(mode: str = "normal", force: bool = False):
                 guild = first_arg.guild
 
             if guild:
-                channel = discord.utils.find(
-                    lambda ch: (
-                        "log-rt" in ch.name
-                        or (ch.topic and "rf>log" in ch.topic)
-                    ), guild.text_channels
-                )
+                channel = topics.find(guild, "rf>log") or topics.find(guild, "log-rt")
 
                 if channel or force:
                     embed = await func(self, first_arg, *args, **kwargs)
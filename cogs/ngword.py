@@ -2,10 +2,13 @@
 
 from __future__ import annotations
 
+from typing import Optional
+
 from discord.ext import commands
 import discord
 
-from util import RT, Table
+from util import RT, Table, message_stage
+from util.keywords import KeywordIndex
 
 from .log import log
 
@@ -18,11 +21,25 @@ class NGWords(Table):
 class DataManager:
     def __init__(self, bot: RT):
         self.data = NGWords(bot)
+        self.automata = KeywordIndex()
 
     def get(self, guild_id: int) -> list[str]:
         "NGワードのリストを取得します。"
         return self.data[guild_id].get("words", [])
 
+    def search(self, guild_id: int, content: str) -> Optional[str]:
+        "文字列に含まれているNGワードを一つ返します。含まれていない場合は`None`を返します。"
+        if guild_id not in self.automata:
+            if not self.data.locked.is_set():
+                # テーブルの読み込みが終わるまでは空のオートマトンを作らないように一つずつ調べる。
+                for word in self.get(guild_id):
+                    if word in content:
+                        return word
+                return None
+            # オートマトンはサーバーのNGワードが初めて必要になった時に作る。
+            self.automata.set(guild_id, self.get(guild_id))
+        return self.automata.search(guild_id, content)
+
     def _prepare(self, guild_id: int) -> None:
         # セーブデータの準備をします。
         if "words" not in self.data[guild_id]:
@@ -34,12 +51,16 @@ class DataManager:
         assert word not in self.data[guild_id].words, "既に追加されています。"
         assert len(self.data[guild_id].words) < 50, "追加しすぎです。"
         self.data[guild_id].words.append(word)
+        if (automaton := self.automata.get(guild_id)) is not None:
+            automaton.add(word)
 
     def remove(self, guild_id: int, word: str) -> None:
         "NGワードを削除します。"
         self._prepare(guild_id)
         assert word in self.data[guild_id].words, "そのNGワードはありません。"
         self.data[guild_id].words.remove(word)
+        if (automaton := self.automata.get(guild_id)) is not None:
+            automaton.remove(word)
 
 
 class NgWord(commands.Cog, DataManager):
@@ -162,30 +183,24 @@ class NgWord(commands.Cog, DataManager):
             self.remove(ctx.guild.id, word)
         await ctx.reply("Ok")
 
-    @commands.Cog.listener()
+    @message_stage(bots=True, members_only=True)
     @log(force=True)
     async def on_message(self, message: discord.Message):
-        # 関係ないメッセージは無視する。
-        if (not message.guild or message.author.id == self.bot.user.id
-                or isinstance(message.author, discord.User)):
-            return
-
         if not message.author.guild_permissions.administrator:
-            for word in self.get(message.guild.id):
-                if word in message.content:
-                    await message.delete()
-                    embed = discord.Embed(
-                        title={"ja": "NGワードを削除しました。",
-                               "en": "Removed the NG Word."},
-                        color=self.bot.colors["unknown"]
-                    )
-                    embed.add_field(
-                        name="Author",
-                        value=f"{message.author.mention} ({message.author.id})",
-                        inline=False
-                    )
-                    embed.add_field(name="Content", value=message.content)
-                    return embed
+            if self.search(message.guild.id, message.content) is not None:
+                await message.delete()
+                embed = discord.Embed(
+                    title={"ja": "NGワードを削除しました。",
+                           "en": "Removed the NG Word."},
+                    color=self.bot.colors["unknown"]
+                )
+                embed.add_field(
+                    name="Author",
+                    value=f"{message.author.mention} ({message.author.id})",
+                    inline=False
+                )
+                embed.add_field(name="Content", value=message.content)
+                return embed
 
 
 async def setup(bot):
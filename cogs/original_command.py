@@ -7,7 +7,8 @@ import discord
 
 from aiomysql import Pool, Cursor
 
-from util import DatabaseManager
+from util import DatabaseManager, message_stage
+from util.keywords import KeywordIndex
 
 
 class DataManager(DatabaseManager):
@@ -78,6 +79,7 @@ class OriginalCommand(commands.Cog, DataManager):
     def __init__(self, bot):
         self.bot = bot
         self.data = {}
+        self.automata = KeywordIndex()
         self.bot.loop.create_task(self.on_ready())
 
     async def on_ready(self):
@@ -95,6 +97,23 @@ class OriginalCommand(commands.Cog, DataManager):
                     "content": row[2],
                     "reply": row[3]
                 }
+        # 完全一致のコマンドもメッセージに含まれているので、全てのコマンドをオートマトンに入れる。
+        self.automata = KeywordIndex()
+        for guild_id, data in self.data.items():
+            self.automata.set(guild_id, data)
+
+    def cache_command(self, guild_id: int, command: str, content: str, reply: bool) -> None:
+        "追加または更新したコマンドをキャッシュに反映します。オートマトンはそのサーバーのものだけ更新します。"
+        self.data.setdefault(guild_id, {})[command] = {"content": content, "reply": reply}
+        self.automata.add(guild_id, command)
+
+    def uncache_command(self, guild_id: int, command: str) -> None:
+        "削除したコマンドをキャッシュに反映します。"
+        if guild_id in self.data:
+            self.data[guild_id].pop(command, None)
+            if not self.data[guild_id]:
+                del self.data[guild_id]
+        self.automata.remove(guild_id, command)
 
     LIST_MES = {
         "ja": ("自動返信一覧", "部分一致"),
@@ -202,7 +221,7 @@ class OriginalCommand(commands.Cog, DataManager):
             )
         else:
             await self.write(ctx.guild.id, command, content, auto_reply)
-            await self.update_cache()
+            self.cache_command(ctx.guild.id, command, content, auto_reply)
             await ctx.reply("Ok")
 
     @command.command("delete", aliases=["del", "rm", "さくじょ", "削除"])
@@ -243,26 +262,21 @@ class OriginalCommand(commands.Cog, DataManager):
                  "en": "The command is not found."}
             )
         else:
-            await self.update_cache()
+            self.uncache_command(ctx.guild.id, command)
             await ctx.reply("Ok")
 
-    @commands.Cog.listener()
+    @message_stage(
+        bots=True, prefix=False,
+        enabled=lambda self, message: bool(self.data.get(message.guild.id))
+    )
     async def on_message(self, message: discord.Message):
-        if not message.guild:
-            return
-
-        if ((data := self.data.get(message.guild.id))
-                and message.author.id != self.bot.user.id
-                and not message.content.startswith(
-                    tuple(self.bot.command_prefix))):
-            count = 0
-            for command in data:
-                if ((data[command]["reply"] and command in message.content)
-                        or command == message.content):
-                    await message.reply(data[command]["content"])
-                    count += 1
-                    if count == 3:
-                        break
+        data, count = self.data[message.guild.id], 0
+        for command in self.automata.matches(message.guild.id, message.content):
+            if data[command]["reply"] or command == message.content:
+                await message.reply(data[command]["content"])
+                count += 1
+                if count == 3:
+                    break
 
 
 async def setup(bot):
@@ -14,7 +14,7 @@ import discord
 
 from bs4 import BeautifulSoup
 
-from util import RT, Table
+from util import RT, Table, message_stage
 
 
 class Yahoo(Table):
@@ -459,12 +459,11 @@ class Person(commands.Cog):
     def is_yt_onoff(self, guild_id: int) -> bool:
         return self.ydata[guild_id].to_dict().get("onoff", True)
 
-    @commands.Cog.listener()
+    @message_stage(
+        enabled=lambda self, message: message.content not in ("あとは", "とは", "あとは？")
+        and self.is_yt_onoff(message.guild.id)
+    )
     async def on_message(self, message):
-        if not message.guild or message.author.bot or not self.is_yt_onoff(message.guild.id) \
-                or message.content in ("あとは", "とは", "あとは？"):
-            return
-
         # もし`OOOとは。`に当てはまるなら押したら検索を行うリアクションを付ける。
         for question in self.QUESTIONS:
             if message.content.endswith(question):
@@ -9,7 +9,7 @@ import discord
 
 from emoji import UNICODE_EMOJI_ENGLISH
 
-from util import RT
+from util import RT, get_webhook
 
 
 class CloseButton(discord.ui.View):
@@ -244,9 +244,7 @@ class Poll(commands.Cog):
         if description != embed.description:
             # もしカウントが変わっているならメッセージを編集する。
             embed.description = description
-            wb = discord.utils.get(
-                await payload.message.channel.webhooks(), name="RT-Tool"
-            )
+            wb = await get_webhook(payload.message.channel, "RT-Tool")
             if wb:
                 try:
                     await wb.edit_message(
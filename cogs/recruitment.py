@@ -6,6 +6,8 @@ import discord
 from asyncio import create_task
 from time import time
 
+from util import get_webhook
+
 
 class Recruitment(commands.Cog):
 
@@ -143,10 +145,7 @@ class Recruitment(commands.Cog):
                     value=members, inline=False
                 )
 
-                webhook = discord.utils.get(
-                    await payload.message.channel.webhooks(),
-                    name="RT-Tool"
-                )
+                webhook = await get_webhook(payload.message.channel, "RT-Tool")
                 await webhook.edit_message(payload.message_id, embed=embed)
         else:
             await payload.message.remove_reaction(self.EMOJI, payload.member)
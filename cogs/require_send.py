@@ -8,6 +8,8 @@ import discord
 from asyncio import Event
 from time import time
 
+from util import message_stage
+
 if TYPE_CHECKING:
     from aiomysql import Pool, Cursor
     from util import Backend
@@ -406,10 +408,12 @@ class RequireSend(commands.Cog, DataManager):
                     async with conn.cursor() as cursor:
                         await self.add_queue(cursor, member.guild.id, 0, member.id)
 
-    @commands.Cog.listener()
+    @message_stage(
+        bots=True, self_messages=True,
+        enabled=lambda self, message: message.channel.id in self.cache.get(message.guild.id, ())
+    )
     async def on_message(self, message: discord.Message):
-        if message.guild and message.channel.id in self.cache.get(message.guild.id, ()):
-            await self.process_check(message)
+        await self.process_check(message)
 
 
 async def setup(bot):
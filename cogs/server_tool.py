@@ -10,6 +10,7 @@ from discord.ext import commands
 import discord
 
 from util.page import EmbedPage
+from util.topic_index import topics
 from data import PERMISSION_TEXTS
 
 
@@ -556,9 +557,8 @@ class ServerTool(commands.Cog):
     @commands.Cog.listener()
     async def on_full_reaction_add(self, payload):
         if (not payload.guild_id or not payload.member or payload.member.bot
-            or not hasattr(payload, "message")
-            or (getattr(payload.message.channel, "topic", "")
-                and "rt>star" in payload.message.channel.topic)):
+                or not hasattr(payload, "message")
+                or "rt>star" in topics.directives(payload.message.channel)):
             return
 
         if (emoji := str(payload.emoji)) in self.EMOJIS["star"]:
@@ -573,13 +573,9 @@ class ServerTool(commands.Cog):
                         else:
                             count += 1
             else:
-                if (channel := discord.utils.find(
-                    lambda ch: ch.topic and "rt>star" in ch.topic,
-                    payload.message.guild.text_channels
-                )):
-                    cache = channel.topic[channel.topic.find("rt>star") + 7:]
+                if (channel := topics.find(payload.message.guild, "rt>star")):
                     try:
-                        require = int(cache if (index := cache.find("\n")) == -1 else cache[:index])
+                        require = int(topics.get(channel, "rt>star"))
                     except ValueError:
                         require = 1
                     if count < require:
@@ -6,6 +6,8 @@ from discord.ext import commands
 import discord
 
 from util.mysql_manager import DatabaseManager
+from util import message_stage
+from util.keywords import KeywordIndex
 from util.page import EmbedPage
 
 
@@ -24,13 +26,7 @@ class DataManager(DatabaseManager):
         )
 
     async def write(self, cursor, guild_id: int, name: str, url: str) -> None:
-        target = {"GuildID": guild_id, "Name": name}
-        change = {"Url": url}
-        if await cursor.exists(self.DB, target):
-            await cursor.update_data(self.DB, change, target)
-        else:
-            target.update(change)
-            await cursor.insert_data(self.DB, target)
+        await cursor.upsert(self.DB, {"Url": url}, {"GuildID": guild_id, "Name": name})
 
     async def delete(self, cursor, guild_id: int, name: str) -> None:
         target = {"GuildID": guild_id, "Name": name}
@@ -40,14 +36,13 @@ class DataManager(DatabaseManager):
             raise KeyError("そのスタンプが見つかりませんでした。")
 
     async def read(self, cursor, guild_id: int) -> Optional[tuple]:
-        target = {"GuildID": guild_id}
-        if await cursor.exists(self.DB, target):
-            return [
-                row
-                async for row in cursor.get_datas(
-                    self.DB, target
-                )
-            ]
+        return [
+            row
+            async for row in cursor.get_datas(
+                self.DB, {"GuildID": guild_id}
+            )
+            if row
+        ] or None
 
     async def reads(self, cursor) -> list:
         return [row async for row in cursor.get_datas(self.DB, {})]
@@ -57,6 +52,7 @@ class Stamp(commands.Cog, DataManager):
     def __init__(self, bot):
         self.bot = bot
         self.cache = {}
+        self.names = KeywordIndex()
         self.bot.loop.create_task(self.on_ready())
 
     async def on_ready(self):
@@ -76,6 +72,9 @@ class Stamp(commands.Cog, DataManager):
                 if row[0] not in self.cache:
                     self.cache[row[0]] = {}
                 self.cache[row[0]][row[1]] = row[2]
+        # スタンプの名前のオートマトンを更新する。
+        for key in (guild_id,) if guild_id else self.cache:
+            self.names.set(key, self.cache.get(key, ()))
 
     @commands.group(
         aliases=["sp", "スタンプ", "すたんぷ"], extras={
@@ -218,6 +217,7 @@ class Stamp(commands.Cog, DataManager):
         if name in self.cache.get(ctx.guild.id, {}):
             await self.delete(ctx.guild.id, name)
             del self.cache[ctx.guild.id][name]
+            self.names.remove(ctx.guild.id, name)
             await ctx.reply("Ok")
         else:
             await ctx.reply(
@@ -225,17 +225,12 @@ class Stamp(commands.Cog, DataManager):
                  "en": "The stamp has not registered yet."}
             )
 
-    @commands.Cog.listener()
+    @message_stage(
+        prefix=False, enabled=lambda self, message: bool(self.cache.get(message.guild.id))
+    )
     async def on_message(self, message: discord.Message):
-        if (message.guild and not message.author.bot
-                and (data := self.cache.get(message.guild.id))
-                and not message.content.startswith(
-                    tuple(self.bot.command_prefix)
-                )):
-            for name in data:
-                if name in message.content:
-                    await message.channel.send(data[name])
-                    break
+        if (names := self.names.matches(message.guild.id, message.content)):
+            await message.channel.send(self.cache[message.guild.id][names[0]])
 
 
 async def setup(bot):
@@ -7,7 +7,8 @@ from jishaku.functools import executor_function
 from asyncio import sleep
 import deep_translator
 
-from util import RT
+from util import RT, message_stage
+from util.topic_index import topics
 
 
 CHP_HELP = {
@@ -49,6 +50,9 @@ It's in the personal category with the `translate` command.""")
 
 
 class Translator(commands.Cog):
+
+    DIRECTIVES = ("rf>translate", "rf>tran", "rf>翻訳", "rf>ほんやく")
+
     def __init__(self, bot: RT):
         self.bot = bot
         self.bot.loop.create_task(self.on_command_added())
@@ -148,20 +152,19 @@ class Translator(commands.Cog):
         except deep_translator.exceptions.LanguageNotSupportedException:
             await ctx.reply("その言語は対応していません。")
 
-    @commands.Cog.listener()
+    @message_stage(bots=True, threads=False, topic=DIRECTIVES)
     async def on_message(self, message: discord.Message):
-        if isinstance(message.channel, discord.Thread):
-            return
-        if ((message.author.bot and not (
+        if message.author.bot and not (
             message.author.discriminator == "0000" and " #" in message.author.name
-        )) or not message.guild or not message.channel.topic):
+        ):
             return
 
-        for line in message.channel.topic.splitlines():
-            if line.startswith(("rf>translate", "rf>tran", "rf>翻訳", "rf>ほんやく")):
-                if 1 < len((splited := line.split())):
+        directives = topics.directives(message.channel)
+        for directive in self.DIRECTIVES:
+            if directive in directives:
+                if (language := directives[directive].split()):
                     try:
-                        message.content = f"{splited[1]} {message.content}"
+                        message.content = f"{language[0]} {message.content}"
                         await self.translate_.invoke(
                             ctx := await self.bot.get_context(message)
                         )
@@ -13,10 +13,10 @@ import discord
 from aiofiles.os import remove
 
 from util.slash import UnionContext
-from util import RT, Table
+from util import RT, Table, message_stage
 from util import TimeoutView
 
-from .agents import AGENTS
+from .agents import AGENTS, pool
 from .voice import OUTPUT_DIRECTORY
 from .manager import Manager
 
@@ -84,6 +84,9 @@ class TTSCog(commands.Cog, name="TTS"):
         self.user = TTSUserData(self.bot)
         self.guild = TTSGuildData(self.bot)
         self.auto_leave.start()
+        # 音声合成のワーカーを起動して辞書と音声を読み込ませておく。
+        self.bot.loop.create_task(pool.warm(), name="TTS: Warm up synthesis workers")
+        self.check_workers.start()
 
         self.RTCHAN = self.bot.user.id == 888635684552863774
         global OPENJTALK
@@ -472,12 +475,13 @@ class TTSCog(commands.Cog, name="TTS"):
         else:
             await ctx.reply({"ja": "見つかりませんでした。", "en": "Not found"})
 
-    @commands.Cog.listener()
+    @message_stage(
+        bots=True, self_messages=True, content=True, prefix=False,
+        enabled=lambda self, message: message.guild.id in self.now
+        and self.now[message.guild.id].check_channel(message.channel.id)
+    )
     async def on_message(self, message: discord.Message):
-        if message.guild and message.content and message.guild.id in self.now \
-                and self.now[message.guild.id].check_channel(message.channel.id) \
-                and not message.content.startswith(tuple(self.bot.command_prefix)):
-            await self.now[message.guild.id].add(message)
+        await self.now[message.guild.id].add(message)
 
     @commands.Cog.listener()
     async def on_voice_abandoned(self, voice_client: discord.VoiceClient):
@@ -494,6 +498,12 @@ class TTSCog(commands.Cog, name="TTS"):
             if all(member.bot for member in voice_client.channel.members):
                 self.bot.dispatch("voice_abandoned", voice_client)
 
+    @tasks.loop(minutes=1)
+    async def check_workers(self):
+        # 音声合成のワーカーが動いているかを確認して、動いていないのなら作り直す。
+        if not await pool.check():
+            self.bot.print("[TTS] Restarted synthesis workers:", pool)
+
     def clean(self, manager: Manager, reason: Optional[Any] = None) -> None:
         "渡されたManagerの後始末をします。"
         self.bot.loop.create_task(manager.disconnect(reason)) \
@@ -501,6 +511,8 @@ class TTSCog(commands.Cog, name="TTS"):
 
     def cog_unload(self):
         self.auto_leave.cancel()
+        self.check_workers.cancel()
+        pool.close()
         for manager in list(self.now.values()):
             self.clean(manager, {
                 "ja": "再起動または機能更新のため切断しました。",
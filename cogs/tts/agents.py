@@ -6,8 +6,10 @@ from typing import Literal, Union, Optional
 from enum import Enum
 
 from subprocess import Popen, TimeoutExpired, PIPE
-from asyncio import get_running_loop
+from asyncio import TimeoutError, create_subprocess_exec, get_running_loop, wait_for
 from os.path import exists
+from time import perf_counter
+from io import BytesIO
 
 from re import sub, findall
 
@@ -23,6 +25,10 @@ from aiohttp import ClientSession
 from bs4 import BeautifulSoup
 from ujson import load, dumps
 
+from .cache import cache
+from .workers import SynthesisPool
+from .source import PCMSource
+
 
 ENG2KANA_DATA_PATH = "cogs/tts/data/eng2kana.json"
 "英語からカタカナに変換されている辞書があるJSONファイルです。"
@@ -40,6 +46,8 @@ AGENTS_JSON = "cogs/tts/data/avaliable_voices.json"
 "使用可能な音声の情報が書いてあるJSONファイルのパスです。"
 AGENTS: dict[str, Agent] = {}
 "使用可能なAgentの辞書です。"
+Audio = Union[str, bytes]
+"音声合成の結果です。ファイルのパスかwavなどのバイト列です。"
 
 
 class VoiceTypes(Enum):
@@ -50,10 +58,13 @@ class VoiceTypes(Enum):
     gtts = 3
 
 
+VOLUMES = {VoiceTypes.openjtalk: 5.5, VoiceTypes.aquestalk: 2.2, VoiceTypes.gtts: 5.5}
+"音声合成に使うものごとの音量です。"
+
 with open(ALLOWED_CHARACTERS_CSV, "r", encoding="utf8") as f:
     ALLOWED_CHARACTERS = tuple(f.read().split())
     "AquesTalkで使える文字のタプル"
-Source = Union[discord.FFmpegOpusAudio, discord.FFmpegPCMAudio]
+Source = Union[discord.FFmpegOpusAudio, discord.FFmpegPCMAudio, PCMSource]
 
 # 英語とカタカナの辞書を読み込んでおく。
 eng2kanaData: dict[str, str] = {}
@@ -162,10 +173,16 @@ class Agent:
         self.emoji = emoji
 
     async def synthe(self, text: str, path: str) -> Optional[Source]:
-        "音声合成を行います。"
-        text = await adjust_text(text)
-        if text:
-            return await globals()[self.type.name](text, path, self.agent)
+        """音声合成を行います。  
+        同じ音声で同じ文章の音声合成をしたことがある場合は、キャッシュにある音声を使います。"""
+        if (cached := await cache.get(self.code, text)) is not None:
+            return prepare_source(cached, VOLUMES[self.type])
+        start = perf_counter()
+        adjusted = await adjust_text(text)
+        if adjusted:
+            audio: Audio = await globals()[self.type.name](adjusted, path, self.agent)
+            await cache.put(self.code, text, audio, perf_counter() - start)
+            return prepare_source(audio, VOLUMES[self.type])
 
     @property
     def code(self) -> str:
@@ -186,13 +203,20 @@ with open(AGENTS_JSON, "r", encoding="utf8") as f:
             )
 
 
+pool = SynthesisPool(tuple(
+    f"{OPENJTALK_VOICE_DIRECTORY}/{agent.agent}.htsvoice" for agent in AGENTS.values()
+    if agent.type == VoiceTypes.openjtalk
+))
+"OpenJTalkの音声合成をするワーカーのプロセスプールです。"
+
+
 class SyntheError(Exception):
     "音声合成失敗時に発生するエラーです。"
 
 
 @executor_function
 def _synthe(log_name: str, commands: str, text: str):
-    # 音声合成のコマンドを実行します。
+    # 音声合成のコマンドを実行します。`pyopenjtalk`で音声合成ができない場合に使われます。
     proc = Popen(commands, stdin=PIPE, stdout=PIPE, stderr=PIPE, shell=True)
     try:
         _, stderr_ = proc.communicate(bytes(text, encoding="utf-8"), 5)
@@ -204,12 +228,18 @@ def _synthe(log_name: str, commands: str, text: str):
             raise SyntheError(f"{log_name}: 音声合成に失敗しました。ERR:{stderr_}")
 
 
-def prepare_source(path: str, volume: float = 5.5) -> Source:
-    "Sourceを作ります。"
+def prepare_source(path: Audio, volume: float = 5.5) -> Source:
+    """Sourceを作ります。`path`はファイルのパスか音声のバイト列です。  
+    wavのバイト列はFFmpegを使わずにメモリから再生し、それ以外はFFmpegで再生します。"""
+    pipe = isinstance(path, bytes)
+    if pipe:
+        if discord.opus.is_loaded() and (source := PCMSource.from_wav(path, volume)) is not None:
+            return source
+        path = BytesIO(path)
     return discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(
-        path, options=f'-filter:a "volume={volume}"'
+        path, pipe=pipe, options=f'-filter:a "volume={volume}"'
     )) if discord.opus.is_loaded() else discord.FFmpegOpusAudio(
-        path, options=f'-filter:a "volume={volume}"'
+        path, pipe=pipe, options=f'-filter:a "volume={volume}"'
     )
 
 
@@ -221,7 +251,20 @@ AQUESTALK_REPLACE_CHARACTERS = {
 "AquesTalkで読めない文字の置き換えに使う辞書"
 
 
-async def aquestalk(text: str, path: str, agent: Union[Literal["f1", "f2"], str]) -> Source:
+async def _run(log_name: str, args: tuple[str, ...], text: str) -> bytes:
+    # シェルを使わずにコマンドを実行して、標準出力に出力された音声を返す。
+    proc = await create_subprocess_exec(*args, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    try:
+        stdout, stderr_ = await wait_for(proc.communicate(bytes(text, encoding="utf-8")), 5)
+    except TimeoutError:
+        proc.kill()
+        raise SyntheError(f"{log_name}: 音声合成に失敗しました。ERR:TimeoutExpired")
+    if stderr_ or not stdout:
+        raise SyntheError(f"{log_name}: 音声合成に失敗しました。ERR:{stderr_}")
+    return stdout
+
+
+async def aquestalk(text: str, path: str, agent: Union[Literal["f1", "f2"], str]) -> Audio:
     "AquesTalkで音声合成をします。"
     # AquesTalk用に文字列を調整する。
     for char in AQUESTALK_REPLACE_CHARACTERS:
@@ -238,32 +281,31 @@ async def aquestalk(text: str, path: str, agent: Union[Literal["f1", "f2"], str]
         new_text += char
 
     # 音声合成をする。
-    await _synthe(
-        f"AquesTalk[{agent}]", f"./{f'{AQUESTALK_DIRECTORY}/{agent}'} 130 > {path}", text
-    )
-
-    return prepare_source(path, 2.2)
+    return await _run(f"AquesTalk[{agent}]", (f"./{AQUESTALK_DIRECTORY}/{agent}", "130"), text)
 
 
 #   OpenJTalk
-async def openjtalk(text: str, path: str, agent: str) -> Source:
+async def openjtalk(text: str, path: str, agent: str) -> Audio:
     "OpenJTalkで音声合成を行います。"
+    if pool.available:
+        return await pool.openjtalk(text, f"{OPENJTALK_VOICE_DIRECTORY}/{agent}.htsvoice")
     await _synthe(
         f"OpenJTalk[{agent}]",
         f"""{OPENJTALK} -x {OPENJTALK_DICTIONARY}
             -m {f'{OPENJTALK_VOICE_DIRECTORY}/{agent}.htsvoice'} -r 1.0 -ow {path}""".replace("\n", ""),
         text
     )
-    return prepare_source(path)
+    return path
 
 
 #   gTTS
 @executor_function
-def _gtts(text: str, path: str, agent: str):
-    gTTS(text, lang=agent).save(path)
+def _gtts(text: str, agent: str) -> bytes:
+    with BytesIO() as buffer:
+        gTTS(text, lang=agent).write_to_fp(buffer)
+        return buffer.getvalue()
 
 
-async def gtts(text: str, path: str, agent: str) -> Source:
+async def gtts(text: str, path: str, agent: str) -> Audio:
     "gTTSを使用して音声合成をします。"
-    await _gtts(text, path, agent)
-    return prepare_source(path)
+    return await _gtts(text, agent)
@@ -0,0 +1,208 @@
+# Free RT TTS - Cache
+
+"""音声合成の結果のキャッシュです。
+挨拶や同じ言葉の繰り返しはよく読み上げられるので、音声と文章が同じなら前に作った音声を使い回します。
+キーは音声のコードとサーバー辞書を適用した後の文章のハッシュで、キャッシュにあれば文章の調整も音声合成もしません。
+音声はディスクに保存され、合計の大きさが`max_disk_size`を超えるか`max_age`秒使われなかったものから削除されます。
+よく使われる小さい音声はメモリにも置かれます。ヒット率などは`rf!debug tts`で見ることができます。"""
+
+from __future__ import annotations
+
+from typing import Optional, Union
+
+from collections import OrderedDict
+from hashlib import sha1
+from os import link, makedirs, remove, scandir, utime
+from os.path import getsize
+from shutil import copyfile
+from time import time
+
+from jishaku.functools import executor_function
+from aiofiles import open as aioopen
+
+
+CACHE_DIRECTORY = "cogs/tts/outputs/cache"
+"音声合成の結果を保存するフォルダです。"
+
+
+class Entry:
+    "ディスクにある音声の情報です。"
+
+    __slots__ = ("path", "size", "used", "cost")
+
+    def __init__(self, path: str, size: int, used: float, cost: Optional[float] = None):
+        self.path, self.size, self.used, self.cost = path, size, used, cost
+
+
+@executor_function
+def _store(source: str, destination: str) -> None:
+    # 音声合成で作ったファイルをキャッシュのフォルダに入れる。
+    # ハードリンクにすれば元のファイルが削除されてもコピーせずに残せる。
+    try:
+        link(source, destination)
+    except OSError:
+        copyfile(source, destination)
+
+
+class SynthesisCache:
+    """音声合成の結果のキャッシュです。
+
+    Parameters
+    ----------
+    directory : str, default CACHE_DIRECTORY
+        音声を保存するフォルダです。
+    max_disk_size : int, default 256MB
+        ディスクに保存する音声の合計の大きさの上限です。
+    max_age : float, default 7日
+        使われなかった音声を削除するまでの秒数です。
+    max_memory_size : int, default 16MB
+        メモリに置く音声の合計の大きさの上限です。
+    max_memory_clip : int, default 512KB
+        メモリに置く音声一つの大きさの上限です。"""
+
+    def __init__(
+        self, directory: str = CACHE_DIRECTORY, max_disk_size: int = 256 * 1024 * 1024,
+        max_age: float = 7 * 24 * 60 * 60, max_memory_size: int = 16 * 1024 * 1024,
+        max_memory_clip: int = 512 * 1024
+    ):
+        self.directory, self.max_disk_size, self.max_age = directory, max_disk_size, max_age
+        self.max_memory_size, self.max_memory_clip = max_memory_size, max_memory_clip
+        # 使われた順に並んでいるので、先頭から削除していく。
+        self.entries: OrderedDict[str, Entry] = OrderedDict()
+        self.memory: OrderedDict[str, bytes] = OrderedDict()
+        self.disk_size = self.memory_size = 0
+        self.memory_hits = self.disk_hits = self.misses = 0
+        self.saved = self.spent = 0.0
+        self._scanned = False
+
+    @staticmethod
+    def key(code: str, text: str) -> str:
+        "音声のコードと文章からキーを作ります。"
+        return sha1(f"{code}\n{text}".encode()).hexdigest()
+
+    def _scan(self) -> None:
+        # 前に保存された音声を最後に使われた順に読み込む。
+        self._scanned = True
+        makedirs(self.directory, exist_ok=True)
+        files = []
+        with scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".wav"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name[:-4], entry.path, stat.st_size))
+        for used, key, path, size in sorted(files):
+            self.entries[key] = Entry(path, size, used)
+            self.disk_size += size
+        self._evict()
+
+    def _discard(self, key: str) -> None:
+        # 音声をキャッシュから削除する。
+        entry = self.entries.pop(key)
+        self.disk_size -= entry.size
+        if (data := self.memory.pop(key, None)) is not None:
+            self.memory_size -= len(data)
+        try:
+            remove(entry.path)
+        except OSError:
+            ...
+
+    def _evict(self) -> None:
+        # 大きさの上限を超えている間と、使われていない音声を古い順に削除する。
+        deadline = time() - self.max_age
+        while self.entries and (
+            self.disk_size > self.max_disk_size
+            or next(iter(self.entries.values())).used < deadline
+        ):
+            self._discard(next(iter(self.entries)))
+
+    def _remember(self, key: str, data: bytes) -> None:
+        # メモリに音声を置く。
+        if len(data) > self.max_memory_clip:
+            return
+        if (old := self.memory.pop(key, None)) is not None:
+            self.memory_size -= len(old)
+        self.memory[key] = data
+        self.memory_size += len(data)
+        while self.memory_size > self.max_memory_size:
+            self.memory_size -= len(self.memory.popitem(last=False)[1])
+
+    @property
+    def average_cost(self) -> float:
+        "音声合成にかかった時間の平均です。"
+        return self.spent / self.misses if self.misses else 0.0
+
+    async def get(self, code: str, text: str) -> Optional[Union[str, bytes]]:
+        """キャッシュされた音声を取得します。ない場合は`None`を返します。
+        メモリにある音声はバイト列で、ディスクにしかない音声はファイルのパスで返します。"""
+        if not self._scanned:
+            self._scan()
+        key = self.key(code, text)
+        if (entry := self.entries.get(key)) is None or entry.used < time() - self.max_age:
+            return None
+        entry.used = time()
+        self.entries.move_to_end(key)
+        self.saved += self.average_cost if entry.cost is None else entry.cost
+        if (data := self.memory.get(key)) is not None:
+            self.memory_hits += 1
+            self.memory.move_to_end(key)
+            return data
+        self.disk_hits += 1
+        try:
+            utime(entry.path)
+            if entry.size <= self.max_memory_clip:
+                # 二回目に使われた音声はよく使われる音声としてメモリに置く。
+                async with aioopen(entry.path, "rb") as f:
+                    self._remember(key, data := await f.read())
+                return data
+        except OSError:
+            # 外から削除された場合はキャッシュになかったことにする。
+            self.disk_hits -= 1
+            self._discard(key)
+            return None
+        return entry.path
+
+    async def put(self, code: str, text: str, audio: Union[str, bytes], cost: float) -> None:
+        """音声合成で作ったファイルか音声のバイト列をキャッシュに入れます。  
+        `cost`は音声合成にかかった秒数です。"""
+        if not self._scanned:
+            self._scan()
+        self.misses += 1
+        self.spent += cost
+        key = self.key(code, text)
+        if key in self.entries:
+            self._discard(key)
+        destination = f"{self.directory}/{key}.wav"
+        try:
+            if isinstance(audio, bytes):
+                async with aioopen(destination, "wb") as f:
+                    await f.write(audio)
+            else:
+                await _store(audio, destination)
+            size = getsize(destination)
+        except OSError:
+            return
+        self.entries[key] = Entry(destination, size, time(), cost)
+        self.disk_size += size
+        self._evict()
+
+    def report(self) -> str:
+        "ヒット率などのレポートを作ります。"
+        total = self.memory_hits + self.disk_hits + self.misses
+        return "\n".join((
+            f"Hit rate: {(self.memory_hits + self.disk_hits) / total * 100 if total else 0:.1f}% "
+            f"(memory={self.memory_hits} disk={self.disk_hits} miss={self.misses})",
+            f"Saved: {self.saved:.1f}s Synthesis: {self.spent:.1f}s "
+            f"(average {self.average_cost * 1000:.0f}ms)",
+            f"Disk: {len(self.entries)} clips {self.disk_size / 1024 / 1024:.1f}MB "
+            f"/ {self.max_disk_size / 1024 / 1024:.0f}MB",
+            f"Memory: {len(self.memory)} clips {self.memory_size / 1024 / 1024:.1f}MB "
+            f"/ {self.max_memory_size / 1024 / 1024:.0f}MB"
+        ))
+
+    def __str__(self) -> str:
+        return (f"<SynthesisCache clips={len(self.entries)} memory={len(self.memory)} "
+                f"hits={self.memory_hits + self.disk_hits} misses={self.misses}>")
+
+
+cache = SynthesisCache()
+"音声合成の結果のキャッシュです。"
@@ -4,7 +4,8 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING, Optional, Any
 
-from asyncio import Task
+from asyncio import CancelledError, Semaphore, Task
+from time import perf_counter
 
 import discord
 
@@ -15,6 +16,53 @@ if TYPE_CHECKING:
 
 
 EMOJI_ERROR = "<:error:878914351338246165>"
+LOOKAHEAD = 3
+"再生を待っている間に先に音声合成をしておくキューの数です。"
+GUILD_CONCURRENCY = 2
+"一つのサーバーで同時に行う音声合成の数の上限です。"
+SYNTHESIS_WORKERS = 4
+"全てのサーバーで同時に行う音声合成の数の上限です。"
+_workers: Optional[Semaphore] = None
+
+
+def get_workers() -> Semaphore:
+    "全てのサーバーで共有する音声合成の同時実行数のセマフォを取得します。"
+    global _workers
+    if _workers is None:
+        _workers = Semaphore(SYNTHESIS_WORKERS)
+    return _workers
+
+
+class Metrics:
+    "読み上げのキューの待ち時間などの統計です。"
+
+    def __init__(self):
+        self.played = self.synthesized = self.failed = 0
+        self.wait_total = self.wait_max = self.synthe_total = self.synthe_max = 0.0
+
+    def on_synthesized(self, elapsed: float) -> None:
+        self.synthesized += 1
+        self.synthe_total += elapsed
+        self.synthe_max = max(self.synthe_max, elapsed)
+
+    def on_played(self, waited: float) -> None:
+        self.played += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def report(self) -> str:
+        "統計のレポートを作ります。"
+        return "\n".join((
+            f"Queue wait: average {self.wait_total / (self.played or 1) * 1000:.0f}ms "
+            f"max {self.wait_max * 1000:.0f}ms (played={self.played})",
+            f"Synthesis: average {self.synthe_total / (self.synthesized or 1) * 1000:.0f}ms "
+            f"max {self.synthe_max * 1000:.0f}ms (done={self.synthesized} failed={self.failed})",
+            f"Workers: {SYNTHESIS_WORKERS} Per guild: {GUILD_CONCURRENCY} Lookahead: {LOOKAHEAD}"
+        ))
+
+
+metrics = Metrics()
+"読み上げのキューの統計です。"
 
 
 async def try_add_reaction(message: discord.Message, emoji: str):
@@ -36,14 +84,17 @@ class ExtendedVoice(Voice):
 
 
 class Manager:
-    "読み上げを管理するためのクラスです。"
+    """読み上げを管理するためのクラスです。  
+    メッセージは来た順にキューに入れられ、先頭から`LOOKAHEAD`個は再生を待っている間に先に音声合成がされます。"""
 
     def __init__(self, cog: TTSCog, guild: discord.Guild):
         self.cog, self.guild = cog, guild
         self.vc: discord.VoiceClient = guild.voice_client
         self.queues: list[Voice] = []
         self.channels: list[int] = []
+        self.semaphore = Semaphore(GUILD_CONCURRENCY)
         self._closing = False
+        self._waiting: Optional[Voice] = None
 
     def add_channel(self, channel_id: int) -> None:
         "読み上げチャンネルを追加します。"
@@ -77,21 +128,28 @@ class Manager:
         except Exception:
             ...
 
+    async def _synthe(self, voice: Voice) -> None:
+        # サーバーごとと全体の同時実行数の制限の中で音声合成をする。
+        async with self.semaphore:
+            async with get_workers():
+                start = perf_counter()
+                await voice.synthe()
+                metrics.on_synthesized(perf_counter() - start)
+
+    def prefetch(self) -> None:
+        "キューの先頭から`LOOKAHEAD`個のまだ始めていない音声合成を始めます。"
+        for voice in self.queues[:LOOKAHEAD]:
+            if voice.task is None:
+                voice.task = self.cog.bot.loop.create_task(
+                    self._synthe(voice), name=f"{self}: Voice synthesis"
+                )
+
     async def add(self, message: discord.Message):
         "渡されたメッセージを読み上げキューに追加します。"
-        queue = ExtendedVoice(self, message)
-        try:
-            await queue.synthe()
-        except Exception as e:
-            if self.cog.bot.test:
-                await try_add_reaction(message, EMOJI_ERROR)
-            self.print("Failed to do voice synthesis:", f"{e.__class__.__name__} - {e}")
-        else:
-            self.queues.append(queue)
-            try:
-                self.queues[1]
-            except IndexError:
-                self.play()
+        self.queues.append(ExtendedVoice(self, message))
+        self.prefetch()
+        if len(self.queues) == 1:
+            self.play()
 
     async def _after(self, e: Optional[Exception]):
         if self.queues:
@@ -106,8 +164,34 @@ class Manager:
             del self.queues[0]
             self.play()
 
+    def _on_synthe_failed(self, voice: Voice, e: BaseException) -> None:
+        # 音声合成に失敗した音声をキューから消す。
+        metrics.failed += 1
+        if self.cog.bot.test:
+            self.cog.bot.loop.create_task(
+                try_add_reaction(voice.message, EMOJI_ERROR),
+                name=f"{self}: Try add error reaction"
+            )
+        self.print("Failed to do voice synthesis:", f"{e.__class__.__name__} - {e}")
+        self.queues.remove(voice)
+        self.clean(voice)
+
     def play(self):
         if self.queues:
+            self.prefetch()
+            voice = self.queues[0]
+            if not voice.task.done():
+                # 音声合成が終わったら再生する。
+                if self._waiting is not voice:
+                    self._waiting = voice
+                    voice.task.add_done_callback(lambda _: self.play())
+                return
+            self._waiting = None
+            error = CancelledError() if voice.task.cancelled() else voice.task.exception()
+            if error is not None:
+                self._on_synthe_failed(voice, error)
+                return self.play()
+            metrics.on_played(perf_counter() - voice.queued_at)
             self.print("Play voice:", self.queues[0])
             if self.queues[0].source is None:
                 # 普通ないがもしsourceが用意されていないのなら再生をしない。
@@ -129,6 +213,8 @@ class Manager:
 
     def __del__(self):
         for queue in self.queues:
+            if queue.task is not None and not queue.task.done():
+                queue.task.cancel()
             self.clean(queue)
 
     def __str__(self):
@@ -0,0 +1,81 @@
+# Free RT TTS - Source
+
+"""FFmpegとファイルを使わずにメモリにある音声を再生するためのSourceです。
+音声合成の結果のwavを48kHzのステレオにリサンプリングして音量を調整し、そのまま`discord.AudioSource`として渡します。
+メッセージごとのファイルの読み書きとFFmpegのプロセスの起動がなくなります。
+wavではない音声(gTTSのmp3など)やNumPyがない場合は`None`を返すので、その場合はFFmpegを使ってください。"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from io import BytesIO
+import wave
+
+import discord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+SAMPLING_RATE = 48000
+"Discordに送る音声のサンプリングレートです。"
+FRAME_SIZE = SAMPLING_RATE // 50 * 2 * 2
+"20ミリ秒分の48kHzで16bitのステレオのPCMのバイト数です。"
+
+
+def wav_to_pcm(data: bytes, volume: float = 1.0) -> Optional[bytes]:
+    """wavを48kHzで16bitのステレオのPCMにします。音量は`volume`倍になります。
+    変換できない音声の場合は`None`を返します。"""
+    if numpy is None:
+        return None
+    try:
+        with wave.open(BytesIO(data), "rb") as file:
+            channels, width, rate = \
+                file.getnchannels(), file.getsampwidth(), file.getframerate()
+            frames = file.readframes(file.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if width != 2 or channels not in (1, 2) or not rate:
+        return None
+    samples = numpy.frombuffer(frames, "<i2").astype(numpy.float32)
+    if channels == 2:
+        samples = samples.reshape(-1, 2).mean(axis=1)
+    if rate != SAMPLING_RATE and len(samples):
+        # 線形補間でリサンプリングする。
+        samples = numpy.interp(
+            numpy.arange(len(samples) * SAMPLING_RATE // rate) * (rate / SAMPLING_RATE),
+            numpy.arange(len(samples)), samples
+        )
+    samples = (samples * volume).clip(-32768, 32767).astype("<i2")
+    return numpy.repeat(samples, 2).tobytes()
+
+
+class PCMSource(discord.AudioSource):
+    "メモリにある48kHzで16bitのステレオのPCMを再生するSourceです。"
+
+    def __init__(self, pcm: bytes):
+        self.pcm, self.position = memoryview(pcm), 0
+
+    @classmethod
+    def from_wav(cls, data: bytes, volume: float = 1.0) -> Optional[PCMSource]:
+        "wavからSourceを作ります。変換できない音声の場合は`None`を返します。"
+        if (pcm := wav_to_pcm(data, volume)) is None:
+            return None
+        return cls(pcm)
+
+    def read(self) -> bytes:
+        frame = self.pcm[self.position:self.position + FRAME_SIZE]
+        self.position += FRAME_SIZE
+        if not frame:
+            return b""
+        # 最後のフレームが短い場合は無音で埋める。
+        return bytes(frame) + bytes(FRAME_SIZE - len(frame))
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self.pcm = memoryview(b"")
@@ -4,6 +4,10 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING, Optional
 
+from asyncio import Task
+from os.path import exists
+from time import perf_counter
+
 import discord
 
 from aiofiles.os import remove
@@ -25,6 +29,9 @@ class Voice:
     def __init__(self, manager: Manager, message: discord.Message):
         self.cog, self.message, self.manager = manager.cog, message, manager
         self.source: Optional[Source] = None
+        # 音声合成をしているタスクと、キューに追加された時間です。
+        self.task: Optional[Task] = None
+        self.queued_at = perf_counter()
 
     def print(self, *args, **kwargs):
         self.manager.print(f"[{self}]", *args, **kwargs)
@@ -61,6 +68,9 @@ class Voice:
         self.print("Doing voice synthesis...: ", code)
         self.source = await Agent.from_agent_code(code) \
             .synthe(self.adjust_text(self.message.content), self.path)
+        if not exists(self.path):
+            # ファイルを使わずに音声合成をした場合は削除するものがない。
+            self.path = None
 
     async def close(self) -> None:
         "音声合成で作成したファイルを削除します。"
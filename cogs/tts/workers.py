@@ -0,0 +1,197 @@
+# Free RT TTS - Workers
+
+"""OpenJTalkの音声合成を常駐するプロセスで行うためのプロセスプールです。
+以前はメッセージごとにシェルと`open_jtalk`のプロセスを起動していたので、毎回辞書と音声の読み込みが行われていました。
+ここではプロセスプールのワーカーが起動時に`pyopenjtalk`の辞書と音声を読み込み、それを使い回して音声合成をします。
+音声はwavのバイト列としてパイプで返され、一時ファイルは使いません。
+ワーカーが落ちたり応答しなくなった場合はプールを作り直します。"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Optional, TypeVar
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from asyncio import TimeoutError, gather, get_running_loop, wait_for
+from functools import partial
+from io import BytesIO
+from os import getpid
+import multiprocessing
+import wave
+
+try:
+    from pyopenjtalk.htsengine import HTSEngine
+    from pyopenjtalk import extract_fullcontext
+except ImportError:
+    # 古い`pyopenjtalk`には音声を指定して音声合成をする方法がない。
+    HTSEngine = None
+
+
+ResultT = TypeVar("ResultT")
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+"ワーカーのプロセスの起動方法です。"
+
+
+#   ワーカーのプロセスで実行されるもの
+_engines: dict[str, Any] = {}
+
+
+def _get_engine(voice: str) -> Any:
+    # 音声のファイルを読み込んだ`HTSEngine`を取得する。
+    if (engine := _engines.get(voice)) is None:
+        engine = _engines[voice] = HTSEngine(voice.encode())
+    return engine
+
+
+def warm_worker(voices: tuple[str, ...]) -> None:
+    "ワーカーの起動時に辞書と音声を読み込んでおきます。"
+    extract_fullcontext("あ")
+    for voice in voices:
+        _get_engine(voice)
+
+
+def ping() -> int:
+    "ワーカーが動いているかの確認に使います。プロセスIDを返します。"
+    return getpid()
+
+
+def synthe_openjtalk(text: str, voice: str) -> bytes:
+    "OpenJTalkで音声合成をしてwavのバイト列を返します。"
+    engine = _get_engine(voice)
+    samples = engine.synthesize(extract_fullcontext(text))
+    with BytesIO() as buffer:
+        with wave.open(buffer, "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(engine.get_sampling_frequency())
+            file.writeframes(samples.clip(-32768, 32767).astype("<i2").tobytes())
+        return buffer.getvalue()
+
+
+#   ボットのプロセスで使うもの
+class SynthesisPool:
+    """音声合成のワーカーのプロセスプールです。
+
+    Parameters
+    ----------
+    voices : tuple[str, ...]
+        ワーカーの起動時に読み込んでおく音声のファイルのパスです。
+    workers : int, default 2
+        ワーカーの数です。
+    timeout : float, default 10.0
+        音声合成を諦めるまでの秒数です。"""
+
+    def __init__(self, voices: tuple[str, ...], workers: int = 2, timeout: float = 10.0):
+        self.voices, self.workers, self.timeout = voices, workers, timeout
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.restarts = 0
+
+    @property
+    def available(self) -> bool:
+        "このプールを使って音声合成ができるかどうかです。"
+        return HTSEngine is not None
+
+    def _start(self) -> ProcessPoolExecutor:
+        # プロセスプールを作る。
+        if self.executor is None:
+            # forkだと動いているボットのイベントループやソケットまで複製されるので、新しいプロセスから始める。
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context(START_METHOD),
+                initializer=warm_worker, initargs=(self.voices,)
+            )
+        return self.executor
+
+    def restart(self) -> None:
+        "ワーカーを全て止めてプロセスプールを作り直します。"
+        if self.executor is not None:
+            # 応答しなくなったワーカーは終わるのを待たずに止める。
+            for process in list(getattr(self.executor, "_processes", {}).values()):
+                process.kill()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self.restarts += 1
+        self._start()
+
+    async def run(self, function: Callable[..., ResultT], *args: Any, retry: bool = True) -> ResultT:
+        "ワーカーで関数を実行します。プロセスプールが壊れている場合は作り直してもう一度実行します。"
+        try:
+            return await wait_for(
+                get_running_loop().run_in_executor(self._start(), partial(function, *args)),
+                self.timeout
+            )
+        except BrokenProcessPool:
+            self.restart()
+            if retry:
+                return await self.run(function, *args, retry=False)
+            raise
+        except TimeoutError:
+            self.restart()
+            raise
+
+    async def warm(self) -> None:
+        "全てのワーカーを起動して辞書と音声を読み込ませます。"
+        if self.available:
+            await gather(*(self.run(ping) for _ in range(self.workers)))
+
+    async def check(self) -> bool:
+        "ワーカーが動いているかを確認します。動いていない場合はプロセスプールを作り直します。"
+        if self.executor is None:
+            return True
+        try:
+            await self.run(ping, retry=False)
+        except Exception:
+            # `run`が既にプロセスプールを作り直している。
+            return False
+        return True
+
+    async def openjtalk(self, text: str, voice: str) -> bytes:
+        "OpenJTalkで音声合成をしてwavのバイト列を返します。"
+        return await self.run(synthe_openjtalk, text, voice)
+
+    def close(self) -> None:
+        "プロセスプールを終了します。"
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def __str__(self) -> str:
+        return (f"<SynthesisPool workers={self.workers} running={self.executor is not None} "
+                f"restarts={self.restarts}>")
+
+
+if __name__ == "__main__":
+    # 以前のメッセージごとにシェルから`open_jtalk`を実行する方法と、一回あたりの時間を比べます。
+    # 使い方: python -m cogs.tts.workers [htsvoiceのパス]
+    from subprocess import run
+    from tempfile import TemporaryDirectory
+    from time import perf_counter
+    from asyncio import run as run_async
+    import sys
+
+    VOICE = sys.argv[1] if len(sys.argv) > 1 else "cogs/tts/lib/OpenJTalk/mei.htsvoice"
+    TEXTS = ("こんにちは", "きょうはいいてんきですね", "よみあげのテストです、よろしくおねがいします") * 5
+
+    with TemporaryDirectory() as directory:
+        start = perf_counter()
+        for text in TEXTS:
+            run(
+                f"open_jtalk -x cogs/tts/lib/OpenJTalk/dic -m {VOICE} -r 1.0 "
+                f"-ow {directory}/output.wav", input=text.encode(), shell=True, check=True
+            )
+        print(f"shell open_jtalk: {(perf_counter() - start) / len(TEXTS) * 1000:7.1f}ms/utterance")
+
+    async def main():
+        pool = SynthesisPool((VOICE,))
+        start = perf_counter()
+        await pool.warm()
+        print(f"pool warm-up:     {(perf_counter() - start) * 1000:7.1f}ms")
+        start = perf_counter()
+        for text in TEXTS:
+            await pool.openjtalk(text, VOICE)
+        print(f"pool sequential:  {(perf_counter() - start) / len(TEXTS) * 1000:7.1f}ms/utterance")
+        start = perf_counter()
+        await gather(*(pool.openjtalk(text, VOICE) for text in TEXTS))
+        print(f"pool concurrent:  {(perf_counter() - start) / len(TEXTS) * 1000:7.1f}ms/utterance")
+        pool.close()
+
+    run_async(main())
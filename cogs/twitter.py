@@ -20,6 +20,8 @@ from jishaku.functools import executor_function
 from aiofiles import open as aioopen
 from ujson import load, dumps
 
+from util import memoize
+
 if TYPE_CHECKING:
     from asyncio import AbstractEventLoop
     from aiomysql import Pool
@@ -231,20 +233,19 @@ class TwitterNotification(commands.Cog, DataManager, AsyncStream):
         async with aioopen("data/twitter.json", "w") as f:
             await f.write(dumps(self.user_cache))
 
+    @memoize(3600, max_size=1000, key=lambda self, username: username)
     @executor_function
-    def _get_user_id(self, username: str) -> tuple[str, bool]:
-        write = False
-        if username not in self.user_cache:
-            # キャッシュに既にあるのならそれを使う。
-            self.user_cache[username] = self.api.get_user(screen_name=username).id_str
-            write = True
-        return self.user_cache[username], write
+    def fetch_user_id(self, username: str) -> str:
+        "Twitter APIでユーザー名からユーザーのIDを取得します。同じユーザー名で同時に呼ばれた場合は一回だけ取得します。"
+        return self.api.get_user(screen_name=username).id_str
 
     async def get_user_id(self, username: str) -> str:
         "ユーザー名からユーザーのIDを取得する関数です。"
-        if (data := await self._get_user_id(username))[1]:
+        if username not in self.user_cache:
+            # キャッシュに既にあるのならそれを使う。
+            self.user_cache[username] = await self.fetch_user_id(username)
             await self.write_user_cache()
-        return data[0]
+        return self.user_cache[username]
 
     async def start_stream(self, disconnect: bool = False) -> None:
         "Twitterのストリームを開始します。"
@@ -359,6 +360,7 @@ class TwitterNotification(commands.Cog, DataManager, AsyncStream):
         try:
             if username in self.user_cache:
                 del self.user_cache[username]
+            self.fetch_user_id.invalidate(username)
             if onoff:
                 await self.get_user_id(username)
                 await self.write(ctx.channel, username)
@@ -14,76 +14,77 @@ from ujson import load, dumps
 from util import RT, mysql, setup, websocket
 from data import data, Colors
 
-print("Free RT Discord Bot (C) 2022 Free RT\nNow loading...")
+# 音声合成のワーカーのプロセスなどでこのファイルが読み込まれた時にBotが起動しないようにする。
+if __name__ == "__main__":
+    print("Free RT Discord Bot (C) 2022 Free RT\nNow loading...")
 
-with open("auth.json", "r") as f:
-    secret = load(f)
+    with open("auth.json", "r") as f:
+        secret = load(f)
 
-# Botの準備を行う。
-intents = discord.Intents.default()  # intents指定
-intents.typing = False
-intents.members = True
-bot = RT(
-    data["prefixes"][argv[-1]],
-    help_command=None,
-    intents=intents,
-    allowed_mentions=discord.AllowedMentions(
-        everyone=False,
-        users=False,
-        replied_user=False
-    ),
-    activity=discord.Game("起動準備"),
-    status=discord.Status.dnd)  # RTオブジェクトはcommands.Botを継承している
-bot.test = argv[-1] != "production"  # argvの最後がproductionかどうか
-if not bot.test:
-    websocket.WEBSOCKET_URI_BASE = "ws://60.158.90.139"
-bot.data = data  # 全データアクセス用、非推奨
-bot.owner_ids = data["admins"]
-bot.secret = secret  # auth.jsonの内容を入れている
-bot.mysql = bot.data["mysql"] = mysql.MySQLManager(
-    loop=bot.loop,
-    **secret["mysql"],
-    pool=True,
-    minsize=1,
-    maxsize=500 if bot.test else 1000000,
-    autocommit=True
-)  # maxsizeはテスト用では500、本番環境では100万になっている
-bot.pool = bot.mysql.pool  # bot.mysql.pool のエイリアス
-bot.colors = data["colors"]  # 下のColorsを辞書に変換したもの
-bot.Colors = Colors  # botで使う基本色が入っているclass
+    # Botの準備を行う。
+    intents = discord.Intents.default()  # intents指定
+    intents.typing = False
+    intents.members = True
+    bot = RT(
+        data["prefixes"][argv[-1]],
+        help_command=None,
+        intents=intents,
+        allowed_mentions=discord.AllowedMentions(
+            everyone=False,
+            users=False,
+            replied_user=False
+        ),
+        activity=discord.Game("起動準備"),
+        status=discord.Status.dnd)  # RTオブジェクトはcommands.Botを継承している
+    bot.test = argv[-1] != "production"  # argvの最後がproductionかどうか
+    if not bot.test:
+        websocket.WEBSOCKET_URI_BASE = "ws://60.158.90.139"
+    bot.data = data  # 全データアクセス用、非推奨
+    bot.owner_ids = data["admins"]
+    bot.secret = secret  # auth.jsonの内容を入れている
+    bot.mysql = bot.data["mysql"] = mysql.MySQLManager(
+        loop=bot.loop,
+        **secret["mysql"],
+        pool=True,
+        minsize=1,
+        maxsize=20 if bot.test else 50,
+        size_policy=mysql.PoolSizePolicy(maximum=100 if bot.test else 500),
+        autocommit=True
+    )  # maxsizeは最初の最大接続数で、取得待ちの時間などを元にsize_policyのmaximumまで自動で調整される
+    bot.pool = bot.mysql.pool  # bot.mysql.pool のエイリアス
+    mysql.monitor.print = bot.print  # 遅いクエリなどのログをbotのログとして出す
+    bot.colors = data["colors"]  # 下のColorsを辞書に変換したもの
+    bot.Colors = Colors  # botで使う基本色が入っているclass
 
+    @bot.listen()
+    async def setup_hook():
+        # 起動中だと教えられるようにするためのコグを読み込む
+        await bot.load_extension("cogs._first")
+        # jishakuを読み込む
+        await bot.load_extension("jishaku")
 
-@bot.listen()
-async def setup_hook():
-    # 起動中だと教えられるようにするためのコグを読み込む
-    await bot.load_extension("cogs._first")
-    # jishakuを読み込む
-    await bot.load_extension("jishaku")
+    @bot.listen()
+    async def on_ready():
+        bot.print("Connected to discord")
+        # 起動中いつでも使えるaiohttp.ClientSessionを作成
+        bot.session = ClientSession(loop=bot.loop, json_serialize=dumps)
+        await bot.unload_extension("cogs._first")
 
+        # 拡張を読み込む
+        setup(bot)  # util.setup
+        await bot.load_extension("cogs._oldrole")  # oldroleだけ特別に読み込んでいる
+        for name in listdir("cogs"):
+            if not name.startswith(("_", ".")):
+                try:
+                    await bot.load_extension(
+                        f"cogs.{name[:-3] if name.endswith('.py') else name}")
+                except Exception as e:
+                    print(e)
+                else:
+                    bot.print("[Extension]", "Loaded", name)  # ロードログの出力
+        bot.print("Completed to boot Free RT")
 
-@bot.listen()
-async def on_ready():
-    bot.print("Connected to discord")
-    # 起動中いつでも使えるaiohttp.ClientSessionを作成
-    bot.session = ClientSession(loop=bot.loop, json_serialize=dumps)
-    await bot.unload_extension("cogs._first")
+        bot.dispatch("full_ready")  # full_readyイベントを発火する
 
-    # 拡張を読み込む
-    setup(bot)  # util.setup
-    await bot.load_extension("cogs._oldrole")  # oldroleだけ特別に読み込んでいる
-    for name in listdir("cogs"):
-        if not name.startswith(("_", ".")):
-            try:
-                await bot.load_extension(
-                    f"cogs.{name[:-3] if name.endswith('.py') else name}")
-            except Exception as e:
-                print(e)
-            else:
-                bot.print("[Extension]", "Loaded", name)  # ロードログの出力
-    bot.print("Completed to boot Free RT")
-
-    bot.dispatch("full_ready")  # full_readyイベントを発火する
-
-
-# 実行
-bot.run(secret["token"][argv[-1]])
+    # 実行
+    bot.run(secret["token"][argv[-1]])
@@ -1,7 +1,7 @@
 # Free RT Utilities
 
 from .bot import RT
-from .cacher import Cache, Cacher, CacherPool
+from .cacher import Cache, Cacher, CacherPool, memoize
 from .checks import isintable, has_any_roles, has_all_roles
 from .converters import (
     MembersConverter,
@@ -12,6 +12,7 @@ from .converters import (
 )
 from .data_manager import DatabaseManager
 from .lib_data_manager import Table
+from .message_pipeline import message_stage
 from .minesweeper import MineSweeper
 from . import mysql_manager as mysql
 from .olds import tasks_extend, sendKwargs
@@ -28,6 +29,7 @@ __all__ = [
     "Cache",
     "Cacher",
     "CacherPool",
+    "memoize",
     "isintable",
     "has_any_roles",
     "has_all_roles",
@@ -42,6 +44,7 @@ __all__ = [
     "docperser",
     "Table",
     "markdowns",
+    "message_stage",
     "MineSweeper",
     "mysql",
     "olds",
@@ -0,0 +1,187 @@
+# Free RT Util - Bans
+
+"""サーバーごとのBANされているユーザーのIDのキャッシュです。
+`guild.bans()`を毎回実行しないように、サーバーのBANの一覧を一度だけ取得して集合で持ち、`on_member_ban`と`on_member_unban`で最新に保ちます。
+起動時には`bot.guilds`のBANの一覧を裏で一つずつ取得します。BANが多いサーバーの一覧はページごとに取得されます。
+グローバルチャットやGBANなどで使われています。
+
+# Examples
+```python
+from util.bans import bans
+
+if not await bans.check(channel.guild, message.author.id):
+    await channel.send("...")
+for guild_id in bans.guilds_of(user_id):
+    ...
+```"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+from collections import defaultdict
+from asyncio import Task, create_task, sleep
+
+from discord.ext import commands
+import discord
+
+if TYPE_CHECKING:
+    from .bot import RT
+
+
+WARM_INTERVAL = 1.0
+"起動時にサーバーのBANの一覧を取得する間隔の秒数です。"
+
+
+async def fetch_bans(guild: discord.Guild) -> AsyncIterator[int]:
+    "サーバーでBANされているユーザーのIDを順に取得します。"
+    try:
+        bans = guild.bans(limit=None)
+    except TypeError:
+        # 古いライブラリでは全てのBANのリストを返すコルーチンになっている。
+        bans = guild.bans()
+    if hasattr(bans, "__aiter__"):
+        # 新しいライブラリではページごとに取得する非同期イテレータになっている。
+        async for entry in bans:
+            yield entry.user.id
+    else:
+        for entry in await bans:
+            yield entry.user.id
+
+
+class BanCache:
+    """サーバーごとのBANされているユーザーのIDのキャッシュです。
+    BANの一覧の取得中に来たBANとBAN解除は、取得が終わった後に反映されます。"""
+
+    def __init__(self):
+        self.guilds: dict[int, set[int]] = {}
+        self.users: defaultdict[int, set[int]] = defaultdict(set)
+        self.loading: dict[int, Task] = {}
+        self.pending: dict[int, dict[int, bool]] = {}
+
+    def is_banned(self, guild_id: int, user_id: int) -> Optional[bool]:
+        "ユーザーがBANされているかを返します。サーバーのBANの一覧をまだ取得していない場合は`None`を返します。"
+        if (banned := self.guilds.get(guild_id)) is None:
+            return None
+        return user_id in banned
+
+    async def check(self, guild: discord.Guild, user_id: int) -> bool:
+        "ユーザーがBANされているかを返します。サーバーのBANの一覧をまだ取得していない場合は取得します。"
+        if (banned := self.guilds.get(guild.id)) is None:
+            banned = await self.load(guild)
+        return user_id in banned
+
+    def guilds_of(self, user_id: int) -> set[int]:
+        "ユーザーがBANされているサーバーのIDを取得します。BANの一覧を取得済みのサーバーのみです。"
+        return set(self.users.get(user_id, ()))
+
+    async def _load(self, guild: discord.Guild) -> set[int]:
+        # BANの一覧を取得して、取得中に来たイベントを反映する。
+        self.pending[guild.id] = {}
+        banned: set[int] = set()
+        try:
+            async for user_id in fetch_bans(guild):
+                banned.add(user_id)
+        except discord.Forbidden:
+            # 権限がない場合はBANされている人がいないものとし、イベントだけで更新する。
+            pass
+        finally:
+            pending = self.pending.pop(guild.id, {})
+        for user_id, is_banned in pending.items():
+            if is_banned:
+                banned.add(user_id)
+            else:
+                banned.discard(user_id)
+        self.guilds[guild.id] = banned
+        for user_id in banned:
+            self.users[user_id].add(guild.id)
+        return banned
+
+    async def load(self, guild: discord.Guild) -> set[int]:
+        "サーバーのBANの一覧を取得します。同じサーバーで同時に呼ばれた場合は一回だけ取得します。"
+        if (task := self.loading.get(guild.id)) is None:
+            task = self.loading[guild.id] = create_task(self._load(guild))
+            task.add_done_callback(lambda _: self.loading.pop(guild.id, None))
+        return await task
+
+    def ban(self, guild_id: int, user_id: int) -> None:
+        "BANをキャッシュに反映します。"
+        if guild_id in self.pending:
+            self.pending[guild_id][user_id] = True
+        elif (banned := self.guilds.get(guild_id)) is not None:
+            banned.add(user_id)
+            self.users[user_id].add(guild_id)
+
+    def unban(self, guild_id: int, user_id: int) -> None:
+        "BAN解除をキャッシュに反映します。"
+        if guild_id in self.pending:
+            self.pending[guild_id][user_id] = False
+        elif (banned := self.guilds.get(guild_id)) is not None:
+            banned.discard(user_id)
+            if user_id in self.users:
+                self.users[user_id].discard(guild_id)
+                if not self.users[user_id]:
+                    del self.users[user_id]
+
+    def remove_guild(self, guild_id: int) -> None:
+        "サーバーをキャッシュから削除します。"
+        for user_id in self.guilds.pop(guild_id, ()):
+            if user_id in self.users:
+                self.users[user_id].discard(guild_id)
+                if not self.users[user_id]:
+                    del self.users[user_id]
+
+    def __len__(self) -> int:
+        return sum(map(len, self.guilds.values()))
+
+    def __str__(self) -> str:
+        return (f"<BanCache guilds={len(self.guilds)} users={len(self.users)} "
+                f"bans={len(self)} loading={len(self.loading)}>")
+
+
+bans = BanCache()
+"BANのキャッシュです。"
+
+
+class BanCacheManager(commands.Cog):
+    "BANのキャッシュを最新に保つためのコグです。"
+
+    def __init__(self, bot: RT):
+        self.bot = bot
+        self.warming: Optional[Task] = None
+
+    async def warm(self) -> None:
+        "まだBANの一覧を取得していないサーバーのBANの一覧を一つずつ取得します。"
+        for guild in list(self.bot.guilds):
+            if guild.id in bans.guilds or guild.unavailable:
+                continue
+            try:
+                await bans.load(guild)
+            except Exception as e:
+                print("Error on ban cache :", guild.id, repr(e))
+            await sleep(WARM_INTERVAL)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self.warming is None or self.warming.done():
+            self.warming = self.bot.loop.create_task(self.warm())
+
+    def cog_unload(self):
+        if self.warming is not None:
+            self.warming.cancel()
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild: discord.Guild, user: discord.User):
+        bans.ban(guild.id, user.id)
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild: discord.Guild, user: discord.User):
+        bans.unban(guild.id, user.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        bans.remove_guild(guild.id)
+
+
+async def setup(bot):
+    await bot.add_cog(BanCacheManager(bot))
@@ -3,8 +3,13 @@
 from __future__ import annotations
 
 from typing import Generic, TypeVar, Any, Optional
-from collections.abc import Iterator, Callable
+from collections.abc import Iterator, Callable, Coroutine, Hashable
 
+from asyncio import Task, get_event_loop, shield
+from collections import OrderedDict
+from functools import wraps, partial
+from heapq import heappush, heappop, heapify
+from itertools import count
 from time import time
 
 from discord.ext import tasks
@@ -34,29 +39,91 @@ KeyT, ValueT = TypeVar("KeyT"), TypeVar("ValueT")
 
 
 class Cacher(Generic[KeyT, ValueT]):
-    "キャッシュを管理するためのクラスです。\n注意: CacherPoolと兼用しないとデータは自然消滅しません。"
+    """キャッシュを管理するためのクラスです。  
+    期限切れのデータは取得時と`Cacher.expire`の実行時に削除されます。  
+    `max_size`を指定した場合は、それを超えた時に一番使われていないデータから削除されます。  
+    注意: CacherPoolと兼用しないと取得されないデータは自然消滅しません。"""
+
+    def __init__(
+        self, lifetime: float, default: Optional[Callable[[], Any]] = None,
+        max_size: Optional[int] = None
+    ):
+        self.data: OrderedDict[KeyT, Cache[ValueT]] = OrderedDict()
+        self.lifetime, self.default, self.max_size = lifetime, default, max_size
+        # 期限の早い順にキャッシュを取り出すためのヒープ。
+        # 値を上書きした際の古いものはそのまま残し、取り出した時に無視する。
+        self._deadlines: list[tuple[float, int, KeyT, Cache[ValueT]]] = []
+        self._counter = count()
+        self.hits = self.misses = self.evictions = self.expirations = 0
 
-    def __init__(self, lifetime: float, default: Optional[Callable[[], Any]] = None):
-        self.data: dict[KeyT, Cache[ValueT]] = {}
-        self.lifetime, self.default = lifetime, default
-
-        self.get, self.pop = self.data.get, self.data.pop
         self.keys = self.data.keys
 
     def set(self, key: KeyT, data: ValueT, lifetime: Optional[float] = None) -> None:
         "値を設定します。\n別のライフタイムを指定することができます。"
-        self.data[key] = Cache(data, time() + (lifetime or self.lifetime))
+        cache = Cache(data, time() + (lifetime or self.lifetime))
+        self.data[key] = cache
+        self.data.move_to_end(key)
+        heappush(self._deadlines, (cache.deadline, next(self._counter), key, cache))
+        if len(self._deadlines) > len(self.data) * 2 + 64:
+            self._compact()
+        if self.max_size is not None:
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def _compact(self) -> None:
+        # 使われなくなったヒープの要素を消す。
+        self._deadlines = [
+            (cache.deadline, next(self._counter), key, cache)
+            for key, cache in self.data.items()
+        ]
+        heapify(self._deadlines)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        "期限切れのデータを削除します。削除した数を返します。"
+        now, removed = now or time(), 0
+        while self._deadlines and self._deadlines[0][0] < now:
+            _, _, key, cache = heappop(self._deadlines)
+            if self.data.get(key) is cache:
+                del self.data[key]
+                removed += 1
+        self.expirations += removed
+        return removed
+
+    def _get_alive(self, key: KeyT) -> Optional[Cache[ValueT]]:
+        # 生きているキャッシュを取得する。使われたものとして最後に移動させる。
+        if (cache := self.data.get(key)) is not None:
+            if cache.is_dead():
+                del self.data[key]
+                self.expirations += 1
+                return None
+            self.data.move_to_end(key)
+        return cache
+
+    def get(self, key: KeyT, default: Any = None) -> Optional[Cache[ValueT]]:
+        "データが格納されたCacheを取得します。ない場合は`default`を返します。"
+        if (cache := self._get_alive(key)) is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return cache
+
+    def pop(self, key: KeyT, *args: Any) -> Cache[ValueT]:
+        "データが格納されたCacheを削除して返します。"
+        return self.data.pop(key, *args)
 
     def __contains__(self, key: KeyT) -> bool:
-        return key in self.data
+        return self._get_alive(key) is not None
 
     def _default(self, key: KeyT):
-        if self.default is not None and key not in self.data:
+        if self.default is not None and self._get_alive(key) is None:
             self.set(key, self.default())
 
     def __getitem__(self, key: KeyT) -> ValueT:
         self._default(key)
-        return self.data[key].data
+        if (cache := self.get(key)) is None:
+            raise KeyError(key)
+        return cache.data
 
     def __getattr__(self, key: KeyT) -> ValueT:
         return self[key]
@@ -70,6 +137,9 @@ class Cacher(Generic[KeyT, ValueT]):
     def __setitem__(self, key: KeyT, value: ValueT) -> None:
         self.set(key, value)
 
+    def __len__(self) -> int:
+        return len(self.data)
+
     def values(self, mode_list: bool = False) -> Iterator[ValueT]:
         for value in list(self.data.values()) if mode_list else self.data.values():
             yield value.data
@@ -83,8 +153,22 @@ class Cacher(Generic[KeyT, ValueT]):
         self._default(key)
         return self.data[key]
 
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / total if (total := self.hits + self.misses) else 0.0
+
+    def stats(self) -> dict[str, Any]:
+        "ヒット数などの統計を取得します。"
+        return {
+            "size": len(self.data), "max_size": self.max_size, "hits": self.hits,
+            "misses": self.misses, "hit_rate": self.hit_rate,
+            "evictions": self.evictions, "expirations": self.expirations
+        }
+
     def __str__(self) -> str:
-        return f"<Cacher data={type(self.data)} defaultLifetime={self.lifetime}>"
+        return (f"<Cacher data={type(self.data)} defaultLifetime={self.lifetime} "
+                f"size={len(self.data)} maxSize={self.max_size} hits={self.hits} "
+                f"misses={self.misses} evictions={self.evictions}>")
 
     def __repr__(self) -> str:
         return str(self)
@@ -97,9 +181,12 @@ class CacherPool:
         self.cachers: list[Cacher] = []
         self._cache_remover.start()
 
-    def acquire(self, lifetime: float, default: Optional[Callable[[], Any]] = None) -> Cacher:
+    def acquire(
+        self, lifetime: float, default: Optional[Callable[[], Any]] = None,
+        max_size: Optional[int] = None
+    ) -> Cacher:
         "Cacherを生み出します。"
-        self.cachers.append(Cacher(lifetime, default))
+        self.cachers.append(Cacher(lifetime, default, max_size))
         return self.cachers[-1]
 
     def release(self, cacher: Cacher) -> None:
@@ -108,12 +195,93 @@ class CacherPool:
 
     @tasks.loop(seconds=5)
     async def _cache_remover(self):
+        # 期限切れのものだけをヒープから取り出すので、全てのデータを見ることはない。
         now = time()
         for cacher in self.cachers:
-            for key, value in list(cacher.data.items()):
-                if value.is_dead(now):
-                    del cacher[key]
+            cacher.expire(now)
+
+    def stats(self) -> list[dict[str, Any]]:
+        "全てのCacherの統計を取得します。"
+        return [cacher.stats() for cacher in self.cachers]
 
     def __del__(self):
         if self._cache_remover.is_running():
             self._cache_remover.cancel()
+
+
+def _default_key(*args: Any, **kwargs: Any) -> Hashable:
+    return (args, frozenset(kwargs.items())) if kwargs else args
+
+
+def memoize(
+    lifetime: float, max_size: Optional[int] = None,
+    key: Optional[Callable[..., Hashable]] = None
+) -> Callable[[Callable[..., Coroutine]], Callable[..., Coroutine]]:
+    """コルーチン関数の結果をCacherにキャッシュするデコレータです。  
+    同じキーで同時に呼ばれた場合は、一回だけ実行されその結果が全員に返されます。  
+    例外が発生した場合はキャッシュされません。
+
+    Parameters
+    ----------
+    lifetime : float
+        結果をキャッシュしておく秒数です。
+    max_size : int, optional
+        キャッシュしておく結果の最大数です。超えた場合は一番使われていないものから削除されます。
+    key : Callable[..., Hashable], optional
+        引数からキーを作る関数です。デフォルトは引数全てをキーにします。  
+        メソッドの場合は`self`も引数として渡されます。
+
+    Notes
+    -----
+    デコレータを付けた関数には以下の属性が追加されます。  
+    * `cacher`: 結果が格納されている`Cacher`です。
+    * `invalidate(key)`: 指定したキーのキャッシュを削除します。実行中のものの結果もキャッシュされなくなります。
+    * `key_of(*args, **kwargs)`: 引数からキーを作ります。
+    * `clear()`: 全てのキャッシュを削除します。
+
+    Examples
+    --------
+    @memoize(120, max_size=1000, key=lambda self, channel, message_id: message_id)
+    async def fetch_message(self, channel, message_id):
+        return await channel.fetch_message(message_id)
+
+    Expander.fetch_message.invalidate(payload.message_id)"""
+    key_of = key or _default_key
+
+    def decorator(coro: Callable[..., Coroutine]) -> Callable[..., Coroutine]:
+        cacher: Cacher[Hashable, Any] = Cacher(lifetime, max_size=max_size)
+        running: dict[Hashable, Task] = {}
+
+        def on_done(key: Hashable, task: Task) -> None:
+            # 実行が終わったのなら結果をキャッシュする。
+            if running.get(key) is task:
+                del running[key]
+                if not task.cancelled() and task.exception() is None:
+                    cacher.expire()
+                    cacher.set(key, task.result())
+
+        @wraps(coro)
+        async def new_coro(*args, **kwargs):
+            key = key_of(*args, **kwargs)
+            if (cache := cacher.get(key)) is not None:
+                return cache.data
+            if (task := running.get(key)) is None:
+                task = running[key] = get_event_loop().create_task(coro(*args, **kwargs))
+                task.add_done_callback(partial(on_done, key))
+            # 一人がキャンセルされても他の待っている人には影響がないようにする。
+            return await shield(task)
+
+        def invalidate(key: Hashable) -> None:
+            cacher.pop(key, None)
+            running.pop(key, None)
+
+        def clear() -> None:
+            cacher.data.clear()
+            running.clear()
+
+        new_coro.cacher = cacher
+        new_coro.invalidate = invalidate
+        new_coro.key_of = key_of
+        new_coro.clear = clear
+        return new_coro
+    return decorator
@@ -4,9 +4,12 @@ from collections.abc import Callable, Coroutine
 
 from inspect import iscoroutinefunction, signature, Parameter
 from functools import wraps
+from time import perf_counter
 
 from aiomysql import Cursor
 
+from .mysql_manager import monitor
+
 
 class _Dummy:
     default = Parameter.empty
@@ -26,26 +29,24 @@ class DatabaseManager:
 
     @staticmethod
     def wrap(coro: Callable[..., Coroutine]) -> Callable[..., Coroutine]:
-        "自動的にCursorがキーワード引数に渡されるようにするデコレータです。"
+        """自動的にCursorがキーワード引数に渡されるようにするデコレータです。  
+        実行にかかった時間は`util.mysql_manager.monitor`に記録されます。"""
+        name = coro.__qualname__
+
         @wraps(coro)
         async def new_coro(self, *args, **kwargs):
+            start = perf_counter()
             selfmade = "cursor" not in kwargs and not any(isinstance(arg, Cursor) for arg in args)
             if selfmade:
                 # connectionとcursorを作成してkwargsに渡す。
                 conn = await self.pool.acquire()
                 kwargs["cursor"] = await conn.cursor()
             try:
-                data = await coro(self, *args, **kwargs)
-            except Exception as e:
-                if selfmade:
-                    # 自動でcursorを閉じ、releaseする。
-                    await kwargs["cursor"].close()
-                    self.pool.release(conn)
-                raise e
+                return await coro(self, *args, **kwargs)
             finally:
                 if selfmade:
                     # 自動でcursorを閉じ、releaseする。
                     await kwargs["cursor"].close()
                     self.pool.release(conn)
-            return data
+                monitor.on_call(name, perf_counter() - start)
         return new_coro
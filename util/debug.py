@@ -8,6 +8,9 @@ from aiofiles import open as async_open, os
 from functools import wraps
 import psutil
 
+from .mysql_manager import monitor
+from .fanout import fanout
+
 
 def require_admin(coro):
     @wraps(coro)
@@ -136,6 +139,35 @@ class Debug(commands.Cog):
             embed=await self.make_monitor_embed()
         )
 
+    @debug.command(aliases=["database", "mysql"])
+    @require_admin
+    async def db(self, ctx):
+        report = monitor.report(getattr(getattr(self.bot, "mysql", None), "pool", None))
+        await ctx.reply(f"```\n{report[:1980]}\n```")
+
+    @debug.command(aliases=["stages"])
+    @require_admin
+    async def pipeline(self, ctx):
+        if (cog := self.bot.cogs.get("MessagePipeline")) is None:
+            return await ctx.reply("MessagePipelineが読み込まれていません。")
+        await ctx.reply(f"```\n{cog.report()[:1980]}\n```")
+
+    @debug.command(aliases=["delivery"])
+    @require_admin
+    async def fanout(self, ctx):
+        await ctx.reply(f"```\n{fanout.report()[:1980]}\n```")
+
+    @debug.command(aliases=["synthesis"])
+    @require_admin
+    async def tts(self, ctx):
+        if "TTS" not in self.bot.cogs:
+            return await ctx.reply("TTSが読み込まれていません。")
+        from cogs.tts.cache import cache
+        from cogs.tts.manager import metrics
+        from cogs.tts.agents import pool
+        report = f"{cache.report()}\n{metrics.report()}\n{pool}"
+        await ctx.reply(f"```\n{report[:1980]}\n```")
+
 
 async def setup(bot):
     await bot.add_cog(Debug(bot))
@@ -0,0 +1,168 @@
+# Free RT Util - Fan Out
+
+"""一つのメッセージを複数のチャンネルに送るためのものです。グローバルチャットで使われています。  
+添付ファイルは`SharedFile`で一度だけダウンロードし、送信先ごとに同じデータから`discord.File`を作ります。  
+送信は`FanOut.deliver`で同時に行われ、全体の同時送信数と送信先ごとの送信回数が制限されます。  
+一つの送信先が遅くても`timeout`秒で諦めるので、他の送信先が待たされることはありません。  
+送信先ごとの時間は`rf!debug fanout`で見ることができます。
+
+# Examples
+```python
+files = await SharedFile.from_attachments(message.attachments)
+await fanout.deliver(channels, lambda channel: channel.webhook_send(
+    content=message.content, files=[file.to_file() for file in files]
+))
+```"""
+
+from __future__ import annotations
+
+from typing import Callable, Awaitable, Iterable, Optional, Any
+
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from asyncio import Lock, Semaphore, TimeoutError, gather, sleep, wait_for
+from time import perf_counter, monotonic
+from io import BytesIO
+
+import discord
+
+
+class SharedFile:
+    "一度だけ読み込んだ添付ファイルです。送信先ごとに`to_file`で`discord.File`を作ります。"
+
+    __slots__ = ("data", "filename", "spoiler")
+
+    def __init__(self, data: bytes, filename: str, spoiler: bool = False):
+        self.data, self.filename, self.spoiler = data, filename, spoiler
+
+    @classmethod
+    async def from_attachment(cls, attachment: discord.Attachment) -> SharedFile:
+        "添付ファイルを読み込みます。"
+        return cls(
+            await attachment.read(use_cached=True), attachment.filename,
+            attachment.is_spoiler()
+        )
+
+    @classmethod
+    async def from_attachments(cls, attachments: Iterable[discord.Attachment]) -> list[SharedFile]:
+        "複数の添付ファイルを同時に読み込みます。"
+        return list(await gather(*map(cls.from_attachment, attachments)))
+
+    def to_file(self) -> discord.File:
+        "`discord.File`を作ります。データはコピーされません。"
+        return discord.File(BytesIO(self.data), self.filename, spoiler=self.spoiler)
+
+
+class Route:
+    """送信先ごとの制限です。  
+    送信先ごとに一つずつ順番に送信し、`per`秒に`rate`回を超えないように待ちます。"""
+
+    __slots__ = ("lock", "rate", "per", "sent")
+
+    def __init__(self, rate: int, per: float):
+        self.lock = Lock()
+        self.rate, self.per = rate, per
+        self.sent: deque[float] = deque(maxlen=rate)
+
+    async def wait(self) -> None:
+        "送信できるようになるまで待ちます。"
+        if len(self.sent) == self.rate and (wait := self.per - (monotonic() - self.sent[0])) > 0:
+            await sleep(wait)
+        self.sent.append(monotonic())
+
+
+@dataclass
+class DeliveryStats:
+    "送信先ごとの送信時間などの統計です。"
+
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    last: float = 0.0
+
+    @property
+    def average(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+class FanOut:
+    """一つのメッセージを複数の送信先に同時に送るためのクラスです。
+
+    Parameters
+    ----------
+    limit : int, default 16
+        全体の同時送信数の上限です。
+    timeout : float, default 15.0
+        一つの送信先への送信を諦めるまでの秒数です。
+    rate : int, default 5
+        送信先ごとに`per`秒の間に送信できる回数です。
+    per : float, default 2.0"""
+
+    def __init__(self, limit: int = 16, timeout: float = 15.0, rate: int = 5, per: float = 2.0):
+        self.limit, self.timeout, self.rate, self.per = limit, timeout, rate, per
+        self._semaphore: Optional[Semaphore] = None
+        self.routes: dict[int, Route] = {}
+        self.stats: defaultdict[int, DeliveryStats] = defaultdict(DeliveryStats)
+
+    @property
+    def semaphore(self) -> Semaphore:
+        if self._semaphore is None:
+            self._semaphore = Semaphore(self.limit)
+        return self._semaphore
+
+    async def _deliver(self, key: int, send: Callable[[], Awaitable[Any]]) -> Any:
+        # 送信先の順番を待って送信し、時間を記録する。
+        if (route := self.routes.get(key)) is None:
+            route = self.routes[key] = Route(self.rate, self.per)
+        stats = self.stats[key]
+        start = perf_counter()
+        try:
+            async with route.lock:
+                await route.wait()
+                async with self.semaphore:
+                    return await wait_for(send(), self.timeout)
+        except TimeoutError:
+            stats.timeouts += 1
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.last = elapsed = perf_counter() - start
+            stats.calls += 1
+            stats.total += elapsed
+            if elapsed > stats.max:
+                stats.max = elapsed
+
+    async def deliver(
+        self, destinations: Iterable[Any], send: Callable[[Any], Awaitable[Any]]
+    ) -> list[Any]:
+        """`destinations`の全てに`send`を同時に実行します。送信先は`id`を持っている必要があります。  
+        返り値は送信先の順の`send`の返り値のリストで、失敗したものは例外になります。"""
+        return await gather(*(
+            self._deliver(destination.id, lambda destination=destination: send(destination))
+            for destination in destinations
+        ), return_exceptions=True)
+
+    def forget(self, key: int) -> None:
+        "送信先の制限と統計を削除します。"
+        self.routes.pop(key, None)
+        self.stats.pop(key, None)
+
+    def report(self) -> str:
+        "送信先ごとの統計のレポートを作ります。"
+        lines = [f"Destinations: {len(self.stats)} Limit: {self.limit} Timeout: {self.timeout}s"]
+        for key, stats in sorted(
+            self.stats.items(), key=lambda item: item[1].average, reverse=True
+        ):
+            lines.append(
+                f"{stats.average * 1000:8.1f}ms n={stats.calls} max={stats.max * 1000:.1f}ms "
+                f"last={stats.last * 1000:.1f}ms err={stats.errors} timeout={stats.timeouts} {key}"
+            )
+        return "\n".join(lines)
+
+
+fanout = FanOut()
+"グローバルチャットなどで使われる送信用の`FanOut`です。"
@@ -0,0 +1,286 @@
+# Free RT Util - Keywords
+
+"""メッセージに含まれている言葉をまとめて探すためのAho-Corasick法のオートマトンです。
+NGワードやスタンプ、オリジナルコマンド、AFKプラスのワードフックで使われています。
+言葉の数がいくつあってもメッセージを一度走査するだけで、含まれている言葉を全て見つけることができます。
+言葉の追加はトライ木への追加だけで、失敗時の遷移は次の検索の時にまとめて作り直されます。
+言葉の削除は一致した時に無視するだけで、削除された言葉が多くなったらトライ木を作り直します。
+
+# Examples
+```python
+from util.keywords import KeywordIndex
+
+words = KeywordIndex()
+words.set(guild.id, ["ばか", "あほ"])
+words.add(guild.id, "まぬけ")
+if (word := words.search(message.guild.id, message.content)) is not None:
+    await message.delete()
+```"""
+
+from __future__ import annotations
+
+from typing import Hashable, Iterable, Iterator, Optional
+
+from collections import deque
+from re import compile as re_compile, escape
+
+
+SCAN_LIMIT = 300
+"""言葉の数がこれ以下の場合は`search`と`matches`で言葉を一つずつ`in`で調べます。
+言葉が少ない場合は`in`の方が速いからです。"""
+
+
+def _char_class(chars: Iterable[str]) -> str:
+    # 文字の集合を`a-z`のような範囲の正規表現の文字クラスにする。
+    ranges: list[list[int]] = []
+    for code in sorted(map(ord, chars)):
+        if ranges and ranges[-1][1] + 1 == code:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return "[" + "".join(
+        escape(chr(start)) if start == end else f"{escape(chr(start))}-{escape(chr(end))}"
+        for start, end in ranges
+    ) + "]"
+
+
+class KeywordAutomaton:
+    """複数の言葉をまとめて探すためのオートマトンです。空文字列は無視されます。
+    `matches`などで返される言葉の順番は追加した順です。"""
+
+    __slots__ = (
+        "words", "_counter", "_goto", "_fail", "_terminal", "_output",
+        "_first", "_linked", "_removed"
+    )
+
+    def __init__(self, words: Iterable[str] = ()):
+        self.words: dict[str, int] = {}
+        self._counter = 0
+        self.clear()
+        for word in words:
+            self.add(word)
+
+    def clear(self) -> None:
+        "全ての言葉を削除します。"
+        self.words.clear()
+        self._goto: list[dict[str, int]] = [{}]
+        self._terminal: list[Optional[str]] = [None]
+        self._fail: list[int] = [0]
+        self._output: list[int] = [0]
+        self._first = None
+        self._linked, self._removed = True, 0
+
+    def add(self, word: str) -> None:
+        "言葉を追加します。既に追加されている場合は何もしません。"
+        if not word or word in self.words:
+            return
+        self.words[word] = self._counter
+        self._counter += 1
+        state = 0
+        for char in word:
+            if (next_state := self._goto[state].get(char)) is None:
+                next_state = self._goto[state][char] = len(self._goto)
+                self._goto.append({})
+                self._terminal.append(None)
+            state = next_state
+        if self._terminal[state] is None:
+            self._terminal[state] = word
+        else:
+            # 前に削除された言葉のノードをそのまま使う。
+            self._removed -= 1
+        self._linked = False
+
+    def remove(self, word: str) -> None:
+        "言葉を削除します。追加されていない場合は何もしません。"
+        if self.words.pop(word, None) is None:
+            return
+        self._removed += 1
+        if self._removed > len(self.words):
+            # 削除された言葉の方が多くなったのならトライ木を作り直す。
+            words = sorted(self.words, key=self.words.__getitem__)
+            self.clear()
+            for word in words:
+                self.add(word)
+
+    def update(self, words: Iterable[str]) -> None:
+        "言葉を`words`だけにします。"
+        words = dict.fromkeys(word for word in words if word)
+        for word in [word for word in self.words if word not in words]:
+            self.remove(word)
+        for word in words:
+            self.add(word)
+
+    def _link(self) -> None:
+        # 幅優先探索で失敗時の遷移と、失敗時の遷移をたどった先の一番近い言葉の終わりを作る。
+        goto, terminal = self._goto, self._terminal
+        self._fail = fail = [0] * len(goto)
+        self._output = output = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                if state:
+                    link = fail[state]
+                    while link and char not in goto[link]:
+                        link = fail[link]
+                    link = goto[link].get(char, 0)
+                else:
+                    link = 0
+                fail[next_state] = link
+                output[next_state] = link if terminal[link] is not None else output[link]
+        self._first = re_compile(_char_class(goto[0])) if goto[0] else None
+        self._linked = True
+
+    def finditer(self, text: str) -> Iterator[tuple[int, str]]:
+        "文字列に含まれている言葉を`(開始位置, 言葉)`で終わる位置の順に返します。"
+        if not self._linked:
+            self._link()
+        if self._first is None:
+            return
+        goto, fail, terminal, output, words = \
+            self._goto, self._fail, self._terminal, self._output, self.words
+        search, state, position, length = self._first.search, 0, 0, len(text)
+        while position < length:
+            if not state:
+                # 根にいる間は言葉の最初の文字になる文字まで正規表現で飛ばす。
+                if (candidate := search(text, position)) is None:
+                    return
+                position = candidate.start()
+            char = text[position]
+            while (next_state := goto[state].get(char)) is None and state:
+                state = fail[state]
+            state = next_state or 0
+            position += 1
+            match = state if terminal[state] is not None else output[state]
+            while match:
+                if (word := terminal[match]) in words:
+                    yield position - len(word), word
+                match = output[match]
+
+    def search(self, text: str) -> Optional[str]:
+        "文字列に含まれている言葉を一つ返します。含まれていない場合は`None`を返します。"
+        if len(self.words) <= SCAN_LIMIT:
+            for word in self.words:
+                if word in text:
+                    return word
+        else:
+            for _, word in self.finditer(text):
+                return word
+
+    def matches(self, text: str) -> list[str]:
+        "文字列に含まれている言葉を全て追加した順に返します。"
+        if len(self.words) <= SCAN_LIMIT:
+            return [word for word in self.words if word in text]
+        return sorted(
+            {word for _, word in self.finditer(text)}, key=self.words.__getitem__
+        )
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.words
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.words)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __repr__(self) -> str:
+        return f"<KeywordAutomaton words={len(self.words)} states={len(self._goto)}>"
+
+
+class KeywordIndex:
+    "サーバーなどのキーごとの`KeywordAutomaton`です。"
+
+    def __init__(self):
+        self.automata: dict[Hashable, KeywordAutomaton] = {}
+
+    def get(self, key: Hashable) -> Optional[KeywordAutomaton]:
+        "オートマトンを取得します。"
+        return self.automata.get(key)
+
+    def set(self, key: Hashable, words: Iterable[str]) -> None:
+        "キーの言葉を`words`だけにします。"
+        if (automaton := self.automata.get(key)) is None:
+            self.automata[key] = KeywordAutomaton(words)
+        else:
+            automaton.update(words)
+
+    def add(self, key: Hashable, word: str) -> None:
+        "キーに言葉を追加します。"
+        if (automaton := self.automata.get(key)) is None:
+            automaton = self.automata[key] = KeywordAutomaton()
+        automaton.add(word)
+
+    def remove(self, key: Hashable, word: str) -> None:
+        "キーから言葉を削除します。"
+        if (automaton := self.automata.get(key)) is not None:
+            automaton.remove(word)
+
+    def discard(self, key: Hashable) -> None:
+        "キーのオートマトンを削除します。"
+        self.automata.pop(key, None)
+
+    def search(self, key: Hashable, text: str) -> Optional[str]:
+        "文字列に含まれているキーの言葉を一つ返します。含まれていない場合は`None`を返します。"
+        if (automaton := self.automata.get(key)) is not None:
+            return automaton.search(text)
+
+    def matches(self, key: Hashable, text: str) -> list[str]:
+        "文字列に含まれているキーの言葉を全て追加した順に返します。"
+        if (automaton := self.automata.get(key)) is None:
+            return []
+        return automaton.matches(text)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.automata
+
+    def __repr__(self) -> str:
+        return f"<KeywordIndex keys={len(self.automata)}>"
+
+
+if __name__ == "__main__":
+    # 以前の言葉を一つずつ`in`で調べる方法と結果が同じになるかと、速度を比べます。
+    # NGワードは含まれていないことがほとんどなので、言葉が含まれていないメッセージで比べます。
+    # 使い方: python -m util.keywords
+    from random import Random
+    from time import perf_counter
+
+    random = Random(0)
+    HIRAGANA = "".join(map(chr, range(0x3041, 0x3094)))
+    ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+
+    def make_text(letters: str, length: int) -> str:
+        return "".join(random.choice(letters) for _ in range(length))
+
+    def measure(function, texts: list[str]) -> float:
+        start = perf_counter()
+        for text in texts:
+            function(text)
+        return (perf_counter() - start) / len(texts)
+
+    for kind, letters in (("ja", HIRAGANA), ("en", ALPHABET)):
+        for count in (20, 50, 200, 1000, 5000):
+            words = list(dict.fromkeys(
+                make_text(letters, random.randint(4, 10)) for _ in range(count)
+            ))
+            start = perf_counter()
+            automaton = KeywordAutomaton(words)
+            automaton._link()
+            build = perf_counter() - start
+            for length in (30, 300, 2000):
+                texts = [make_text(letters, length) for _ in range(50)]
+                texts[::5] = [
+                    text[:length // 2] + random.choice(words) + text[length // 2:]
+                    for text in texts[::5]
+                ]
+                for text in texts:
+                    assert automaton.matches(text) == [word for word in words if word in text]
+                old = measure(lambda text: [word for word in words if word in text], texts)
+                trie = measure(lambda text: list(automaton.finditer(text)), texts)
+                new = measure(automaton.matches, texts)
+                print(
+                    f"{kind} words={len(words):<5} len={length:<5} build={build * 1000:5.1f}ms "
+                    f"old={old * 1000000:8.1f}us automaton={trie * 1000000:8.1f}us "
+                    f"matches={new * 1000000:8.1f}us x{old / new:.1f}"
+                )
@@ -5,12 +5,16 @@ from __future__ import annotations
 from typing import (
     TYPE_CHECKING, TypeVar, Literal, Union, Optional, NoReturn, Any, get_args
 )
+from collections.abc import AsyncIterator, Iterator, Callable
 
 from collections import defaultdict
-from asyncio import Event
+from dataclasses import dataclass
+from asyncio import Event, Future, Lock
+from time import perf_counter
 
 from discord.ext import commands, tasks
 
+from pymysql.err import MySQLError
 from ujson import loads, dumps
 from aiomysql import Cursor
 
@@ -27,29 +31,192 @@ class ChangedDict(dict):
 
     changed = False
     _new = False
+    _owner: Optional[DataDict] = None
+    _key: Key = None
 
-    def __setitem__(self, key, value):
+    def _mark(self) -> None:
+        # 変更されたことを記録して、持ち主のDataDictに変更済みのキーとして知らせる。
         self.changed = True
+        if self._owner is not None:
+            self._owner._dirty.add(self._key)
+
+    def __setitem__(self, key, value):
+        self._mark()
         return super().__setitem__(key, value)
 
     def __delitem__(self, key):
-        self.changed = True
+        self._mark()
         return super().__delitem__(key)
 
+    def update(self, *args, **kwargs):
+        self._mark()
+        return super().update(*args, **kwargs)
+
+    def pop(self, *args):
+        self._mark()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._mark()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._mark()
+        return super().setdefault(key, default)
+
+    def clear(self):
+        self._mark()
+        return super().clear()
+
 
 class DataDict(defaultdict):
+    "テーブルのキャッシュです。変更または削除されたキーだけを記録します。"
 
-    _removed = []
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._removed: set[Key] = set()
+        self._dirty: set[Key] = set()
 
-    def __delitem__(self, key: str) -> None:
-        self._removed.append(key)
+    def __delitem__(self, key: Key) -> None:
+        self._removed.add(key)
+        self._dirty.discard(key)
         return super().__delitem__(key)
 
-    def __setitem__(self, key: str, value: dict):
-        if key in self._removed:
-            self._removed.remove(key)
+    def __setitem__(self, key: Key, value: dict):
+        self._removed.discard(key)
+        if isinstance(value, ChangedDict):
+            value._owner, value._key = self, key
+            if value.changed:
+                self._dirty.add(key)
         return super().__setitem__(key, value)
 
+    def touch(self, key: Key) -> None:
+        "指定されたキーを次の同期で書き込むようにします。"
+        if dict.__contains__(self, key):
+            self._dirty.add(key)
+
+    def pop_changes(self) -> tuple[set[Key], set[Key]]:
+        "変更されたキーと削除されたキーを取り出します。取り出したものは記録から消えます。"
+        dirty, removed = self._dirty, self._removed
+        self._dirty, self._removed = set(), set()
+        return dirty, removed
+
+    def restore_changes(self, rows: dict[Key, ChangedDict], removed: set[Key]) -> None:
+        "`pop_changes`で取り出したものを記録に戻します。同期に失敗した際に使います。"
+        self._dirty.update(key for key in rows if dict.__contains__(self, key))
+        self._removed.update(key for key in removed if not dict.__contains__(self, key))
+
+    def is_loaded(self, key: Key) -> bool:
+        "指定されたキーのデータがキャッシュにあるかどうかです。"
+        return True
+
+
+class LazyDataDict(DataDict):
+    """必要になった時に一行ずつ読み込まれるテーブルのキャッシュです。
+    `maxsize`を超えると使われていない順に追い出され、変更済みのものは次の同期で書き込まれます。"""
+
+    OVERFLOW = 500
+    "追い出された変更済みのデータがこの数を超えたら同期を要求します。"
+
+    def __init__(
+        self, default_factory: Callable[[], ChangedDict], maxsize: int,
+        on_overflow: Optional[Callable[[], Any]] = None
+    ):
+        super().__init__(default_factory)
+        self.maxsize, self.on_overflow = maxsize, on_overflow
+        self._evicted: dict[Key, ChangedDict] = {}
+        self._absent: set[Key] = set()
+        self._flush_requested = False
+
+    def __missing__(self, key: Key) -> ChangedDict:
+        if key in self._evicted:
+            # 同期待ちのデータならキャッシュに戻す。
+            self[key] = value = self._evicted.pop(key)
+            self._dirty.add(key)
+            return value
+        raise KeyError(
+            f"{key}はまだ読み込まれていません。先に`Table.load`を実行してください。"
+        )
+
+    def __delitem__(self, key: Key) -> None:
+        # 読み込んでいないキーでもデータベースからは削除する。
+        self._evicted.pop(key, None)
+        self._absent.discard(key)
+        self._dirty.discard(key)
+        self._removed.add(key)
+        dict.pop(self, key, None)
+
+    def __getitem__(self, key: Key) -> ChangedDict:
+        value = super().__getitem__(key)
+        # 最近使ったものとして一番後ろに移動させる。
+        dict.__delitem__(self, key)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def __setitem__(self, key: Key, value: dict):
+        dict.pop(self, key, None)
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            self._evict()
+
+    def _evict(self) -> None:
+        # 古いものから追い出す。
+        while len(self) > self.maxsize:
+            key = next(iter(self))
+            value = dict.pop(self, key)
+            if key in self._dirty:
+                self._dirty.discard(key)
+                self._evicted[key] = value
+            else:
+                self._absent.discard(key)
+        if (len(self._evicted) >= self.OVERFLOW and not self._flush_requested
+                and self.on_overflow is not None):
+            self._flush_requested = True
+            self.on_overflow()
+
+    def put(self, key: Key, value: ChangedDict, absent: bool = False) -> None:
+        "データベースから読み込んだデータをキャッシュに入れます。"
+        self[key] = value
+        if absent:
+            self._absent.add(key)
+
+    def is_loaded(self, key: Key) -> bool:
+        return dict.__contains__(self, key) or key in self._evicted
+
+    def restore_changes(self, rows: dict[Key, ChangedDict], removed: set[Key]) -> None:
+        for key, value in rows.items():
+            if dict.__contains__(self, key):
+                self._dirty.add(key)
+            elif key not in self._evicted and key not in self._removed:
+                # 同期中に追い出されたものは同期待ちに戻す。
+                self._evicted[key] = value
+        self._removed.update(key for key in removed if not dict.__contains__(self, key))
+
+    def forget_flushed(self, rows: dict[Key, ChangedDict]) -> None:
+        "書き込みが完了したデータを同期待ちから外します。"
+        for key, value in rows.items():
+            if self._evicted.get(key) is value:
+                del self._evicted[key]
+            self._absent.discard(key)
+        self._flush_requested = False
+
+
+@dataclass
+class SyncStats:
+    "テーブルごとの同期の統計です。同期の間隔を決めるのに使います。"
+
+    count: int = 0
+    rows: int = 0
+    removed: int = 0
+    last_rows: int = 0
+    last_latency: float = 0.0
+    max_latency: float = 0.0
+    total_latency: float = 0.0
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.count if self.count else 0.0
+
 
 TableSelfT = TypeVar("TableSelfT", bound="Table")
 
@@ -58,6 +225,10 @@ class Table:
 
     __allocation__: Optional[str] = None
     __key__: Optional[Key] = None
+    __lazy__: bool = False
+    "Trueにすると起動時に全てを読み込まず、`Table.load`で必要な行だけ読み込みます。"
+    __cache_size__: int = 10000
+    "`__lazy__`が有効な時にキャッシュに置いておく行数の上限です。"
 
     def __init__(self, bot: RT, immediately_sync: bool = False, heritance: bool = False):
         assert self.__allocation__ is not None, "割り振りを設定してください。"
@@ -82,14 +253,32 @@ class Table:
             if key in ("pop", "update", "get", "items", "values", "keys"):
                 return getattr(self.cog.data[self.name][self.__key__], key)
             elif key in self.__annotations__:
-                return self.cog.data[self.name][self.__key__][key]
+                value = self.cog.data[self.name][self.__key__][key]
+                if isinstance(value, (dict, list, set)):
+                    # 中身を直接書き換えられる可能性があるので、次の同期で書き込むようにする。
+                    self.cog.data[self.name].touch(self.__key__)
+                return value
         raise AttributeError(key)
 
     def to_dict(self) -> dict:
-        "このデータにある辞書を返します。この関数が返すものに値は書き込まないでください。"
+        """このデータにある辞書を返します。この関数が返すものに値は書き込まないでください。
+        `__lazy__`が有効な場合は読み込み済みのものしか含まれません。全てが必要な場合は`Table.stream`を使ってください。"""
         return self.cog.data[self.name] if self.__key__ is None \
             else self.cog.data[self.name][self.__key__]
 
+    async def load(self: TableSelfT, key: Key) -> TableSelfT:
+        "指定されたキーのデータを必要なら読み込み、そのキーのTableを返します。"
+        assert self.__key__ is None, "既にキーは設定されています。"
+        await self.locked.wait()
+        await self.cog.load(self.name, key)
+        return self[key]
+
+    def stream(self, chunk_size: int = 1000) -> AsyncIterator[tuple[Key, dict]]:
+        """全ての行を`(キー, データ)`で少しずつ読み込みながら返す非同期イテレータです。
+        キャッシュにあるものはキャッシュのデータが優先されます。"""
+        assert self.__key__ is None, "既にキーは設定されています。"
+        return self.cog.stream(self, chunk_size)
+
     def sync(self):
         self.cog.sync(self.name)
 
@@ -130,12 +319,20 @@ class Table:
 
 
 class DataManager(commands.Cog):
+
+    FLUSH_CHUNK_SIZE = 500
+    "一度のクエリで書き込む行数の上限です。"
+
     def __init__(self, bot: RT):
         self.bot = bot
         self.data: defaultdict[str, DataDict[Key, ChangedDict]] = defaultdict(
             lambda: DataDict(ChangedDict)
         )
         self.allocations: dict[str, str] = {}
+        self.stats: defaultdict[str, SyncStats] = defaultdict(SyncStats)
+        self._upsertable: dict[str, bool] = {}
+        self._locks: defaultdict[str, Lock] = defaultdict(Lock)
+        self._loading: dict[tuple[str, Key], Future] = {}
         self._loaded: list[str] = []
         self._auto_sync.start()
 
@@ -147,38 +344,132 @@ class DataManager(commands.Cog):
                 if table.name not in self._loaded:
                     await cursor.execute(
                         f"""CREATE TABLE IF NOT EXISTS {table.name} (
-                            {table.__allocation_name__} {table.__allocation_type__}, Data JSON
+                            {table.__allocation_name__} {table.__allocation_type__}
+                                PRIMARY KEY NOT NULL, Data JSON
                         );"""
                     )
+                    self._upsertable[table.name] = await self._prepare_primary_key(
+                        cursor, table.name, table.__allocation_name__
+                    )
+                    self._loaded.append(table.name)
                 # キャッシュを作る。
                 self.allocations[table.name] = table.__allocation_name__
-                await cursor.execute(f"SELECT * FROM {table.name};")
-                for row in await cursor.fetchall():
-                    if row:
-                        self.data[table.name][row[0]] = ChangedDict(loads(row[1]))
-                        self.data[table.name][row[0]].changed = False
+                if table.__lazy__:
+                    # 必要になった時に読み込むので、ここでは何も読み込まない。
+                    if not isinstance(self.data.get(table.name), LazyDataDict):
+                        self.data[table.name] = LazyDataDict(
+                            ChangedDict, table.__cache_size__,
+                            lambda: self.sync(table.name)
+                        )
+                else:
+                    await cursor.execute(f"SELECT * FROM {table.name};")
+                    for row in await cursor.fetchall():
+                        if row:
+                            self.data[table.name][row[0]] = ChangedDict(loads(row[1]))
+                            self.data[table.name][row[0]].changed = False
 
         table.locked.set()
 
+    async def load(self, table: str, key: Key) -> None:
+        "`__lazy__`が有効なテーブルの指定されたキーの行を読み込みます。同じ行の読み込みは一つにまとめられます。"
+        datas = self.data[table]
+        while not datas.is_loaded(key):
+            if (table, key) in self._loading:
+                # 既に読み込み中ならそれを待つ。
+                await self._loading[(table, key)]
+                continue
+
+            self._loading[(table, key)] = future = self.bot.loop.create_future()
+            try:
+                async with self.bot.mysql.pool.acquire() as conn:
+                    async with conn.cursor() as cursor:
+                        await cursor.execute(
+                            f"SELECT Data FROM {table} WHERE {self.allocations[table]} = %s;",
+                            (key,)
+                        )
+                        row = await cursor.fetchone()
+                if not datas.is_loaded(key) and key not in datas._removed:
+                    datas.put(
+                        key, ChangedDict(loads(row[0]) if row else {}), row is None
+                    )
+            finally:
+                del self._loading[(table, key)]
+                future.set_result(None)
+            break
+
+    async def stream(
+        self, table: Table, chunk_size: int = 1000
+    ) -> AsyncIterator[tuple[Key, dict]]:
+        "`Table.stream`の実装です。主キーの順に`chunk_size`行ずつ読み込みます。"
+        await table.locked.wait()
+        datas, column = self.data[table.name], self.allocations[table.name]
+        if not isinstance(datas, LazyDataDict):
+            for item in list(datas.items()):
+                yield item
+            return
+
+        last = None
+        while True:
+            async with self.bot.mysql.pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    if last is None:
+                        await cursor.execute(
+                            f"SELECT {column}, Data FROM {table.name} ORDER BY {column} LIMIT %s;",
+                            (chunk_size,)
+                        )
+                    else:
+                        await cursor.execute(
+                            f"""SELECT {column}, Data FROM {table.name}
+                                WHERE {column} > %s ORDER BY {column} LIMIT %s;""",
+                            (last, chunk_size)
+                        )
+                    rows = await cursor.fetchall()
+            if not rows:
+                break
+            for key, data in rows:
+                if key in datas._removed:
+                    continue
+                cached = dict.get(datas, key, datas._evicted.get(key))
+                yield key, loads(data) if cached is None else cached
+            last = rows[-1][0]
+
+        # まだデータベースに書き込まれていない新しい行を返す。
+        for key in list(datas._absent):
+            if (cached := dict.get(datas, key, datas._evicted.get(key))) is not None:
+                yield key, cached
+
+    async def _prepare_primary_key(self, cursor: Cursor, table: str, column: str) -> bool:
+        # 主キーがない古いテーブルに主キーを設定する。
+        # 設定できなかった場合は一行ずつ書き込む昔の方法で同期をする。
+        await cursor.execute(f"SHOW KEYS FROM {table} WHERE Key_name = 'PRIMARY';")
+        if await cursor.fetchone():
+            return True
+        try:
+            await cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({column});")
+        except MySQLError as e:
+            self.print("[primary_key.failed]", f"{table}: {e}")
+            return False
+        return True
+
     def print(self, *args, **kwargs):
         return self.bot.print(f"[{self.__cog_name__}]", *args, **kwargs)
 
     async def _remove(
-        self, cursor: Cursor, table: str, key: Key, print_: bool = False
+        self, cursor: Cursor, table: str, keys: list[Key], print_: bool = False
     ) -> None:
         # 削除を行う。
         if print_:
-            self.print("[sync.remove]", f"{table}.{key}")
+            self.print("[sync.remove]", f"{table}.{keys}")
         await cursor.execute(
-            f"DELETE FROM {table} WHERE {self.allocations[table]} = %s;",
-            (key,)
+            f"DELETE FROM {table} WHERE {self.allocations[table]} "
+            f"IN ({', '.join(('%s',) * len(keys))});", keys
         )
 
     async def _update(
         self, cursor: Cursor, table: str, key: Key,
-        data: ChangedDict, print_: bool = False
+        data: str, print_: bool = False
     ) -> None:
-        # 更新を行う。
+        # 主キーがないテーブルの更新を行う。
         if print_:
             self.print("[sync.update]", f"{table}.{key}: {data}")
         await cursor.execute(
@@ -188,40 +479,91 @@ class DataManager(commands.Cog):
         if await cursor.fetchone():
             await cursor.execute(
                 f"UPDATE {table} SET Data = %s WHERE {self.allocations[table]} = %s;",
-                (dumps(data), key)
+                (data, key)
             )
         else:
             await cursor.execute(
-                f"INSERT INTO {table} VALUES (%s, %s);", (key, dumps(data))
+                f"INSERT INTO {table} VALUES (%s, %s);", (key, data)
             )
 
+    async def _upsert(
+        self, cursor: Cursor, table: str, rows: list[tuple[Key, str]]
+    ) -> None:
+        # 複数の行をまとめて書き込む。
+        if not self._upsertable.get(table, False):
+            for key, data in rows:
+                await self._update(cursor, table, key, data)
+            return
+        await cursor.execute(
+            f"""INSERT INTO {table} ({self.allocations[table]}, Data)
+                VALUES {', '.join(('(%s, %s)',) * len(rows))}
+                ON DUPLICATE KEY UPDATE Data = VALUES(Data);""",
+            [value for row in rows for value in row]
+        )
+
+    def _chunks(self, items: list) -> Iterator[list]:
+        # `FLUSH_CHUNK_SIZE`ごとに区切る。
+        for index in range(0, len(items), self.FLUSH_CHUNK_SIZE):
+            yield items[index:index + self.FLUSH_CHUNK_SIZE]
+
     async def _sync(self, table: str, datas: DataDict[Key, ChangedDict]) -> None:
-        # 指定されたテーブルのデータの同期を行います。
-        self.print("[sync]", table)
-        async with self.bot.mysql.pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                # 削除されたものを消す。
-                for removed_key in datas._removed:
-                    await self._remove(cursor, table, removed_key)
-                # 変更されたものをアップデートする。
-                for key, data in list(datas.items()):
-                    await self._update(cursor, table, key, data)
-                    data.changed = False
+        # 指定されたテーブルの変更されたデータだけを同期します。
+        async with self._locks[table]:
+            dirty, removed = datas.pop_changes()
+            snapshot: dict[Key, ChangedDict] = dict(getattr(datas, "_evicted", {}))
+            for key in dirty:
+                if (value := dict.get(datas, key)) is not None:
+                    snapshot[key] = value
+            if not snapshot and not removed:
+                return
+            rows = []
+            for key, value in snapshot.items():
+                rows.append((key, dumps(value)))
+                value.changed = False
+
+            started = perf_counter()
+            try:
+                async with self.bot.mysql.pool.acquire() as conn:
+                    async with conn.cursor() as cursor:
+                        # 削除されたものを消す。
+                        for keys in self._chunks(list(removed)):
+                            await self._remove(cursor, table, keys)
+                        # 変更されたものをアップデートする。
+                        for chunk in self._chunks(rows):
+                            await self._upsert(cursor, table, chunk)
+            except Exception:
+                # 失敗した場合は次の同期に持ち越す。
+                datas.restore_changes(snapshot, removed)
+                raise
+            if isinstance(datas, LazyDataDict):
+                datas.forget_flushed(snapshot)
+
+            latency = perf_counter() - started
+            stats = self.stats[table]
+            stats.count += 1
+            stats.rows += len(rows)
+            stats.removed += len(removed)
+            stats.last_rows = len(rows)
+            stats.last_latency = latency
+            stats.max_latency = max(stats.max_latency, latency)
+            stats.total_latency += latency
+            self.print(
+                "[sync]", table, f"{len(rows)} rows, {len(removed)} removed, {latency:.3f}s"
+            )
 
     def sync(self, table: Optional[str] = None):
-        "同期を行います。注意：キャッシュのデータが優先されます。"
+        "同期を行います。変更されたデータのみが書き込まれます。注意：キャッシュのデータが優先されます。"
         if table is None:
-            if self.data[table]:
-                self.bot.loop.create_task(
-                    self._sync(table, self.data[table]), name=f"[{self.__cog_name__}] Sync: {table}"
-                )
-        else:
             if self.data:
                 self.print("Now syncing...")
                 for table, datas in list(self.data.items()):
                     self.bot.loop.create_task(
                         self._sync(table, datas), name=f"[{self.__cog_name__}] Sync: {table}"
                     )
+        elif table in self.data:
+            self.bot.loop.create_task(
+                self._sync(table, self.data[table]), name=f"[{self.__cog_name__}] Sync: {table}"
+            )
 
     # @tasks.loop(seconds=10)
     @tasks.loop(minutes=10)
@@ -229,7 +571,7 @@ class DataManager(commands.Cog):
         self.sync()
 
     def cog_unload(self):
-        self._auto_save.cancel()
+        self._auto_sync.cancel()
 
     @commands.Cog.listener()
     async def on_close(self, _):
@@ -0,0 +1,278 @@
+# Free RT Util - Message Pipeline
+
+"""メッセージの処理を一つの`on_message`にまとめるためのエクステンションです。  
+コグごとに`on_message`を作ると、メッセージが来るたびにコグの数だけタスクが作られ、  
+それぞれでサーバーかどうか、Botかどうか、プレフィックスかどうかなどの同じ確認が行われます。  
+これを使うと確認はメッセージ毎に一回だけ行われ、必要なステージだけが呼ばれます。  
+ステージ毎の実行時間は`rf!debug pipeline`で見ることができます。
+
+# Examples
+```python
+class Stamp(commands.Cog):
+    @message_stage(
+        prefix=False, enabled=lambda self, message: message.guild.id in self.cache
+    )
+    async def on_message(self, message: discord.Message):
+        ...
+```"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Callable, Optional, Mapping, Any
+
+from collections import defaultdict
+from dataclasses import dataclass
+from asyncio import gather
+from time import perf_counter
+from re import compile as re_compile
+
+from discord.ext import commands
+import discord
+
+from .topic_index import topics
+
+if TYPE_CHECKING:
+    from .bot import RT
+
+
+URL_PATTERN = re_compile(r"https?://[^\s<>|]+")
+INVITE_PATTERN = re_compile(
+    r"(?:discord\.gg|discord(?:app)?\.com/invite)/([\w-]+)"
+)
+
+
+class MessageInfo:
+    "メッセージを一度だけ調べた結果です。ステージを選ぶのに使われます。"
+
+    __slots__ = (
+        "message", "guild", "is_bot", "is_self", "is_webhook", "is_member",
+        "is_thread", "has_prefix", "topic", "directives", "urls", "invites",
+        "has_mention"
+    )
+
+    def __init__(self, message: discord.Message, prefixes: tuple[str, ...], user_id: int):
+        self.message = message
+        self.guild: Optional[discord.Guild] = message.guild
+        self.is_bot: bool = message.author.bot
+        self.is_self = message.author.id == user_id
+        self.is_webhook = message.webhook_id is not None
+        self.is_member = isinstance(message.author, discord.Member)
+        self.is_thread = isinstance(message.channel, discord.Thread)
+        content = message.content
+        self.has_prefix = bool(prefixes) and content.startswith(prefixes)
+        self.topic: str = getattr(message.channel, "topic", None) or ""
+        self.directives: Mapping[str, str] = topics.directives(message.channel)
+        if "://" in content:
+            self.urls: list[str] = URL_PATTERN.findall(content)
+        else:
+            self.urls = []
+        self.invites: list[str] = INVITE_PATTERN.findall(content) if "discord" in content else []
+        self.has_mention = bool(
+            message.mentions or message.role_mentions or message.mention_everyone
+        )
+
+
+@dataclass
+class StageStats:
+    "ステージ毎の実行時間などの統計です。"
+
+    calls: int = 0
+    skipped: int = 0
+    errors: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    @property
+    def average(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+class Stage:
+    "パイプラインのステージです。`message_stage`で作られます。"
+
+    __slots__ = (
+        "name", "callback", "cog", "guild_only", "bots", "self_messages",
+        "webhooks", "members_only", "prefix", "threads", "content",
+        "topic", "urls", "invites", "mentions", "enabled", "order"
+    )
+
+    def __init__(self, callback: Callable[..., Any], cog: commands.Cog, options: dict):
+        self.callback, self.cog = callback, cog
+        self.name: str = options.pop("name") or f"{cog.qualified_name}.{callback.__name__}"
+        for key, value in options.items():
+            setattr(self, key, value)
+
+    def match(self, info: MessageInfo) -> bool:
+        "このステージがメッセージを処理する必要があるかどうかを調べます。"
+        if info.guild is None:
+            if self.guild_only:
+                return False
+        elif not self.threads and info.is_thread:
+            return False
+        if ((info.is_self and not self.self_messages)
+                or (info.is_bot and not self.bots and not info.is_self)
+                or (info.is_webhook and not self.webhooks)
+                or (self.members_only and not info.is_member)
+                or (info.has_prefix and not self.prefix)
+                or (self.content and not info.message.content)
+                or (self.urls and not info.urls)
+                or (self.invites and not info.invites)
+                or (self.mentions and not info.has_mention)
+                or (self.topic and not any(
+                    directive in info.directives for directive in self.topic
+                ))):
+            return False
+        return self.enabled is None or bool(self.enabled(self.cog, info.message))
+
+
+def message_stage(
+    name: Optional[str] = None, *, guild_only: bool = True, bots: bool = False,
+    self_messages: bool = False, webhooks: bool = True, members_only: bool = False,
+    prefix: bool = True, threads: bool = True, content: bool = False,
+    topic: tuple[str, ...] = (), urls: bool = False, invites: bool = False,
+    mentions: bool = False, enabled: Optional[Callable[[Any, discord.Message], bool]] = None,
+    order: int = 0
+):
+    """コグのメソッドをメッセージパイプラインのステージにするデコレータです。  
+    `commands.Cog.listener()`で`on_message`を作る代わりに使います。
+
+    Parameters
+    ----------
+    name : str, optional
+        ステージの名前です。デフォルトは`コグ名.メソッド名`です。
+    guild_only : bool, default True
+        サーバーのメッセージだけを処理するかどうかです。
+    bots : bool, default False
+        Botのメッセージも処理するかどうかです。
+    self_messages : bool, default False
+        RT自身のメッセージも処理するかどうかです。
+    webhooks : bool, default True
+        ウェブフックのメッセージも処理するかどうかです。
+    members_only : bool, default False
+        送信者が`discord.Member`のメッセージだけを処理するかどうかです。
+    prefix : bool, default True
+        プレフィックスで始まるメッセージも処理するかどうかです。
+    threads : bool, default True
+        スレッドのメッセージも処理するかどうかです。
+    content : bool, default False
+        内容が空ではないメッセージだけを処理するかどうかです。
+    topic : tuple[str, ...], default ()
+        指定した場合はチャンネルトピックにこの設定のどれかがあるメッセージだけを処理します。  
+        設定は`util.topic_index.parse_topic`で解析されたものです。
+    urls : bool, default False
+        URLがあるメッセージだけを処理するかどうかです。
+    invites : bool, default False
+        招待リンクがあるメッセージだけを処理するかどうかです。
+    mentions : bool, default False
+        メンションがあるメッセージだけを処理するかどうかです。
+    enabled : Callable[[Cog, discord.Message], bool], optional
+        他の条件を満たした時に呼ばれる関数です。  
+        サーバーで機能が有効かどうかなどをキャッシュから調べるのに使います。
+    order : int, default 0
+        ステージの順番です。小さいものから順に開始されます。"""
+    options = dict(
+        name=name, guild_only=guild_only, bots=bots, self_messages=self_messages,
+        webhooks=webhooks, members_only=members_only, prefix=prefix,
+        threads=threads, content=content, topic=topic, urls=urls,
+        invites=invites, mentions=mentions, enabled=enabled, order=order
+    )
+
+    def decorator(function):
+        function.__message_stage__ = options
+        return function
+    return decorator
+
+
+class MessagePipeline(commands.Cog):
+    "メッセージを一度だけ調べて、必要なステージだけに渡すためのコグです。"
+
+    def __init__(self, bot: RT):
+        self.bot = bot
+        self.stages: list[Stage] = []
+        self.stats: defaultdict[str, StageStats] = defaultdict(StageStats)
+        self.messages = 0
+        self._dirty, self._cog_count = True, 0
+        self._prefixes: Optional[tuple[str, ...]] = None
+
+    def _rebuild(self) -> None:
+        # 読み込まれているコグからステージを集める。
+        stages = []
+        for cog in self.bot.cogs.values():
+            seen = set()
+            for cls in type(cog).__mro__:
+                for key, function in cls.__dict__.items():
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    if (options := getattr(function, "__message_stage__", None)) is not None:
+                        stages.append(Stage(getattr(cog, key), cog, options.copy()))
+        stages.sort(key=lambda stage: stage.order)
+        self.stages = stages
+        self._dirty, self._cog_count = False, len(self.bot.cogs)
+
+    @commands.Cog.listener()
+    async def on_cog_add(self, _):
+        self._dirty = True
+
+    @commands.Cog.listener()
+    async def on_cog_remove(self, _):
+        self._dirty = True
+
+    @property
+    def prefixes(self) -> tuple[str, ...]:
+        "プレフィックスのタプルです。関数のプレフィックスの場合は空になります。"
+        if self._prefixes is None:
+            prefix = self.bot.command_prefix
+            self._prefixes = (
+                (prefix,) if isinstance(prefix, str) else
+                () if callable(prefix) else tuple(prefix)
+            )
+        return self._prefixes
+
+    async def _run(self, stage: Stage, message: discord.Message) -> None:
+        # ステージを実行して時間を記録する。
+        stats = self.stats[stage.name]
+        start = perf_counter()
+        try:
+            await stage.callback(message)
+        except Exception:
+            stats.errors += 1
+            await self.bot.on_error(f"on_message:{stage.name}", message)
+        finally:
+            elapsed = perf_counter() - start
+            stats.calls += 1
+            stats.total += elapsed
+            if elapsed > stats.max:
+                stats.max = elapsed
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if self._dirty or self._cog_count != len(self.bot.cogs):
+            self._rebuild()
+        self.messages += 1
+        info = MessageInfo(message, self.prefixes, self.bot.user.id)
+        stages = []
+        for stage in self.stages:
+            if stage.match(info):
+                stages.append(self._run(stage, message))
+            else:
+                self.stats[stage.name].skipped += 1
+        if stages:
+            await gather(*stages)
+
+    def report(self) -> str:
+        "ステージ毎の統計のレポートを作ります。"
+        lines = [f"Messages: {self.messages} Stages: {len(self.stages)}"]
+        for name, stats in sorted(
+            self.stats.items(), key=lambda item: item[1].total, reverse=True
+        ):
+            lines.append(
+                f"{stats.total * 1000:9.1f}ms n={stats.calls} skip={stats.skipped} "
+                f"avg={stats.average * 1000:.2f}ms max={stats.max * 1000:.1f}ms "
+                f"err={stats.errors} {name}"
+            )
+        return "\n".join(lines)
+
+
+async def setup(bot):
+    await bot.add_cog(MessagePipeline(bot))
@@ -1,17 +1,345 @@
 # Free RT Util - MySQL Manager
 
-from typing import Any, Dict, Tuple
+from typing import Optional, Any, Callable, Dict, Tuple, List
 
-from asyncio import get_event_loop, iscoroutinefunction
-from aiomysql import create_pool, connect
-from functools import wraps
+from asyncio import get_event_loop, iscoroutinefunction, sleep
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from time import perf_counter, time
+from bisect import bisect_left
+from re import compile as re_compile
+
+from aiomysql import connect
+from functools import wraps, lru_cache
 import warnings
+import aiomysql
 import ujson
 
 
 warnings.filterwarnings('ignore', module=r"aiomysql")
 
 
+@lru_cache(maxsize=1024)
+def compile_query(
+    mode: str, table: str, columns: Tuple[str, ...],
+    conditions: Tuple[str, ...] = (), custom: str = ""
+) -> str:
+    """`Cursor`で使うクエリを作ります。  
+    同じテーブルと列の組み合わせのクエリはキャッシュされ、二回目からは作り直されません。
+
+    Parameters
+    ----------
+    mode : str
+        `select`, `exists`, `insert`, `update`, `upsert`, `insert_absent`, `delete`のどれかです。  
+        `upsert`の場合は`conditions`に更新する列を渡します。
+    table : str
+        対象のテーブルです。
+    columns : Tuple[str, ...]
+        値を入れる列です。
+    conditions : Tuple[str, ...]
+        条件に使う列です。
+    custom : str
+        `select`の最後に付け足す文字列です。"""
+    where = (
+        " WHERE " + " AND ".join(f"{column} = %s" for column in conditions)
+        if conditions else ""
+    )
+    names = ", ".join(columns)
+    placeholders = ", ".join(("%s",) * len(columns))
+    if mode == "select":
+        return f"SELECT * FROM {table}{where}{' ' + custom if custom else custom}"
+    elif mode == "exists":
+        return f"SELECT 1 FROM {table}{where} LIMIT 1"
+    elif mode == "insert":
+        return f"INSERT INTO {table} ({names}) VALUES ({placeholders})"
+    elif mode == "update":
+        return "UPDATE {} SET {}{}".format(
+            table, ", ".join(f"{column} = %s" for column in columns), where
+        )
+    elif mode == "upsert":
+        return "INSERT INTO {} ({}) VALUES ({}) ON DUPLICATE KEY UPDATE {}".format(
+            table, names, placeholders,
+            ", ".join(f"{column} = VALUES({column})" for column in conditions)
+        )
+    elif mode == "insert_absent":
+        return (f"INSERT INTO {table} ({names}) SELECT {placeholders} FROM DUAL "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {table}{where})")
+    elif mode == "delete":
+        return f"DELETE FROM {table}{where}"
+    raise ValueError(f"Unknown mode: {mode}")
+
+
+class Histogram:
+    "時間(秒)の分布を数えるためのクラスです。"
+
+    BOUNDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count, self.total, self.max = 0, 0.0, 0.0
+
+    def add(self, value: float) -> None:
+        "値を追加します。"
+        self.buckets[bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        "指定したパーセンタイルの値を返します。値はその値が入っている区間の上限です。"
+        if not self.count:
+            return 0.0
+        threshold, seen = self.count * p / 100, 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= threshold:
+                return self.BOUNDS[i] if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def __str__(self) -> str:
+        return " ".join(
+            f"<{bound * 1000:g}ms:{count}" for bound, count in zip(
+                self.BOUNDS + (float("inf"),), self.buckets
+            ) if count
+        ) or "-"
+
+
+@dataclass
+class QueryStats:
+    "クエリ毎の実行時間の統計です。"
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+
+_NORMALIZE_PATTERNS = (
+    (re_compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\""), "?"),
+    (re_compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b"), "?"),
+    (re_compile(r"%s"), "?"),
+    (re_compile(r"\((?:\s*\?\s*,)*\s*\?\s*\)(?:\s*,\s*\((?:\s*\?\s*,)*\s*\?\s*\))+"), "(?), ..."),
+    (re_compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?, ...)"),
+    (re_compile(r"\s+"), " ")
+)
+
+
+@lru_cache(maxsize=2048)
+def normalize_query(query: str) -> str:
+    "クエリにある値を`?`にして、同じ形のクエリが同じ文字列になるようにします。"
+    for pattern, replacement in _NORMALIZE_PATTERNS:
+        query = pattern.sub(replacement, query)
+    return query.strip()[:200]
+
+
+@dataclass
+class PoolSizePolicy:
+    """プールの最大接続数を自動で調整するための設定です。  
+    `MySQLManager`に`size_policy`として渡すと`interval`秒毎に`PoolMonitor`の記録を見て最大接続数を調整します。
+
+    Parameters
+    ----------
+    minimum : int, default 10
+        最大接続数の下限です。
+    maximum : int, default 500
+        最大接続数の上限です。MySQLの`max_connections`より小さくしましょう。
+    interval : float, default 60.0
+        調整をする間隔です。
+    wait_threshold : float, default 0.05
+        接続の取得待ちの95パーセンタイルがこの秒数を超えたら最大接続数を増やします。
+    high : float, default 0.9
+        同時使用数の最大が最大接続数のこの割合を超えたら最大接続数を増やします。
+    low : float, default 0.25
+        同時使用数の最大が最大接続数のこの割合を下回ったら最大接続数を減らします。"""
+
+    minimum: int = 10
+    maximum: int = 500
+    interval: float = 60.0
+    wait_threshold: float = 0.05
+    high: float = 0.9
+    low: float = 0.25
+
+    def decide(self, current: int, waits: Histogram, peak: int) -> int:
+        "前回の調整からの記録を元に新しい最大接続数を決めます。"
+        if waits.percentile(95) > self.wait_threshold or peak >= current * self.high:
+            size = current * 2
+        elif peak < current * self.low and waits.percentile(95) <= self.wait_threshold:
+            size = max(peak * 2, current // 2)
+        else:
+            size = current
+        return min(max(size, self.minimum), self.maximum)
+
+
+class PoolMonitor:
+    """データベースのプールとクエリの統計を取るためのクラスです。  
+    `MonitoredPool`と`TimedCursor`から記録されます。  
+    `rf!debug db`でレポートを見ることができます。"""
+
+    SLOW_QUERY = 0.5
+    "この秒数以上かかったクエリは遅いクエリとして記録されます。"
+
+    def __init__(self):
+        self.print: Callable[..., None] = print
+        "ログの出力に使う関数です。ボットの起動時に`bot.print`に置き換えられます。"
+        self.acquire_waits = Histogram()
+        self.holds = Histogram()
+        self.queries: Dict[str, QueryStats] = defaultdict(QueryStats)
+        self.calls: Dict[str, QueryStats] = defaultdict(QueryStats)
+        self.slow_queries: deque = deque(maxlen=50)
+        self.in_use = 0
+        self.resizes: deque = deque(maxlen=10)
+        self._acquired: Dict[int, float] = {}
+        self.reset_window()
+
+    def reset_window(self) -> None:
+        "プールの大きさの調整のための記録をリセットします。"
+        self.window_waits = Histogram()
+        self.window_peak = self.in_use
+
+    def on_acquire(self, conn: Any, wait: float) -> None:
+        self.acquire_waits.add(wait)
+        self.window_waits.add(wait)
+        self.in_use += 1
+        if self.in_use > self.window_peak:
+            self.window_peak = self.in_use
+        self._acquired[id(conn)] = perf_counter()
+
+    def on_release(self, conn: Any) -> None:
+        if (start := self._acquired.pop(id(conn), None)) is not None:
+            self.in_use -= 1
+            self.holds.add(perf_counter() - start)
+
+    def on_query(self, query: Any, elapsed: float) -> None:
+        if isinstance(query, (bytes, bytearray)):
+            # `executemany`の`INSERT`は値を埋め込んでまとめたクエリを`bytearray`で実行する。
+            # 値が毎回違うので、キャッシュが大きくならないように先頭だけを使う。
+            query = bytes(query[:2048]).decode("utf-8", "ignore")
+        query = normalize_query(query)
+        self.queries[query].add(elapsed)
+        if elapsed >= self.SLOW_QUERY:
+            self.slow_queries.append((time(), elapsed, query))
+            self.print("[MySQL]", f"Slow query ({elapsed * 1000:.1f}ms): {query}")
+
+    def on_call(self, name: str, elapsed: float) -> None:
+        self.calls[name].add(elapsed)
+
+    def report(self, pool: Optional["MonitoredPool"] = None, top: int = 8) -> str:
+        "統計のレポートを作ります。"
+        lines = []
+        if pool is not None:
+            lines.append(
+                f"Pool: size={pool.size} free={pool.freesize} "
+                f"max={pool.maxsize} in_use={self.in_use}"
+            )
+        lines.append(
+            "Acquire wait: n={0.count} avg={1:.2f}ms p95={2:.1f}ms max={3:.1f}ms".format(
+                self.acquire_waits, self.acquire_waits.average * 1000,
+                self.acquire_waits.percentile(95) * 1000, self.acquire_waits.max * 1000
+            )
+        )
+        lines.append(f"  {self.acquire_waits}")
+        lines.append(
+            "Hold: avg={:.2f}ms p95={:.1f}ms max={:.1f}ms".format(
+                self.holds.average * 1000, self.holds.percentile(95) * 1000,
+                self.holds.max * 1000
+            )
+        )
+        for title, data in (("Queries", self.queries), ("Calls", self.calls)):
+            if data:
+                lines.append(f"{title} (total time):")
+                for name, stats in sorted(
+                    data.items(), key=lambda item: item[1].total, reverse=True
+                )[:top]:
+                    lines.append(
+                        f"  {stats.total * 1000:8.1f}ms n={stats.count} "
+                        f"max={stats.max * 1000:.1f}ms {name[:80]}"
+                    )
+        if self.slow_queries:
+            lines.append(f"Slow queries (>={self.SLOW_QUERY * 1000:g}ms):")
+            for at, elapsed, query in list(self.slow_queries)[-5:]:
+                lines.append(f"  <t:{int(at)}:T> {elapsed * 1000:.1f}ms {query[:80]}")
+        if self.resizes:
+            lines.append("Resizes: " + ", ".join(
+                f"{before}->{after}" for _, before, after in self.resizes
+            ))
+        return "\n".join(lines)
+
+
+monitor = PoolMonitor()
+"データベースの統計です。"
+
+
+class TimedCursor(aiomysql.Cursor):
+    "実行したクエリの時間を`monitor`に記録するカーソルです。"
+
+    async def execute(self, query, args=None):
+        start = perf_counter()
+        try:
+            return await super().execute(query, args)
+        finally:
+            try:
+                monitor.on_query(query, perf_counter() - start)
+            except Exception as e:
+                # 記録の失敗でクエリが失敗したことにならないようにする。
+                monitor.print("[MySQL]", f"Failed to record query: {e!r}")
+
+
+class MonitoredPool(aiomysql.Pool):
+    """接続の取得待ちの時間と使用時間を`monitor`に記録するプールです。  
+    `resize`で最大接続数を変えることができます。"""
+
+    async def _acquire(self):
+        start = perf_counter()
+        conn = await super()._acquire()
+        monitor.on_acquire(conn, perf_counter() - start)
+        return conn
+
+    def release(self, conn):
+        monitor.on_release(conn)
+        if conn in self._used and not conn.closed and self.size > self.maxsize:
+            # 最大接続数を減らした後なら、空きに戻さずに閉じる。
+            self._used.remove(conn)
+            conn.close()
+            fut = self._loop.create_future()
+            fut.set_result(None)
+            return fut
+        return super().release(conn)
+
+    async def resize(self, maxsize: int) -> None:
+        "最大接続数を変更します。"
+        async with self._cond:
+            while len(self._free) > maxsize:
+                self._free.popleft().close()
+            self._free = deque(self._free, maxlen=maxsize)
+            self._cond.notify_all()
+
+
+async def create_monitored_pool(
+    minsize: int = 1, maxsize: int = 10, echo: bool = False,
+    pool_recycle: int = -1, loop=None, **kwargs
+) -> MonitoredPool:
+    "`aiomysql.create_pool`の`MonitoredPool`を作る版です。"
+    kwargs.setdefault("cursorclass", TimedCursor)
+    pool = MonitoredPool(
+        minsize=minsize, maxsize=maxsize, echo=echo,
+        pool_recycle=pool_recycle, loop=loop or get_event_loop(), **kwargs
+    )
+    if minsize > 0:
+        async with pool._cond:
+            await pool._fill_free_pool(False)
+    return pool
+
+
 class Cursor:
     """データベースの操作を簡単に行うためのクラスです。  
     `Cursor.get_data`などの便利なものが使えます。  
@@ -118,19 +446,24 @@ class Cursor:
         if commit:
             await self.connection.commit()
 
-    def _get_column_args(
-            self, values: Dict[str, Any], format_text: str = "{} = %s AND ",
-            json_dump: bool = False
-    ) -> Tuple[str, list]:
-        conditions, args = "", []
-        for key in values:
-            conditions += format_text.format(key)
-            args.append(
-                ujson.dumps(values[key])
-                if json_dump and isinstance(values[key], dict)
-                else values[key]
-            )
-        return conditions, args
+    @staticmethod
+    def _dump_args(values: Dict[str, Any]) -> list:
+        # 値のリストを作る。辞書はjsonにする。
+        return [
+            ujson.dumps(value) if isinstance(value, dict) else value
+            for value in values.values()
+        ]
+
+    @staticmethod
+    def _load_row(row: Optional[tuple]) -> list:
+        # 取得した行にあるjsonの文字列を辞書にする。
+        if row is None:
+            return []
+        return [
+            ((ujson.loads(value) if (value and value[0] == "{" and value[-1] == "}") else value)
+             if isinstance(value, str) else value)
+            for value in row if value is not None
+        ]
 
     async def insert_data(
         self, table: str, values: Dict[str, Any],
@@ -154,17 +487,35 @@ class Cursor:
         async with db.get_cursor() as cursor:
             values = {"name": "Takkun", "data": {"detail": "愉快"}}
             await cursor.post_data("tasuren_friends", values)"""
-        conditions, args = self._get_column_args(
-            values, "{}, ", json_dump=True
-        )
-        query = ("%s, " * len(args))[:-2]
         await self.cursor.execute(
-            f"INSERT INTO {table} ({conditions[:-2]}) VALUES ({query})",
-            args
+            compile_query("insert", table, tuple(values)), self._dump_args(values)
         )
         if commit:
             await self.connection.commit()
 
+    async def insert_many(
+        self, table: str, rows: List[Dict[str, Any]], commit: bool = True
+    ) -> None:
+        """複数の行を一度に追加します。  
+        全ての行は同じ列を持っている必要があります。  
+        aiomysqlの`executemany`により一つの`INSERT`文にまとめて送られます。
+
+        Parameters
+        ----------
+        table : str
+            対象のテーブルです。
+        rows : List[Dict[str, Any]]
+            追加する行のリストです。
+        commit : bool, default True
+            追加後に自動で`MySQLManager.commit`を実行するかどうかです。"""
+        if rows:
+            await self.cursor.executemany(
+                compile_query("insert", table, tuple(rows[0])),
+                [self._dump_args(row) for row in rows]
+            )
+            if commit:
+                await self.connection.commit()
+
     async def update_data(
         self, table: str, values: Dict[str, Any],
         targets: Dict[str, Any], commit: bool = True,
@@ -182,19 +533,53 @@ class Cursor:
             更新するデータの条件です。
         commit : bool, default True
             更新後に自動で`MySQLManager.commit`を実行するかどうかです。"""
-        values, values_args = self._get_column_args(
-            values, "{} = %s, ", True
-        )
-        conditions, conditions_args = self._get_column_args(
-            targets, json_dump=True
-        )
         await self.cursor.execute(
-            f"UPDATE {table} SET {values[:-2]} WHERE {conditions[:-4]}",
-            values_args + conditions_args
+            compile_query("update", table, tuple(values), tuple(targets)),
+            self._dump_args(values) + self._dump_args(targets)
         )
         if commit:
             await self.connection.commit()
 
+    async def upsert(
+        self, table: str, values: Dict[str, Any], targets: Dict[str, Any],
+        unique: bool = False, commit: bool = True
+    ) -> None:
+        """特定のデータがあれば更新し、なければ追加します。  
+        `exists`をしてから`update_data`または`insert_data`をするより少ない往復で済みます。
+
+        Parameters
+        ----------
+        table : str
+            対象のテーブルです。
+        values : Dict[str, Any]
+            更新する内容です。
+        targets : Dict[str, Any]
+            更新するデータの条件です。追加する場合はこれも列の値として使われます。
+        unique : bool, default False
+            `targets`の列に主キーまたはユニークキーがあるかどうかです。  
+            Trueの場合は`INSERT ... ON DUPLICATE KEY UPDATE`の一回で済みます。
+        commit : bool, default True
+            更新後に自動で`MySQLManager.commit`を実行するかどうかです。"""
+        row = {**targets, **values}
+        if unique:
+            await self.cursor.execute(
+                compile_query("upsert", table, tuple(row), tuple(values)),
+                self._dump_args(row)
+            )
+        else:
+            await self.cursor.execute(
+                compile_query("update", table, tuple(values), tuple(targets)),
+                self._dump_args(values) + self._dump_args(targets)
+            )
+            if not self.cursor.rowcount:
+                # 値が同じで更新されなかった場合もあるので、ない場合のみ追加する。
+                await self.cursor.execute(
+                    compile_query("insert_absent", table, tuple(row), tuple(targets)),
+                    self._dump_args(row) + self._dump_args(targets)
+                )
+        if commit:
+            await self.connection.commit()
+
     async def exists(self, table: str, targets: Dict[str, Any], json: bool = False) -> bool:
         """特定のテーブルに特定のデータが存在しているかどうかを確認します。
 
@@ -209,7 +594,10 @@ class Cursor:
         -------
         exists : bool
             存在しているならTrue、存在しないならFalseです。"""
-        return bool(await self.get_data(table, targets, json=json))
+        await self.cursor.execute(
+            compile_query("exists", table, (), tuple(targets)), self._dump_args(targets)
+        )
+        return await self.cursor.fetchone() is not None
 
     async def delete(
         self, table: str, targets: Dict[str, Any], commit: bool = True,
@@ -225,10 +613,8 @@ class Cursor:
             削除するデータの条件です。
         commit : bool, default True
             削除後に自動で`MySQLManager.commit`を実行するかどうかです。"""
-        conditions, args = self._get_column_args(targets, json_dump=True)
         await self.cursor.execute(
-            f"DELETE FROM {table} WHERE {conditions[:-4]}",
-            args
+            compile_query("delete", table, (), tuple(targets)), self._dump_args(targets)
         )
         if commit:
             await self.connection.commit()
@@ -260,16 +646,9 @@ class Cursor:
         Notes
         -----
         もし条件関係なく全てを取得したい場合は引数の`targets`を空である`{}`にしましょう。"""
-        if targets:
-            conditions, args = self._get_column_args(
-                targets, json_dump=True
-            )
-            conditions = " WHERE " + conditions[:-4]
-        else:
-            conditions, args = "", ()
         await self.cursor.execute(
-            f"SELECT * FROM {table}{conditions}{' ' + custom if custom else custom}",
-            args
+            compile_query("select", table, (), tuple(targets), custom),
+            self._dump_args(targets)
         )
         if _fetchall:
             list_rows = await self.cursor.fetchall()
@@ -277,17 +656,9 @@ class Cursor:
             list_rows = [await self.cursor.fetchone()]
         if list_rows:
             for rows in list_rows:
-                if rows is None:
-                    yield []
-                else:
-                    rows = [
-                        ((ujson.loads(row) if (row and row[0] == "{" and row[-1] == "}")else row)
-                         if isinstance(row, str) else row)
-                        for row in rows if row is not None
-                    ]
-                    yield rows
-                    if not _fetchall:
-                        break
+                yield self._load_row(rows)
+                if not _fetchall:
+                    break
         else:
             yield []
 
@@ -307,6 +678,24 @@ class Cursor:
                 # -> {"detail": "愉快"} (辞書データ)"""
         return [row async for row in self.get_datas(table, targets, _fetchall=False, json=json)][0]
 
+    async def get_or_none(self, table: str, targets: Dict[str, Any]) -> Optional[list]:
+        """一つだけデータを取得します。見つからない場合は`None`を返します。  
+        `exists`をしてから`get_data`をする代わりに使うことで一回の往復で済みます。
+
+        Parameters
+        ----------
+        table : str
+            対象のテーブルです。
+        targets : Dict[str, Any]
+            取得するデータの条件です。"""
+        await self.cursor.execute(
+            compile_query("select", table, (), tuple(targets), "LIMIT 1"),
+            self._dump_args(targets)
+        )
+        if (row := await self.cursor.fetchone()) is None:
+            return None
+        return self._load_row(row)
+
 
 class MySQLManager:
     """MySQLを簡単に使うためのモジュールです。  
@@ -327,7 +716,11 @@ class MySQLManager:
     Parameters
     ----------
     pool : bool, default False
-        プールを使用します。
+        プールを使用します。  
+        プールは`MonitoredPool`で、取得待ちの時間やクエリの時間が`monitor`に記録されます。
+    size_policy : PoolSizePolicy, optional
+        プールの最大接続数を自動で調整する場合の設定です。  
+        指定した場合は`maxsize`は最初の最大接続数となります。
     **kwargs : dict
         `aiomysql.connect`または`aiomysql.create_pool`に渡すキーワード引数です。
 
@@ -356,19 +749,39 @@ class MySQLManager:
     async with db.get_cursor() as cursor:
         ..."""
 
-    def __init__(self, pool: bool = False, _pool_c=False, **kwargs):
+    def __init__(
+        self, pool: bool = False, _pool_c=False,
+        size_policy: Optional[PoolSizePolicy] = None, **kwargs
+    ):
         self.connection, self.pool = None, None
         self._real_pool = None
+        self.size_policy = size_policy
         self.loop = kwargs.get("loop", get_event_loop())
         self.loop.create_task(self._setup(pool, _pool_c, kwargs))
 
     async def _setup(self, pool, _pool_c, kwargs) -> None:
         # データベースの準備をする。
         if pool and not _pool_c:
-            self.pool = await create_pool(**kwargs)
+            self.pool = await create_monitored_pool(**kwargs)
+            if self.size_policy is not None:
+                self.loop.create_task(self._adjust_pool_size())
         elif not _pool_c:
             self.connection = await connect(**kwargs)
 
+    async def _adjust_pool_size(self) -> None:
+        # 定期的に統計を見てプールの最大接続数を調整する。
+        while self.pool is not None and not self.pool._closed:
+            monitor.reset_window()
+            await sleep(self.size_policy.interval)
+            if self.pool is None:
+                break
+            size = self.size_policy.decide(
+                self.pool.maxsize, monitor.window_waits, monitor.window_peak
+            )
+            if size != self.pool.maxsize:
+                monitor.resizes.append((time(), self.pool.maxsize, size))
+                await self.pool.resize(size)
+
     async def get_database(self):
         """このクラスの定義済みのものをプールを使って取得します。  
         これはこのクラスの定義時`pool=True`と言う引数を作っている場合のみ使用できます。  
@@ -437,3 +850,71 @@ class DatabaseManager:
                 await self._close(conn, cursor)
                 return data
         return new_coro
+
+
+if __name__ == "__main__":
+    # ローカルのMySQL/MariaDBに対して往復回数を減らしたクエリの速度を計測します。
+    # 接続先は環境変数の`RT_BENCH_HOST`,`RT_BENCH_USER`,`RT_BENCH_PASSWORD`,`RT_BENCH_DB`で指定します。
+    # 使い方: python -m util.mysql_manager
+    from os import getenv
+
+    N = 500
+    TABLE = "mysql_manager_bench"
+
+    async def bench():
+        db = MySQLManager(
+            loop=get_event_loop(), user=getenv("RT_BENCH_USER", "root"),
+            host=getenv("RT_BENCH_HOST", "localhost"),
+            password=getenv("RT_BENCH_PASSWORD", ""),
+            db=getenv("RT_BENCH_DB", "test"), pool=True
+        )
+        while db.pool is None:
+            await sleep(0.01)
+        conn = await db.get_database()
+        cursor = conn.get_cursor()
+        await cursor.prepare_cursor()
+        await cursor.cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await cursor.create_table(TABLE, {"ID": "BIGINT", "Data": "JSON"})
+
+        def report(name, start):
+            elapsed = perf_counter() - start
+            print(f"{name:<24}{elapsed * 1000:9.2f}ms ({elapsed / N * 1000000:8.1f}us/op)")
+
+        start = perf_counter()
+        for i in range(N):
+            await cursor.insert_data(TABLE, {"ID": i, "Data": {"i": i}})
+        report("insert_data x N", start)
+        await cursor.delete(TABLE, {})
+        start = perf_counter()
+        await cursor.insert_many(TABLE, [{"ID": i, "Data": {"i": i}} for i in range(N)])
+        report("insert_many", start)
+
+        start = perf_counter()
+        for i in range(N):
+            if await cursor.exists(TABLE, {"ID": i}):
+                await cursor.get_data(TABLE, {"ID": i})
+        report("exists + get_data", start)
+        start = perf_counter()
+        for i in range(N):
+            await cursor.get_or_none(TABLE, {"ID": i})
+        report("get_or_none", start)
+
+        start = perf_counter()
+        for i in range(N):
+            if await cursor.exists(TABLE, {"ID": i}):
+                await cursor.update_data(TABLE, {"Data": {"i": -i}}, {"ID": i})
+            else:
+                await cursor.insert_data(TABLE, {"ID": i, "Data": {"i": -i}})
+        report("exists + update/insert", start)
+        start = perf_counter()
+        for i in range(N):
+            await cursor.upsert(TABLE, {"Data": {"i": i}}, {"ID": i})
+        report("upsert", start)
+        print(compile_query.cache_info())
+        print(monitor.report(db.pool))
+
+        await cursor.cursor.execute(f"DROP TABLE {TABLE}")
+        await cursor.close()
+        conn.close()
+
+    get_event_loop().run_until_complete(bench())
@@ -76,7 +76,10 @@ def lib_setup(bot, only: Union[Tuple[str, ...], List[str]] = []):
                 bot.load_extension("util.ext." + name)
             except commands.ExtensionAlreadyLoaded:
                 pass
-    for name in ("dochelp", "rtws", "websocket", "debug", "settings", "lib_data_manager"):
+    for name in (
+        "dochelp", "rtws", "websocket", "debug", "settings", "lib_data_manager", "webhooks",
+        "topic_index", "message_pipeline", "bans"
+    ):
         if name in only or only == []:
             try:
                 bot.load_extension("util." + name)
@@ -0,0 +1,190 @@
+# Free RT Util - Topic Index
+
+"""チャンネルトピックにある`rt>thread`や`RT-GlobalChat`のような設定の索引です。  
+トピックは一度だけ解析され、チャンネルの作成/更新/削除のイベントで最新に保たれます。  
+`topics.directives(channel)`でチャンネルにある設定を、`topics.find(guild, "rf>log")`で設定があるチャンネルを取得できます。
+
+# Examples
+```python
+from util.topic_index import topics
+
+if (channel := topics.find(guild, "rt>automod")) is not None:
+    await channel.send("...")
+if (language := topics.get(message.channel, "rf>translate")) is not None:
+    ...
+```"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional, Mapping
+
+from collections import defaultdict
+from functools import lru_cache
+from types import MappingProxyType
+
+from discord.ext import commands
+import discord
+
+if TYPE_CHECKING:
+    from .bot import RT
+
+
+DIRECTIVE_PREFIXES = ("rt>", "rf>")
+"チャンネルトピックの設定の始まりの文字列です。"
+ATTACHED_DIRECTIVES = ("rt>star",)
+"`rt>star3`のように値を空白を空けずに続けて書くことができる設定です。"
+TOPIC_MARKERS = ("RT-GlobalChat", "RTフリーチャンネル", "RTチケットチャンネル")
+"チャンネルトピックに含めることで機能を有効にする文字列です。"
+NAME_MARKERS = ("log-rt",)
+"チャンネル名に含めることで機能を有効にする文字列です。"
+EMPTY: Mapping[str, str] = MappingProxyType({})
+
+
+@lru_cache(maxsize=4096)
+def parse_topic(topic: str) -> Mapping[str, str]:
+    """チャンネルトピックから設定を取り出します。  
+    `rf>translate ja`のような設定は`{"rf>translate": "ja"}`のように、設定の後の同じ行にある文字列が値になります。  
+    `ATTACHED_DIRECTIVES`にある設定は`rt>star3`のように書かれていても`{"rt>star": "3"}`になります。  
+    `RT-GlobalChat`のような目印の値は空文字列です。"""
+    directives = {}
+    for line in topic.splitlines():
+        words = line.split()
+        for i, word in enumerate(words):
+            if word.startswith(DIRECTIVE_PREFIXES):
+                value = " ".join(words[i + 1:])
+                for directive in ATTACHED_DIRECTIVES:
+                    if word != directive and word.startswith(directive):
+                        word, value = directive, f"{word[len(directive):]} {value}".rstrip()
+                        break
+                directives.setdefault(word, value)
+    for marker in TOPIC_MARKERS:
+        if marker in topic:
+            directives.setdefault(marker, "")
+    return MappingProxyType(directives)
+
+
+class TopicIndex:
+    """チャンネルトピックの設定の索引です。  
+    サーバーはそのサーバーの設定が初めて必要になった時に索引が作られます。"""
+
+    def __init__(self):
+        self.channels: dict[int, Mapping[str, str]] = {}
+        self.guilds: defaultdict[int, dict[str, dict[int, None]]] = defaultdict(dict)
+        self.indexed: set[int] = set()
+
+    @staticmethod
+    def parse(channel: discord.abc.GuildChannel) -> Mapping[str, str]:
+        "チャンネルの設定を解析します。"
+        directives = parse_topic(topic) if (topic := getattr(channel, "topic", None)) else EMPTY
+        if any(marker in channel.name for marker in NAME_MARKERS):
+            directives = MappingProxyType({
+                **directives, **{
+                    marker: "" for marker in NAME_MARKERS if marker in channel.name
+                }
+            })
+        return directives
+
+    def update(self, channel: discord.abc.GuildChannel) -> Mapping[str, str]:
+        "チャンネルの索引を更新します。"
+        self.remove(channel)
+        if not isinstance(channel, discord.TextChannel):
+            return EMPTY
+        if directives := self.parse(channel):
+            self.channels[channel.id] = directives
+            guild = self.guilds[channel.guild.id]
+            for directive in directives:
+                guild.setdefault(directive, {})[channel.id] = None
+        return directives
+
+    def remove(self, channel: discord.abc.GuildChannel) -> None:
+        "チャンネルを索引から削除します。"
+        if (directives := self.channels.pop(channel.id, None)) is not None:
+            guild = self.guilds[channel.guild.id]
+            for directive in directives:
+                if directive in guild:
+                    guild[directive].pop(channel.id, None)
+                    if not guild[directive]:
+                        del guild[directive]
+
+    def index_guild(self, guild: discord.Guild) -> None:
+        "サーバーの索引がまだないのなら作ります。"
+        if guild.id not in self.indexed:
+            self.indexed.add(guild.id)
+            for channel in guild.text_channels:
+                self.update(channel)
+
+    def remove_guild(self, guild_id: int) -> None:
+        "サーバーを索引から削除します。"
+        self.indexed.discard(guild_id)
+        for channel_ids in self.guilds.pop(guild_id, {}).values():
+            for channel_id in channel_ids:
+                self.channels.pop(channel_id, None)
+
+    def directives(self, channel: discord.abc.Messageable) -> Mapping[str, str]:
+        "チャンネルにある設定を取得します。"
+        if (guild := getattr(channel, "guild", None)) is None:
+            return EMPTY
+        self.index_guild(guild)
+        return self.channels.get(channel.id, EMPTY)
+
+    def get(
+        self, channel: discord.abc.Messageable, directive: str,
+        default: Optional[str] = None
+    ) -> Optional[str]:
+        "チャンネルにある設定の値を取得します。設定がない場合は`default`を返します。"
+        return self.directives(channel).get(directive, default)
+
+    def channels_of(self, guild: discord.Guild, directive: str) -> list[discord.TextChannel]:
+        "サーバーにある設定があるチャンネルを全て取得します。"
+        self.index_guild(guild)
+        return [
+            channel for channel_id in self.guilds[guild.id].get(directive, ())
+            if (channel := guild.get_channel(channel_id)) is not None
+        ]
+
+    def find(self, guild: discord.Guild, directive: str) -> Optional[discord.TextChannel]:
+        "サーバーにある設定があるチャンネルを一つ取得します。"
+        self.index_guild(guild)
+        for channel_id in self.guilds[guild.id].get(directive, ()):
+            if (channel := guild.get_channel(channel_id)) is not None:
+                return channel
+
+    def __str__(self) -> str:
+        return f"<TopicIndex guilds={len(self.indexed)} channels={len(self.channels)}>"
+
+
+topics = TopicIndex()
+"チャンネルトピックの設定の索引です。"
+
+
+class TopicIndexManager(commands.Cog):
+    "チャンネルトピックの索引を最新に保つためのコグです。"
+
+    def __init__(self, bot: RT):
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        if channel.guild.id in topics.indexed:
+            topics.update(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ):
+        if (after.guild.id in topics.indexed and (
+                getattr(before, "topic", None) != getattr(after, "topic", None)
+                or before.name != after.name)):
+            topics.update(after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        topics.remove(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        topics.remove_guild(guild.id)
+
+
+async def setup(bot):
+    await bot.add_cog(TopicIndexManager(bot))
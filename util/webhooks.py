@@ -1,19 +1,90 @@
 # Free RT Util - webhooks
 
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
+
+from collections import defaultdict
+
 import discord
 from discord.ext import commands
-from typing import Optional
+
+from .cacher import memoize
+
+if TYPE_CHECKING:
+    from .bot import RT
+
+
+class WebhookCache:
+    """チャンネルごとのウェブフックのキャッシュです。
+    `channel.webhooks()`を毎回実行しないようにするためのものです。
+    `on_webhooks_update`が来た時と、送信時にウェブフックが見つからなかった時に消されます。"""
+
+    def __init__(self):
+        self.data: defaultdict[int, dict[str, discord.Webhook]] = defaultdict(dict)
+        self.bot: Optional[RT] = None
+        self.hits = self.misses = 0
+
+    def get(self, channel_id: int, name: str) -> Optional[discord.Webhook]:
+        "キャッシュからウェブフックを取得します。"
+        if (webhook := self.data.get(channel_id, {}).get(name)) is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return webhook
+
+    def set(self, channel_id: int, webhook: discord.Webhook) -> discord.Webhook:
+        "ウェブフックをキャッシュに入れます。`bot.session`が使えるならそれを使うウェブフックにします。"
+        name = webhook.name
+        if (webhook.token is not None and self.bot is not None
+                and getattr(self.bot, "session", None) is not None):
+            webhook = discord.Webhook.partial(
+                webhook.id, webhook.token, session=self.bot.session
+            )
+        self.data[channel_id][name] = webhook
+        return webhook
+
+    def invalidate(self, channel_id: int, name: Optional[str] = None) -> None:
+        "キャッシュを削除します。`name`を指定しなかった場合はそのチャンネルのものを全て削除します。"
+        fetch_webhooks.invalidate(channel_id)
+        if name is None:
+            self.data.pop(channel_id, None)
+        elif channel_id in self.data:
+            self.data[channel_id].pop(name, None)
+            if not self.data[channel_id]:
+                del self.data[channel_id]
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / total if (total := self.hits + self.misses) else 0.0
+
+    def __str__(self) -> str:
+        return (f"<WebhookCache channels={len(self.data)} "
+                f"hits={self.hits} misses={self.misses}>")
+
+
+cache = WebhookCache()
+"ウェブフックのキャッシュです。"
+
+
+@memoize(30, max_size=1000, key=lambda channel: channel.id)
+async def fetch_webhooks(channel: discord.TextChannel) -> list[discord.Webhook]:
+    "チャンネルのウェブフックを取得します。同じチャンネルで同時に呼ばれた場合は一回だけ取得します。"
+    return await channel.webhooks()
 
 
 async def get_webhook(
     channel: discord.TextChannel, name: str = "RT-Tool"
 ) -> Optional[discord.Webhook]:
-    "ウェブフックを取得します。"
-    return discord.utils.get(await channel.webhooks(), name=name)
+    "ウェブフックを取得します。一度取得したものはキャッシュされます。"
+    if (webhook := cache.get(channel.id, name)) is None:
+        if (webhook := discord.utils.get(await fetch_webhooks(channel), name=name)) is not None:
+            webhook = cache.set(channel.id, webhook)
+    return webhook
 
 
 async def webhook_send(
-    channel, *args, webhook_name: str = "RT-Tool", **kwargs
+    channel, *args, webhook_name: str = "RT-Tool", _retry: bool = True, **kwargs
 ):
     """`channel.send`感覚でウェブフック送信をするための関数です。  
     `channel.webhook_send`のように使えます。  
@@ -29,14 +100,39 @@ async def webhook_send(
         discord.pyのWebhook.sendに入れるキーワード引数です。"""
     if isinstance(channel, commands.Context):
         channel = channel.channel
-    wb = (
-        wb if (
-            wb := discord.utils.get(await channel.webhooks(), name=webhook_name)
-        ) else await channel.create_webhook(name=webhook_name))
+    if (wb := await get_webhook(channel, webhook_name)) is None:
+        wb = cache.set(channel.id, await channel.create_webhook(name=webhook_name))
     try:
         return await wb.send(*args, **kwargs)
+    except discord.NotFound:
+        # ウェブフックが削除されていたのならキャッシュを消してやり直す。
+        cache.invalidate(channel.id, webhook_name)
+        if _retry:
+            return await webhook_send(
+                channel, *args, webhook_name=webhook_name, _retry=False, **kwargs
+            )
+        raise
     except discord.InvalidArgument as e:
         if webhook_name == "RT-Tool":
             return await webhook_send(channel, *args, webhook_name="R2-Tool", **kwargs)
         else:
             raise e
+
+
+class WebhookCacheManager(commands.Cog):
+    "ウェブフックのキャッシュを最新に保つためのコグです。"
+
+    def __init__(self, bot: RT):
+        self.bot = cache.bot = bot
+
+    @commands.Cog.listener()
+    async def on_webhooks_update(self, channel: discord.abc.GuildChannel):
+        cache.invalidate(channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        cache.invalidate(channel.id)
+
+
+async def setup(bot):
+    await bot.add_cog(WebhookCacheManager(bot))